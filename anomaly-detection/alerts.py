@@ -0,0 +1,256 @@
+"""
+Motor de alertas por sensor.
+
+A predição decide janela a janela (votação 2 de 3) e cada janela vira um
+broadcast. Para quem precisa ser notificado, o que interessa são as
+mudanças de estado. Cada sensor tem uma máquina de estados:
+
+  ok ──(k de n janelas ≥ enter_ratio)──▶ aberto (warning)
+  aberto ──(k de n ≥ escalate_ratio)──▶ aberto (critical)
+  aberto ──(abaixo de exit_ratio por clear_after_s
+            e aberto há min_open_s)──▶ ok
+
+  - enter_ratio > exit_ratio dá histerese: a distância oscilando perto do
+    threshold não abre e fecha o alerta a cada janela;
+  - depois de fechado, um novo alerta só abre após cooldown_s (limita
+    notificações de um sensor intermitente).
+
+Só as transições geram eventos ("opened", "escalated", "cleared"). Eles são
+gravados em JSONL (logs/alerts.jsonl) e distribuídos num canal próprio
+(WebSocket tipo "alert" e SSE em /alerts/stream).
+"""
+
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, fields, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ALERTS_PATH = Path(os.environ.get("ALERTS_PATH", "logs/alerts.jsonl"))
+MAX_EVENTS_IN_MEMORY = 500
+SEVERITIES = ("warning", "critical")
+
+
+@dataclass(frozen=True)
+class AlertConfig:
+    k: int = 2
+    n: int = 3
+    enter_ratio: float = 1.0     # distância / threshold que conta como janela alta
+    exit_ratio: float = 0.8      # abaixo disso a janela conta para fechar
+    escalate_ratio: float = 1.5  # janela alta "crítica"
+    min_open_s: float = 10.0
+    clear_after_s: float = 5.0
+    cooldown_s: float = 60.0
+
+
+class SensorAlert:
+    """Estado da máquina de alertas de um sensor"""
+
+    __slots__ = ("ratios", "alert_id", "severity", "opened_at", "below_since",
+                 "cooldown_until", "peak_distance", "suppressed")
+
+    def __init__(self, n: int):
+        self.ratios: Deque[float] = deque(maxlen=n)
+        self.alert_id: Optional[str] = None
+        self.severity: Optional[str] = None
+        self.opened_at = 0.0
+        self.below_since: Optional[float] = None
+        self.cooldown_until = 0.0
+        self.peak_distance = 0.0
+        self.suppressed = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.alert_id is not None
+
+
+class AlertEngine:
+    def __init__(self, defaults: AlertConfig = AlertConfig()):
+        self.defaults = defaults
+        self.overrides: Dict[str, AlertConfig] = {}
+        self.sensors: Dict[str, SensorAlert] = {}
+
+    # ------------------------------------------------------------
+    # Configuração por sensor
+    # ------------------------------------------------------------
+    def config(self, sensor_id: str) -> AlertConfig:
+        return self.overrides.get(sensor_id, self.defaults)
+
+    def configure(self, sensor_id: str, **changes: Any) -> AlertConfig:
+        """Altera só os campos informados (None = mantém)"""
+        changes = {k: v for k, v in changes.items() if v is not None}
+        unknown = set(changes) - {f.name for f in fields(AlertConfig)}
+        if unknown:
+            raise ValueError(f"Campos desconhecidos: {sorted(unknown)}")
+        config = replace(self.config(sensor_id), **changes)
+        if not 1 <= config.k <= config.n:
+            raise ValueError("É preciso 1 <= k <= n")
+        if not 0 < config.exit_ratio <= config.enter_ratio <= config.escalate_ratio:
+            raise ValueError("É preciso 0 < exit_ratio <= enter_ratio <= escalate_ratio")
+        self.overrides[sensor_id] = config
+        state = self.sensors.get(sensor_id)
+        if state is not None and state.ratios.maxlen != config.n:
+            state.ratios = deque(state.ratios, maxlen=config.n)
+        return config
+
+    def reset(self, sensor_id: str):
+        self.overrides.pop(sensor_id, None)
+        state = self.sensors.get(sensor_id)
+        if state is not None and state.ratios.maxlen != self.defaults.n:
+            state.ratios = deque(state.ratios, maxlen=self.defaults.n)
+
+    # ------------------------------------------------------------
+    # Máquina de estados
+    # ------------------------------------------------------------
+    def observe(self, sensor_id: str, distance: float, threshold: float,
+                now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Registra uma janela; retorna os eventos de transição (quase sempre vazio)"""
+        config = self.config(sensor_id)
+        now = time.time() if now is None else now
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            state = self.sensors[sensor_id] = SensorAlert(config.n)
+
+        ratio = distance / threshold if threshold > 0 else 0.0
+        state.ratios.append(ratio)
+        hot = sum(r >= config.enter_ratio for r in state.ratios) >= config.k
+        critical = sum(r >= config.escalate_ratio for r in state.ratios) >= config.k
+
+        if not state.is_open:
+            if not hot:
+                return []
+            if now < state.cooldown_until:
+                state.suppressed += 1
+                return []
+            state.alert_id = f"{sensor_id}-{int(now * 1000)}"
+            state.severity = "critical" if critical else "warning"
+            state.opened_at = now
+            state.below_since = None
+            state.peak_distance = distance
+            return [self._event("opened", sensor_id, state, distance, threshold, now)]
+
+        events = []
+        state.peak_distance = max(state.peak_distance, distance)
+        if critical and state.severity != "critical":
+            state.severity = "critical"
+            events.append(self._event("escalated", sensor_id, state, distance, threshold, now))
+
+        if ratio < config.exit_ratio:
+            if state.below_since is None:
+                state.below_since = now
+        else:
+            state.below_since = None
+
+        if (state.below_since is not None
+                and now - state.below_since >= config.clear_after_s
+                and now - state.opened_at >= config.min_open_s):
+            events.append(self._event("cleared", sensor_id, state, distance, threshold, now))
+            state.alert_id = None
+            state.severity = None
+            state.below_since = None
+            state.ratios.clear()
+            state.cooldown_until = now + config.cooldown_s
+        return events
+
+    @staticmethod
+    def _event(kind: str, sensor_id: str, state: SensorAlert, distance: float,
+               threshold: float, now: float) -> Dict[str, Any]:
+        event = {
+            "event": kind,
+            "alert_id": state.alert_id,
+            "sensor_id": sensor_id,
+            "severity": state.severity,
+            "distance": distance,
+            "threshold": threshold,
+            "peak_distance": state.peak_distance,
+            "timestamp": datetime.fromtimestamp(now).isoformat(),
+        }
+        if kind == "cleared":
+            event["duration_s"] = now - state.opened_at
+        return event
+
+    # ------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------
+    def sensor_stats(self, sensor_id: str) -> Dict[str, Any]:
+        state = self.sensors.get(sensor_id)
+        info: Dict[str, Any] = {
+            "sensor_id": sensor_id,
+            "config": asdict(self.config(sensor_id)),
+            "custom": sensor_id in self.overrides,
+        }
+        if state is not None:
+            now = time.time()
+            info.update({
+                "state": "open" if state.is_open else "ok",
+                "alert_id": state.alert_id,
+                "severity": state.severity,
+                "open_for_s": now - state.opened_at if state.is_open else None,
+                "cooldown_s": max(0.0, state.cooldown_until - now),
+                "suppressed": state.suppressed,
+            })
+        return info
+
+    def active(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "alert_id": state.alert_id,
+                "sensor_id": sensor_id,
+                "severity": state.severity,
+                "opened_at": datetime.fromtimestamp(state.opened_at).isoformat(),
+                "peak_distance": state.peak_distance,
+            }
+            for sensor_id, state in self.sensors.items() if state.is_open
+        ]
+
+    def active_counts(self) -> Dict[str, int]:
+        counts = {severity: 0 for severity in SEVERITIES}
+        for state in self.sensors.values():
+            if state.is_open:
+                counts[state.severity] += 1
+        return counts
+
+
+class AlertLog:
+    """
+    Eventos de alerta: gravados em JSONL por quem os gerou e mantidos em
+    memória (de todos os workers) para consulta via /alerts.
+    """
+
+    def __init__(self, path: Path = ALERTS_PATH, maxlen: int = MAX_EVENTS_IN_MEMORY):
+        self.path = path
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+
+    def load(self):
+        """Recupera os eventos mais recentes do arquivo (reinício do servidor)"""
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                tail = deque(f, maxlen=self.events.maxlen)
+            self.events.extend(json.loads(line) for line in tail if line.strip())
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao ler histórico de alertas: {e}")
+
+    def persist(self, event: Dict[str, Any]):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Uma linha por write em modo append: seguro entre workers
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+        except OSError as e:
+            logger.error(f"Erro ao gravar evento de alerta: {e}")
+
+    def remember(self, event: Dict[str, Any]):
+        self.events.append(event)
+
+    def recent(self, limit: int = 50, sensor_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Eventos mais recentes primeiro"""
+        events = [e for e in reversed(self.events) if sensor_id is None or e["sensor_id"] == sensor_id]
+        return events[:limit]
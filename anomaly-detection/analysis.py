@@ -5,6 +5,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
 
+from recording import load_windows
+
 # set plotting style
 plt.style.use("seaborn-v0_8-paper")
 sns.set_palette("Set2")
@@ -24,27 +26,23 @@ SAMPLE_RATE = 200  # Hz
 SAMPLE_TIME = 0.5  # seconds
 
 
-def get_data_files(operations):
-    """Get all data files for given operations"""
-    files = []
-    for op in operations:
-        path = DATASET_PATH / op
-        files.extend(list(path.glob("*.csv")))
-    return files
+def get_windows(operations):
+    """Get all windows (.vrec recordings and legacy CSVs) for given operations"""
+    return load_windows([DATASET_PATH / op for op in operations])
 
 
-def load_sample(file_path, remove_dc=False):
-    """Load a single accelerometer data file with optional DC removal"""
-    data = np.genfromtxt(file_path, delimiter=",")
+def load_sample(window, remove_dc=False):
+    """Prepare a single accelerometer window with optional DC removal"""
+    data = window
     if remove_dc:
         data = data - np.mean(data, axis=0)
     return data
 
 
-def plot_comparison(normal_file, anomaly_file, remove_dc=False):
+def plot_comparison(normal_window, anomaly_window, remove_dc=False):
     """Plot normal vs anomaly samples side by side"""
-    normal_data = load_sample(normal_file, remove_dc)
-    anomaly_data = load_sample(anomaly_file, remove_dc)
+    normal_data = load_sample(normal_window, remove_dc)
+    anomaly_data = load_sample(anomaly_window, remove_dc)
 
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
     fig.suptitle(
@@ -74,7 +72,7 @@ def plot_comparison(normal_file, anomaly_file, remove_dc=False):
     return fig
 
 
-def plot_3d_scatter(normal_files, anomaly_files, num_samples=3, feature_type="raw"):
+def plot_3d_scatter(normal_windows, anomaly_windows, num_samples=3, feature_type="raw"):
     """Create 3D scatter plot comparing normal and anomaly samples"""
     fig = plt.figure(figsize=(12, 8))
     ax = fig.add_subplot(111, projection="3d")
@@ -82,10 +80,10 @@ def plot_3d_scatter(normal_files, anomaly_files, num_samples=3, feature_type="ra
     normal_data = []
     anomaly_data = []
 
-    for i in range(min(num_samples, len(normal_files))):
-        normal_sample = load_sample(normal_files[i], remove_dc=(feature_type == "raw"))
+    for i in range(min(num_samples, len(normal_windows))):
+        normal_sample = load_sample(normal_windows[i], remove_dc=(feature_type == "raw"))
         anomaly_sample = load_sample(
-            anomaly_files[i], remove_dc=(feature_type == "raw")
+            anomaly_windows[i], remove_dc=(feature_type == "raw")
         )
 
         if feature_type == "mean":
@@ -144,9 +142,9 @@ def plot_3d_scatter(normal_files, anomaly_files, num_samples=3, feature_type="ra
     return fig
 
 
-def analyze_statistics(sample_file):
+def analyze_statistics(sample_window):
     """Analyze statistical properties of a sample"""
-    sample = load_sample(sample_file, remove_dc=True)
+    sample = load_sample(sample_window, remove_dc=True)
 
     stats_dict = {
         "Sample shape": sample.shape,
@@ -175,15 +173,15 @@ def extract_fft_features(sample):
     return out_sample
 
 
-def plot_fft_comparison(normal_files, anomaly_files, num_samples=200, start_bin=1):
+def plot_fft_comparison(normal_windows, anomaly_windows, num_samples=200, start_bin=1):
     """Plot average FFT comparison between normal and anomaly samples"""
     # Compute FFTs
     normal_ffts = []
     anomaly_ffts = []
 
-    for i in range(min(num_samples, len(normal_files))):
-        normal_sample = load_sample(normal_files[i])
-        anomaly_sample = load_sample(anomaly_files[i])
+    for i in range(min(num_samples, len(normal_windows))):
+        normal_sample = load_sample(normal_windows[i])
+        anomaly_sample = load_sample(anomaly_windows[i])
         normal_ffts.append(extract_fft_features(normal_sample))
         anomaly_ffts.append(extract_fft_features(anomaly_sample))
 
@@ -210,31 +208,31 @@ def plot_fft_comparison(normal_files, anomaly_files, num_samples=200, start_bin=
     return fig
 
 
-# Get file lists
-normal_files = get_data_files(NORMAL_OPS)
-anomaly_files = get_data_files(ANOMALY_OPS)
+# Get window lists
+normal_windows = get_windows(NORMAL_OPS)
+anomaly_windows = get_windows(ANOMALY_OPS)
 
-print(f"Found {len(normal_files)} normal operation files")
-print(f"Found {len(anomaly_files)} anomaly operation files")
+print(f"Found {len(normal_windows)} normal operation windows")
+print(f"Found {len(anomaly_windows)} anomaly operation windows")
 
 # Basic visualization with DC removal comparison
-plot_comparison(normal_files[0], anomaly_files[0], remove_dc=False)
-plot_comparison(normal_files[0], anomaly_files[0], remove_dc=True)
+plot_comparison(normal_windows[0], anomaly_windows[0], remove_dc=False)
+plot_comparison(normal_windows[0], anomaly_windows[0], remove_dc=True)
 
 
 # Feature visualization
-plot_3d_scatter(normal_files, anomaly_files, num_samples=10, feature_type="raw")
-plot_3d_scatter(normal_files, anomaly_files, num_samples=200, feature_type="mean")
-plot_3d_scatter(normal_files, anomaly_files, num_samples=200, feature_type="variance")
-plot_3d_scatter(normal_files, anomaly_files, num_samples=200, feature_type="kurtosis")
+plot_3d_scatter(normal_windows, anomaly_windows, num_samples=10, feature_type="raw")
+plot_3d_scatter(normal_windows, anomaly_windows, num_samples=200, feature_type="mean")
+plot_3d_scatter(normal_windows, anomaly_windows, num_samples=200, feature_type="variance")
+plot_3d_scatter(normal_windows, anomaly_windows, num_samples=200, feature_type="kurtosis")
 
 
 # Statistical analysis
-stat_results = analyze_statistics(normal_files[0])
+stat_results = analyze_statistics(normal_windows[0])
 for key, value in stat_results.items():
     print(f"{key}:")
     print(value)
     print()
 
 # FFT analysis
-plot_fft_comparison(normal_files, anomaly_files)
+plot_fft_comparison(normal_windows, anomaly_windows)
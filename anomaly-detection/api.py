@@ -1,76 +1,53 @@
-import math
+import time
+
+# Marca o início da importação para reportar o tempo de startup
+_IMPORT_STARTED = time.perf_counter()
+
 import numpy as np
-from scipy import stats as scipy_stats  # Renamed to avoid shadowing
 from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import List, Deque, Dict, Any, Union, Set
+from pydantic import BaseModel, Field
+from typing import Callable, List, Deque, Dict, Any, Iterable, Optional, Set, Tuple, Union
 from datetime import datetime
 from collections import deque
 from pathlib import Path
 import asyncio
 import json
 import logging
+import math
+import os
+from functools import lru_cache
+
+import metrics
+import model_artifact
+from alerts import AlertEngine, AlertLog
+from batching import batcher_from_env
+from broadcaster import CoalescingBroadcaster, broadcast_hz_from_env, status_message
+from calibration import CdfTable, ConfidenceRing
+from capture import TRIGGER_EVENTS, CaptureRecorder, CaptureStore, PendingCapture, capture_options_from_env
+from cascade import ScoringGate, gate_options_from_env
+from drift import DriftMonitor, drift_options_from_env
+from payloads import Payload, dumps, finite, finite_float, json_response, loads
+from profiler import ProfilerMiddleware, enabled_from_env as profiler_enabled_from_env, profiler
+from quality import SignalQuality, repair as repair_window
+from rate_policy import RatePolicy
+from retention import (HistoryWriter, RetentionManager, Throttle, flush_interval_from_env,
+                       record_raw_from_env, retention_options_from_env, safe_sensor_id)
+from shared_state import bus_from_env
+from sketches import SketchStore, save_interval_from_env, sketches_path_from_env, write_snapshot
+from subscriptions import SubscriptionError, SubscriptionRegistry
+from timeline import SensorTimeline
+
+
+# Configuração (lida sob demanda, só quem precisa de host/porta paga o custo)
+CONFIG_PATH = Path(__file__).parent / "config.json"
 
 
-# ============================================================
-# SANITIZAÇÃO DE VALORES PARA JSON
-# ============================================================
-def sanitize_float(value: Union[float, int, None], default: float = 0.0, max_value: float = 1e10) -> float:
-    """
-    Converte valores não-JSON-compliant para valores seguros.
-    - NaN → default (0.0)
-    - Infinity → max_value
-    - -Infinity → -max_value
-    """
-    if value is None:
-        return default
-    if isinstance(value, (int, float)):
-        if math.isnan(value):
-            return default
-        if math.isinf(value):
-            return max_value if value > 0 else -max_value
-        return float(value)
-    return default
-
-
-def sanitize_dict(data: Dict[str, Any], default: float = 0.0, max_value: float = 1e10) -> Dict[str, Any]:
-    """
-    Sanitiza recursivamente todos os valores float em um dicionário.
-    """
-    result = {}
-    for key, value in data.items():
-        if isinstance(value, dict):
-            result[key] = sanitize_dict(value, default, max_value)
-        elif isinstance(value, (list, tuple)):
-            result[key] = [
-                sanitize_float(v, default, max_value) if isinstance(v, (int, float)) else v
-                for v in value
-            ]
-        elif isinstance(value, (int, float)) and not isinstance(value, bool):
-            result[key] = sanitize_float(value, default, max_value)
-        else:
-            result[key] = value
-    return result
-
-
-def sanitize_sample(x: float, y: float, z: float, timestamp: int) -> Dict[str, Any]:
-    """
-    Sanitiza uma amostra individual de acelerômetro.
-    """
-    return {
-        "timestamp": timestamp,
-        "x": sanitize_float(x),
-        "y": sanitize_float(y),
-        "z": sanitize_float(z),
-    }
-
-# Carregar configuração
-CONFIG_PATH = Path(__file__).parent / "config.json"
-with open(CONFIG_PATH) as f:
-    CONFIG = json.load(f)
+@lru_cache(maxsize=1)
+def load_config() -> Dict[str, Any]:
+    with open(CONFIG_PATH) as f:
+        return json.load(f)
 
 # Configure logging
 logging.basicConfig(
@@ -80,28 +57,57 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class SensorHistory:
+    """Histórico de decisão de um sensor (votação e suavização da confiança)"""
+
+    __slots__ = ("last_predictions", "confidence", "residual")
+
+    def __init__(self):
+        self.last_predictions: Deque[bool] = deque([False, False, False], maxlen=3)
+        # Últimas probabilidades calibradas (anel fixo, ver calibration.py)
+        self.confidence = ConfidenceRing()
+        # (features, W·(x − μ)) da última janela pontuada: só referências, para explain()
+        self.residual: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+
 class AnomalyDetector:
     def __init__(self, model_path: str):
-        model = np.load(model_path, allow_pickle=True)
+        # Artefato compilado: sem pickle e com a matriz de branqueamento pronta
+        t0 = time.perf_counter()
+        model = model_artifact.load_or_compile(Path(model_path))
+        self.load_time_ms = (time.perf_counter() - t0) * 1000
         self.mu = model["mu"]
-        self.cov = model["cov"]
-        
-        # Garante que threshold é um float
-        threshold_val = model["threshold"]
-        if isinstance(threshold_val, np.ndarray):
-            self.threshold = float(threshold_val.item())
-        else:
-            self.threshold = float(threshold_val)
+        self.whitening = model["whitening"]
+        self.threshold = float(model["threshold"])
         
         # DESABILITA o scaler - estava causando valores negativos
         self.has_scaler = False
         
-        self.last_predictions = [False, False, False]
-        self.recent_distances = []
+        # Um histórico por sensor: a votação 2 de 3 não mistura sensores
+        self.histories: Dict[str, SensorHistory] = {}
+        
+        self.feature_names = [str(name) for name in model["feature_names"]]
+        # Confiança calibrada: quantis das distâncias normais (ou lei chi), cauda chi
+        self.cdf = CdfTable(model["cdf_table"], str(model["cdf_kind"]), self.mu.shape[0])
+        # Estágio rápido da cascata (envelope do artefato; ver cascade.py)
+        self.gate = ScoringGate.from_artifact(model, **gate_options_from_env())
+        # Deriva das features ao vivo contra o histograma do treino (ver drift.py)
+        self.drift = DriftMonitor.from_artifact(model, self.feature_names, **drift_options_from_env())
+        # std, rms e pico a pico de cada eixo: as features que as janelas dispensadas pela cascata têm
+        self.envelope_features = np.array([
+            i for i, name in enumerate(self.feature_names)
+            if name.endswith((".std", ".rms", ".peak_to_peak"))
+        ])
+        self.feature_schema = model_artifact.feature_schema_id(self.feature_names)
         
-        model_type = str(model.get("model_type", "standard"))
+        self.model_type = str(model["model_type"])
+        self.training_date = str(model["training_date"])
+        metrics.set_model_info(
+            self.model_type, self.training_date, int(self.mu.shape[0]), self.threshold
+        )
         logger.info(
-            "Model loaded - Type: %s, Threshold: %.3f", model_type, self.threshold
+            "Model loaded - Type: %s, Threshold: %.3f (%.1f ms)",
+            self.model_type, self.threshold, self.load_time_ms,
         )
 
     def preprocess(self, data, remove_dc=True):
@@ -109,112 +115,204 @@ class AnomalyDetector:
         Pré-processa dados para ser agnóstico à orientação.
         Remove a gravidade calculando a variação em relação à média.
         """
-        # Remove média de cada eixo (remove gravidade/offset)
-        data = data - np.mean(data, axis=0)
+        # Remove média de cada eixo (remove gravidade/offset); aceita (n, 3) ou (B, n, 3)
+        data = data - np.mean(data, axis=-2, keepdims=True)
         return data
     
 
 
     def extract_features(self, sample):
         """Extract statistical features from sample - 5 features per axis"""
-        features = []
-        for axis_idx in range(sample.shape[1]):
-            axis_data = sample[:, axis_idx]
-
-            # 5 features por eixo (std, kurtosis, peak, rms, peak_to_peak)
-            features.extend([
-                np.std(axis_data),                           # Standard deviation (sempre positivo)
-                scipy_stats.kurtosis(axis_data),             # Kurtosis
-                np.max(np.abs(axis_data)),                   # Peak amplitude
-                np.sqrt(np.mean(np.square(axis_data))),      # RMS (sempre positivo)
-                np.max(axis_data) - np.min(axis_data),       # Peak-to-peak (sempre positivo)
-            ])
-
-        return np.array(features)
+        # Momentos centrais calculados de uma vez para todos os eixos (e janelas, se (B, n, 3))
+        centered = sample - np.mean(sample, axis=-2, keepdims=True)
+        m2 = np.mean(np.square(centered), axis=-2)
+        m4 = np.mean(np.square(np.square(centered)), axis=-2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Curtose de Fisher (igual a scipy.stats.kurtosis); sinal constante → NaN
+            kurtosis = m4 / np.square(m2) - 3.0
+
+        # 5 features por eixo (std, kurtosis, peak, rms, peak_to_peak)
+        features = np.stack([
+            np.sqrt(m2),                                  # Standard deviation (sempre positivo)
+            kurtosis,                                     # Kurtosis
+            np.max(np.abs(sample), axis=-2),              # Peak amplitude
+            np.sqrt(np.mean(np.square(sample), axis=-2)), # RMS (sempre positivo)
+            np.ptp(sample, axis=-2),                      # Peak-to-peak (sempre positivo)
+        ], axis=-1)
+
+        # Ordem eixo a eixo: (3, 5) → 15 features por janela
+        return features.reshape(*sample.shape[:-2], -1)
+
+    def whiten(self, x):
+        """Resíduo branqueado z = W·(x − μ), com Wᵀ·W = Σ⁻¹"""
+        return (x - self.mu) @ self.whitening.T
 
     def mahalanobis_distance(self, x):
-        x_mu = x - self.mu
-        epsilon = 1e-6
-        cov_reg = self.cov + epsilon * np.eye(self.cov.shape[0])
+        # Com W pré-calculado: d = ||W·(x − μ)||
+        z = self.whiten(x)
+        return np.sqrt(np.sum(np.square(z), axis=-1))
 
-        try:
-            scale = np.median(np.diag(cov_reg))
-            cov_scaled = cov_reg / scale
-            inv_covmat = np.linalg.inv(cov_scaled) / scale
+    def explain(self, sensor_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Contribuição de cada feature para d² na última janela pontuada do
+        sensor, a partir do resíduo branqueado guardado em score():
+        cᵢ = (x − μ)ᵢ · (Wᵀ·z)ᵢ, com Σ cᵢ = zᵀz = d². Sem inversa nem nova
+        passada pela distância; correlações podem deixar cᵢ negativo.
+        """
+        history = self.histories.get(sensor_id)
+        if history is None or history.residual is None:
+            return None
+        features, z = history.residual
+        distance_sq = float(z @ z)
+        contributions = finite((features - self.mu) * (z @ self.whitening)).tolist()
+
+        by_feature = dict(zip(self.feature_names, contributions))
+        by_axis: Dict[str, float] = {}
+        for name, value in by_feature.items():
+            axis = name.split(".", 1)[0]
+            by_axis[axis] = by_axis.get(axis, 0.0) + value
+        top = sorted(by_feature, key=by_feature.get, reverse=True)[:3]
+        share = (lambda v: v / distance_sq) if distance_sq > 0 else (lambda v: 0.0)
+        return {
+            "distance_sq": finite_float(distance_sq),
+            "features": by_feature,
+            "axes": by_axis,
+            "top": [{"feature": name, "share": share(by_feature[name])} for name in top],
+        }
 
-            if x_mu.ndim == 1:
-                mahal = np.sqrt(np.dot(np.dot(x_mu, inv_covmat), x_mu))
-            else:
-                mahal = np.sqrt(np.sum(np.dot(x_mu, inv_covmat) * x_mu, axis=1))
-            return mahal
-        except np.linalg.LinAlgError:
-            return np.inf
-
-    def calculate_confidence(self, distance):
-        """Calculate confidence with much more conservative approach"""
-        # Keep track of recent distances
-        self.recent_distances.append(distance)
-        self.recent_distances = self.recent_distances[-10:]  # Smaller history
-        
-        # Much more conservative confidence calculation
-        # Only high confidence when distance is significantly above threshold
-        
-        if distance < self.threshold * 0.5:
-            # Very clearly normal - low confidence for anomaly
-            confidence = 0.05
-        elif distance < self.threshold * 0.8:
-            # Probably normal - very low confidence
-            confidence = 0.15
-        elif distance < self.threshold:
-            # Close to threshold but still normal - low confidence
-            confidence = 0.25
-        elif distance < self.threshold * 1.2:
-            # Just above threshold - moderate confidence
-            confidence = 0.45
-        elif distance < self.threshold * 1.5:
-            # Clearly above threshold - higher confidence
-            confidence = 0.65
-        elif distance < self.threshold * 2.0:
-            # Well above threshold - high confidence
-            confidence = 0.80
-        else:
-            # Very high distance - very high confidence
-            confidence = 0.90
-        
-        # Apply stability factor to reduce noise
-        if len(self.recent_distances) >= 3:
-            recent_mean = np.mean(self.recent_distances[-3:])
-            recent_std = np.std(self.recent_distances[-3:])
-            
-            # If readings are unstable, reduce confidence
-            if recent_std > recent_mean * 0.3:  # High variation
-                confidence *= 0.7
-            
-            # If current reading is very different from recent average, reduce confidence
-            if abs(distance - recent_mean) > recent_mean * 0.5:
-                confidence *= 0.8
-        
-        # Ensure confidence is within bounds
-        return float(np.clip(confidence, 0.0, 1.0))
+    def history(self, sensor_id: str) -> SensorHistory:
+        history = self.histories.get(sensor_id)
+        if history is None:
+            history = self.histories[sensor_id] = SensorHistory()
+        return history
 
-    def predict(self, data):
+    def calculate_confidence(self, distance, history: SensorHistory):
+        """
+        Confiança de anomalia calibrada pela CDF das distâncias normais (0 numa
+        janela típica, 1 no threshold), suavizada no anel do sensor.
+        Retorna (confiança, probabilidade da janela).
+        """
+        log_survival = self.cdf.log_survival(distance)
+        confidence = self.cdf.confidence(log_survival, self.threshold)
+        return history.confidence.push(confidence), -math.expm1(log_survival)
+
+    def predict(self, data, sensor_id: str = "default", explain: bool = False):
+        audit = False
+        if self.gate is not None and self.gate.enabled and data.ndim == 2:
+            # Estágio rápido da cascata: janela dentro do envelope dispensa o resto
+            t_gate = time.perf_counter()
+            skip, audit, envelope = self.gate.route(data)
+            metrics.STAGE_GATE.observe(time.perf_counter() - t_gate)
+            if skip:
+                return self._explained(self.score_gated(envelope, sensor_id), sensor_id, explain)
+        t0 = time.perf_counter()
         processed_data = self.preprocess(data)
         features = self.extract_features(processed_data)
-        distance = float(self.mahalanobis_distance(features))
+        metrics.STAGE_FEATURES.observe(time.perf_counter() - t0)
+        return self._explained(self._staged(self.score(features, sensor_id), audit), sensor_id, explain)
 
-        # Detecção de anomalia: distance > threshold
-        # CORRIGIDO: comparação direta, sem multiplicador
-        is_anomaly_candidate = distance > self.threshold
+    def predict_batch(self, windows, sensor_ids: List[str],
+                      explain: Optional[List[bool]] = None) -> List[Dict[str, Any]]:
+        """
+        Pontua B janelas de mesmo formato (B, n, 3) de uma vez (ver batching.py).
+        Estágio rápido, features e distâncias são vetorizados; votação e
+        confiança seguem janela a janela, na ordem recebida, como em predict().
+        explain[i] anexa a explicação da janela i, lida antes de a próxima
+        janela do mesmo sensor sobrescrever o resíduo.
+        """
+        explain = explain or [False] * len(sensor_ids)
+        n = len(sensor_ids)
+        skip = audit = np.zeros(n, dtype=bool)
+        envelope = None
+        if self.gate is not None and self.gate.enabled:
+            t_gate = time.perf_counter()
+            skip, audit, envelope = self.gate.route(windows)
+            elapsed = time.perf_counter() - t_gate
+            for _ in range(n):
+                metrics.STAGE_GATE.observe(elapsed / n)
+
+        # Só as janelas fora do envelope (ou auditadas) passam pelo caminho completo
+        full = np.flatnonzero(~skip)
+        features = whitened = distances = None
+        if full.size:
+            t0 = time.perf_counter()
+            features = self.extract_features(self.preprocess(windows[full]))
+            t1 = time.perf_counter()
+            whitened = self.whiten(features)
+            distances = np.sqrt(np.sum(np.square(whitened), axis=-1))
+            t2 = time.perf_counter()
+            # Métricas por janela: a parcela de cada uma no custo do batch
+            for _ in range(full.size):
+                metrics.STAGE_FEATURES.observe((t1 - t0) / full.size)
+            distance_s = (t2 - t1) / full.size
+
+        results = []
+        row = 0
+        for i, sensor_id in enumerate(sensor_ids):
+            if skip[i]:
+                results.append(self._explained(self.score_gated(envelope[i], sensor_id), sensor_id, explain[i]))
+                continue
+            result = self.score(features[row], sensor_id, whitened=whitened[row],
+                                distance=distances[row], distance_s=distance_s)
+            results.append(self._explained(self._staged(result, audit[i]), sensor_id, explain[i]))
+            row += 1
+        return results
+
+    def _explained(self, result: Dict[str, Any], sensor_id: str, explain: bool) -> Dict[str, Any]:
+        """Anexa a explicação pedida enquanto o resíduo ainda é o desta janela"""
+        if explain:
+            result["explanation"] = self.explain(sensor_id)
+        return result
 
-        # Update prediction history
-        self.last_predictions.pop(0)
-        self.last_predictions.append(is_anomaly_candidate)
+    def _staged(self, result: Dict[str, Any], audit: bool) -> Dict[str, Any]:
+        """Marca o estágio da cascata (só com ela ligada) e confere as auditorias"""
+        if self.gate is not None and self.gate.enabled:
+            result["stage"] = "audit" if audit else "full"
+            if audit:
+                self.gate.record_audit(result["distance"], self.threshold)
+        return result
 
-        # Require 2 out of 3 consecutive predictions for anomaly
-        stable_anomaly = sum(self.last_predictions) >= 2
+    def score_gated(self, envelope, sensor_id: str = "default"):
+        """
+        Janela dispensada pelo estágio rápido: distância marginal do envelope
+        (limite inferior da completa) e só std/rms/pico a pico nas features.
+        """
+        distance = finite_float(self.gate.estimate(envelope))
+        # Sem resíduo completo: nada a explicar nesta janela
+        self.history(sensor_id).residual = None
+        std, ptp = (finite(v) for v in self.gate.split(envelope))
+        if self.drift is not None:
+            # std = rms depois de remover a média: (std₀, rms₀, ptp₀, std₁, ...)
+            self.drift.observe(sensor_id, np.stack([std, std, ptp], axis=-1).ravel(), self.envelope_features)
+        feature_stats = {
+            f"axis_{axis_idx}": {"std": s, "rms": s, "peak_to_peak": p}
+            for axis_idx, (s, p) in enumerate(zip(std.tolist(), ptp.tolist()))
+        }
+        result = self.decide(distance, sensor_id, feature_stats)
+        result["stage"] = "gate"
+        return result
 
-        # Calculate confidence
-        confidence = self.calculate_confidence(distance)
+    def score(self, features, sensor_id: str = "default", whitened=None, distance=None,
+              distance_s: float = 0.0):
+        """
+        Classifica um vetor de features (calculado aqui ou no dispositivo).
+        whitened/distance já calculados (predict_batch) evitam refazer a projeção.
+        """
+        t1 = time.perf_counter()
+        # Distância calculada com as features brutas (NaN propaga) e validada uma vez
+        if whitened is None:
+            whitened = self.whiten(features)
+            distance = np.sqrt(whitened @ whitened)
+        distance = finite_float(distance)
+        features = finite(features)
+        metrics.STAGE_DISTANCE.observe(time.perf_counter() - t1 + distance_s)
+        self.history(sensor_id).residual = (features, whitened)
+        if self.drift is not None:
+            if self.gate is not None and self.gate.enabled:
+                # Cascata ligada: só as features que toda janela tem (ver drift.py)
+                self.drift.observe(sensor_id, features[self.envelope_features], self.envelope_features)
+            else:
+                self.drift.observe(sensor_id, features)
 
         # Calculate feature statistics for debugging
         feature_names = [
@@ -230,31 +328,38 @@ class AnomalyDetector:
         n_features_per_axis = len(feature_names)
         n_axes = len(features) // n_features_per_axis
 
+        # features já é finito: tolist() entrega floats Python prontos para JSON
+        feature_list = features.tolist()
         for axis_idx in range(n_axes):
             start_idx = axis_idx * n_features_per_axis
-            axis_features = features[start_idx : start_idx + n_features_per_axis]
-            feature_stats[f"axis_{axis_idx}"] = {
-                name: float(value) for name, value in zip(feature_names, axis_features)
-            }
+            axis_features = feature_list[start_idx : start_idx + n_features_per_axis]
+            feature_stats[f"axis_{axis_idx}"] = dict(zip(feature_names, axis_features))
 
-        # Sanitiza valores antes de criar o resultado
-        safe_confidence = sanitize_float(confidence)
-        safe_distance = sanitize_float(distance)
-        safe_threshold = sanitize_float(self.threshold)
-        
-        # Sanitiza feature_stats
-        safe_feature_stats = {}
-        for axis_name, stats in feature_stats.items():
-            safe_feature_stats[axis_name] = {
-                name: sanitize_float(val) for name, val in stats.items()
-            }
+        return self.decide(distance, sensor_id, feature_stats)
+
+    def decide(self, distance: float, sensor_id: str, feature_stats: Dict[str, Dict[str, float]]):
+        """Votação 2 de 3, confiança e resultado a partir da distância"""
+        # Detecção de anomalia: distance > threshold
+        # CORRIGIDO: comparação direta, sem multiplicador
+        is_anomaly_candidate = distance > self.threshold
+
+        # Update prediction history (deste sensor)
+        history = self.history(sensor_id)
+        history.last_predictions.append(is_anomaly_candidate)
+
+        # Require 2 out of 3 consecutive predictions for anomaly
+        stable_anomaly = sum(history.last_predictions) >= 2
+
+        # Calculate confidence
+        confidence, probability = self.calculate_confidence(distance, history)
 
         result = {
             "is_anomaly": bool(stable_anomaly),
-            "confidence": safe_confidence,
-            "distance": safe_distance,
-            "threshold": safe_threshold,
-            "feature_values": safe_feature_stats,
+            "confidence": confidence,
+            "probability": probability,
+            "distance": distance,
+            "threshold": self.threshold,
+            "feature_values": feature_stats,
             "timestamp": datetime.now().isoformat(),
         }
 
@@ -268,7 +373,7 @@ class AnomalyDetector:
             "Distance: %.3f (threshold: %.3f)", result["distance"], result["threshold"]
         )
         logger.info("Feature Values:")
-        for axis_name, stats in safe_feature_stats.items():
+        for axis_name, stats in feature_stats.items():
             logger.info("  %s:", axis_name)
             for feat, val in stats.items():
                 logger.info("    %s: %.3f", feat, val)
@@ -276,10 +381,69 @@ class AnomalyDetector:
 
         return result
 
+    def unscored(self) -> Dict[str, Any]:
+        """Resultado de uma janela recusada pela qualidade do sinal (fora da votação)"""
+        return {
+            "is_anomaly": False,
+            "confidence": 0.0,
+            "probability": 0.0,
+            "distance": 0.0,
+            "threshold": self.threshold,
+            "feature_values": {},
+            "timestamp": datetime.now().isoformat(),
+        }
+
 
 class AccelerometerData(BaseModel):
     data: List[List[float]]
     sensor_id: str = "default"
+    # Opcionais, informados pelo dispositivo (ver timeline.py)
+    sample_rate: Optional[float] = Field(None, gt=0)  # Hz
+    t0_ms: Optional[float] = None  # instante da 1ª amostra no relógio do dispositivo
+    seq: Optional[int] = Field(None, ge=0)  # índice da 1ª amostra no contador do dispositivo
+
+
+class WindowDigest(BaseModel):
+    """Resumo compacto da janela bruta (por eixo), enviado com as features"""
+    min: List[float]
+    max: List[float]
+    mean: List[float]
+
+
+class FeatureWindow(BaseModel):
+    """Janela com features calculadas no dispositivo (ver GET /model/schema)"""
+    features: List[float]
+    sensor_id: str = "default"
+    schema_id: Optional[str] = None
+    n_samples: int = Field(..., gt=1)
+    digest: Optional[WindowDigest] = None
+    sample_rate: Optional[float] = Field(None, gt=0)
+    t0_ms: Optional[float] = None
+    seq: Optional[int] = Field(None, ge=0)
+
+
+class RateConfigUpdate(BaseModel):
+    """Campos da política de taxa de um sensor (omitidos = mantém)"""
+    enabled: Optional[bool] = None
+    calm_ratio: Optional[float] = Field(None, gt=0)
+    burst_ratio: Optional[float] = Field(None, gt=0)
+    calm_after_s: Optional[float] = Field(None, ge=0)
+    idle_after_s: Optional[float] = Field(None, ge=0)
+    hold_s: Optional[float] = Field(None, ge=0)
+    reduced_interval_s: Optional[float] = Field(None, ge=0)
+    idle_interval_s: Optional[float] = Field(None, ge=0)
+
+
+class AlertConfigUpdate(BaseModel):
+    """Campos do motor de alertas de um sensor (omitidos = mantém)"""
+    k: Optional[int] = Field(None, ge=1)
+    n: Optional[int] = Field(None, ge=1)
+    enter_ratio: Optional[float] = Field(None, gt=0)
+    exit_ratio: Optional[float] = Field(None, gt=0)
+    escalate_ratio: Optional[float] = Field(None, gt=0)
+    min_open_s: Optional[float] = Field(None, ge=0)
+    clear_after_s: Optional[float] = Field(None, ge=0)
+    cooldown_s: Optional[float] = Field(None, ge=0)
 
 
 app = FastAPI()
@@ -292,8 +456,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.RequestTimingMiddleware)
+app.add_middleware(ProfilerMiddleware)
 
 detector = AnomalyDetector("models/mahalanobis_model.npz")
+# Janelas simultâneas de /predict pontuadas juntas (opt-in: BATCH_WINDOW_MS > 0 liga)
+batcher = batcher_from_env(detector)
 
 # Real-time state buffers
 MAX_SAMPLES: int = 1000
@@ -317,8 +485,35 @@ sensor_connection_status = {
 
 SENSOR_TIMEOUT_SECONDS = 10  # Considera desconectado após 10s sem dados
 
+# Linha do tempo (timestamps, lacunas, deriva) dos sensores deste processo
+sensor_timelines: Dict[str, SensorTimeline] = {}
+# Último resultado por sensor (devolvido quando a janela é um reenvio)
+last_results: Dict[str, Dict[str, Any]] = {}
+# Pedidos de envio bruto (modo features): sensor_id → prazo (time.monotonic)
+raw_requests: Dict[str, float] = {}
+# Taxa de envio dirigida pelo servidor (diretiva "rate" em cada resposta)
+rate_policy = RatePolicy()
+# Alertas: transições de estado por sensor (aberto, escalado, encerrado)
+alert_engine = AlertEngine()
+# Qualidade do sinal por sensor (ver quality.py)
+signal_quality = SignalQuality()
+# Quantis ao vivo das distâncias e features por sensor (ver sketches.py)
+quantile_sketches = SketchStore()
+SKETCHES_FILE = sketches_path_from_env()
+alert_log = AlertLog()
+# Captura da forma de onda em torno dos alertas (ver capture.py)
+capture_recorder = CaptureRecorder(**capture_options_from_env())
+capture_store = CaptureStore()
+# Histórico bruto (RECORD_RAW=1) e retenção em camadas (ver retention.py)
+history_writer = HistoryWriter() if record_raw_from_env() else None
+retention = RetentionManager(**retention_options_from_env())
+
 # Simple broadcaster using asyncio.Queue for SSE
+# Filas limitadas: assinante lento perde mensagens em vez de acumular memória
+SSE_QUEUE_MAXSIZE = 256
 subscribers: List[asyncio.Queue] = []
+# Assinantes SSE só dos eventos de alerta (/alerts/stream)
+alert_subscribers: List[asyncio.Queue] = []
 
 # WebSocket connections para frontend em tempo real
 websocket_clients: Set[WebSocket] = set()
@@ -332,35 +527,73 @@ class ConnectionManager:
     
     def __init__(self):
         self.active_connections: Set[WebSocket] = set()
+        # Sensores, tópicos e max_hz de cada cliente (ver subscriptions.py)
+        self.subscriptions = SubscriptionRegistry()
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.add(websocket)
+        self.subscriptions.add(websocket)
         logger.info(f"WebSocket conectado. Total: {len(self.active_connections)}")
     
     def disconnect(self, websocket: WebSocket):
+        if websocket not in self.active_connections:
+            return
         self.active_connections.discard(websocket)
+        self.subscriptions.remove(websocket)
         logger.info(f"WebSocket desconectado. Total: {len(self.active_connections)}")
     
-    async def broadcast(self, message: Dict[str, Any]):
-        """Envia mensagem para todos os clientes conectados"""
-        if not self.active_connections:
+    async def publish(self, topic: str, sensor_id: Optional[str], build: Callable[[], str],
+                      build_full: Optional[Callable[[], Optional[str]]] = None):
+        """
+        Envia só aos clientes que assinaram o tópico (e o sensor). A mensagem
+        só é montada se houver ao menos um destinatário; clientes com max_hz
+        recebem build_full() (status completo) no lugar do delta.
+        """
+        recipients, full = self.subscriptions.recipients(topic, sensor_id, time.monotonic())
+        if recipients:
+            await self.broadcast(Payload(None, build()), recipients)
+        if full:
+            text = build_full() if build_full is not None else build()
+            if text is not None:
+                await self.broadcast(Payload(None, text), full)
+    
+    async def flush_stale(self, state_message: Callable[[str], Optional[str]]):
+        """Estado completo para quem teve status pulado pelo max_hz"""
+        for websocket, sensor_id in self.subscriptions.stale_due(time.monotonic()):
+            text = state_message(sensor_id)
+            if text is not None:
+                await self.broadcast(Payload(None, text), [websocket])
+    
+    async def broadcast(self, message: Union[Payload, Dict[str, Any]],
+                        targets: Optional[Iterable[WebSocket]] = None):
+        """
+        Envia mensagem para todos os clientes conectados (ou só para `targets`).
+        Aceita um Payload pré-validado (serializado uma única vez) ou um
+        dicionário com valores já finitos.
+        """
+        connections = list(self.active_connections if targets is None else targets)
+        if not connections:
             return
         
-        # Sanitiza antes de enviar
-        safe_message = sanitize_dict(message)
-        json_message = json.dumps(safe_message)
+        if not isinstance(message, Payload):
+            message = Payload(message)
+        json_message = message.text
         
         disconnected = set()
-        for connection in self.active_connections:
+        for connection in connections:
             try:
                 await connection.send_text(json_message)
             except Exception:
                 disconnected.add(connection)
         
+        metrics.SENT_WEBSOCKET.inc(len(connections) - len(disconnected))
+        
         # Remove conexões mortas
+        if disconnected:
+            metrics.DROPPED_WEBSOCKET.inc(len(disconnected))
         for conn in disconnected:
-            self.active_connections.discard(conn)
+            self.disconnect(conn)
 
 
 ws_manager = ConnectionManager()
@@ -389,12 +622,13 @@ def update_sensor_connection_status():
             logger.warning(f"🔌 SENSOR DESCONECTADO! Última mensagem há {time_since_last_data:.1f}s")
             
             # Notifica via WebSocket
-            asyncio.create_task(ws_manager.broadcast({
+            message = {
                 "type": "sensor_disconnected",
                 "message": f"Sensor desconectado há {time_since_last_data:.1f}s",
                 "disconnect_time": now.isoformat(),
                 "total_disconnections": sensor_connection_status["total_disconnections"]
-            }))
+            }
+            asyncio.create_task(ws_manager.publish("connection", None, lambda: dumps(message)))
     else:
         # Sensor conectado
         if not sensor_connection_status["connected"]:
@@ -409,12 +643,13 @@ def update_sensor_connection_status():
             logger.info(f"🔌 SENSOR RECONECTADO! Downtime: {downtime:.1f}s")
             
             # Notifica via WebSocket
-            asyncio.create_task(ws_manager.broadcast({
+            message = {
                 "type": "sensor_reconnected",
                 "message": f"Sensor reconectado após {downtime:.1f}s offline",
                 "reconnect_time": now.isoformat(),
                 "downtime_seconds": downtime
-            }))
+            }
+            asyncio.create_task(ws_manager.publish("connection", None, lambda: dumps(message)))
 
 def get_sensor_status() -> Dict[str, Any]:
     """Retorna status detalhado da conexão do sensor"""
@@ -458,136 +693,815 @@ def make_status_payload(pred: Dict[str, Any]) -> Dict[str, Any]:
         # Verde quando está claramente normal
         status_color = "green"
     
-    # Sanitiza todos os valores float para evitar NaN/Infinity
+    # Valores vêm de detector.predict(), já validados como finitos
     return {
         "is_anomaly": bool(is_anomaly),
-        "confidence": sanitize_float(confidence),
-        "distance": sanitize_float(distance),
-        "threshold": sanitize_float(threshold),
+        "confidence": confidence,
+        "distance": distance,
+        "threshold": threshold,
         "timestamp": pred.get("timestamp"),
         "status_color": status_color,
+        "quality": pred.get("quality", "ok"),
     }
 
 
 @app.post("/predict")
-async def predict_anomaly(data: AccelerometerData):
+async def predict_anomaly(data: AccelerometerData, explain: bool = False):
+    handler_start = time.perf_counter()
+    metrics.observe_parse(handler_start)
     try:
-        # Registra recebimento de dados do sensor
-        global sensor_connection_status
-        now = datetime.now()
-        
-        # Primeira vez recebendo dados
-        if sensor_connection_status["last_data_time"] is None:
-            sensor_connection_status["connection_start_time"] = now
-            logger.info("🔌 SENSOR CONECTADO pela primeira vez!")
-        
-        sensor_connection_status["last_data_time"] = now
-        
-        # Atualiza status de conexão
-        update_sensor_connection_status()
-        
-        array_data = np.array(data.data)
-        
-        # DEBUG: Log dos dados brutos recebidos (menos verboso)
-        logger.info("📡 Dados recebidos: %s (%d amostras)", data.sensor_id, len(data.data))
-        if len(data.data) > 0:
-            logger.debug("Primeira amostra: [%.3f, %.3f, %.3f]", 
-                        data.data[0][0], data.data[0][1], data.data[0][2])
-        
-        # Sanitiza dados de entrada - substitui NaN/Inf por 0
-        array_data = np.nan_to_num(array_data, nan=0.0, posinf=1e10, neginf=-1e10)
-        
-        logger.info(
-            "Received data shape: %s from sensor %s", array_data.shape, data.sensor_id
+        payload = await process_window(data, explain)
+        metrics.PREDICT_LATENCY.observe(time.perf_counter() - handler_start)
+        return payload.response()
+    except Exception as e:
+        metrics.PREDICTION_ERRORS.inc()
+        logger.error("Error during prediction: %s", str(e))
+        return {"error": str(e), "timestamp": datetime.now().isoformat()}
+
+
+async def process_window(data: AccelerometerData, explain: bool = False) -> Payload:
+    """
+    Processa uma janela do sensor: valida a entrada uma vez, prediz,
+    atualiza o estado em tempo real e notifica os assinantes.
+    Retorna o resultado como Payload (serializado uma única vez).
+    explain=True inclui a contribuição de cada feature para a distância.
+    """
+    received_at = datetime.now()
+    metrics.ingest_windows.labels(data.sensor_id).inc()
+    metrics.ingest_samples.labels(data.sensor_id).inc(len(data.data))
+    
+    # Reenvio de uma janela já processada: confirma sem reprocessar
+    timeline = sensor_timeline(data.sensor_id)
+    if data.seq is not None and data.data:
+        if timeline.is_duplicate(len(data.data), data.seq, data.t0_ms):
+            metrics.duplicate_windows.labels(data.sensor_id).inc()
+            return duplicate_ack(data)
+    
+    t_sanitize = time.perf_counter()
+    raw_data = np.asarray(data.data, dtype=np.float64)
+    # Qualidade do sinal antes da sanitização (NaN/Inf ainda visíveis)
+    quality, quality_details, quality_changed = signal_quality.observe(data.sensor_id, raw_data)
+    metrics.quality_windows.labels(data.sensor_id, quality).inc()
+    if quality_changed:
+        logger.warning("📉 Qualidade do sinal de %s: %s %s", data.sensor_id, quality, quality_details)
+    # Validação única da entrada: valores inválidos tolerados viram a média do
+    # eixo (nunca o 1e10 de finite() na extração); finite() cobre o resto
+    array_data = finite(repair_window(raw_data))
+    
+    # DEBUG: Log dos dados brutos recebidos (menos verboso)
+    logger.info("📡 Dados recebidos: %s (%d amostras)", data.sensor_id, len(data.data))
+    if len(data.data) > 0:
+        logger.debug("Primeira amostra: [%.3f, %.3f, %.3f]", 
+                    data.data[0][0], data.data[0][1], data.data[0][2])
+    
+    logger.info(
+        "Received data shape: %s from sensor %s", array_data.shape, data.sensor_id
+    )
+
+    # Raw samples with timestamps (já finitos) para o buffer de tempo real
+    samples: List[Dict[str, Any]] = []
+    window_info: Dict[str, Any] = {"status": "empty"}
+    if array_data.ndim == 2 and array_data.shape[0] > 0:
+        # Timestamps vetorizados no tempo do dispositivo (ou da chegada, sem ele)
+        timestamps, window_info = timeline.place(
+            array_data.shape[0], received_at.timestamp() * 1000,
+            data.sample_rate, data.t0_ms, data.seq,
         )
+        metrics.timeline_windows.labels(data.sensor_id, window_info["status"]).inc()
+        # Janelas repetidas ou atrasadas não entram no buffer (manteria a ordem errada)
+        if window_info["status"] not in ("duplicate", "out_of_order"):
+            samples = [
+                {"x": x, "y": y, "z": z, "timestamp": ts}
+                for (x, y, z), ts in zip(array_data[:, :3].tolist(), timestamps.tolist())
+            ]
+            # Anel pré-disparo (e pós-disparo de uma captura em andamento)
+            for capture in capture_recorder.add(data.sensor_id, timestamps, array_data[:, :3]):
+                schedule_capture_write(capture)
+            if history_writer is not None:
+                history_writer.add(data.sensor_id, timestamps, array_data[:, :3])
+    sanitize_elapsed = time.perf_counter() - t_sanitize
+
+    if quality == "ok":
+        # Pelo batch mesmo com explain: a ordem entre janelas do sensor é preservada
+        result = await batcher.predict(array_data, data.sensor_id, explain)
+    else:
+        # Sinal inválido: não gasta inferência nem alimenta votação e alertas
+        result = detector.unscored()
+        result["quality_details"] = quality_details
+    result["quality"] = quality
+    result["window"] = window_info
+    return await publish_result(data.sensor_id, received_at, result, samples, sanitize_elapsed)
 
-        # Append raw samples to recent buffer with timestamps (sanitizados)
-        now_ms = int(datetime.now().timestamp() * 1000)
-        # Spread timestamps across the batch assuming uniform spacing when unknown
-        if array_data.ndim == 2 and array_data.shape[0] > 0:
-            n = array_data.shape[0]
-            for i in range(n):
-                x, y, z = map(float, array_data[i, :3])
-                # Assign slightly increasing timestamps to preserve order
-                ts = now_ms - (n - 1 - i)
-                # Usa sanitize_sample para garantir valores válidos
-                recent_samples.append(sanitize_sample(x, y, z, ts))
-
-        result = detector.predict(array_data)
-        
-        # Sanitiza o resultado do modelo ML antes de retornar
-        result = sanitize_dict(result)
 
-        # Update latest status and notify subscribers
-        global latest_status
-        latest_status = make_status_payload(result)
-        
+async def process_features(data: FeatureWindow, explain: bool = False) -> Payload:
+    """
+    Janela com features calculadas no dispositivo: valida contra o esquema
+    do modelo e classifica direto, sem amostras brutas.
+    Levanta FeatureSchemaError se o vetor não corresponde ao modelo.
+    """
+    received_at = datetime.now()
+    metrics.feature_windows.labels(data.sensor_id).inc()
+    
+    timeline = sensor_timeline(data.sensor_id)
+    if data.seq is not None:
+        if timeline.is_duplicate(data.n_samples, data.seq, data.t0_ms):
+            metrics.duplicate_windows.labels(data.sensor_id).inc()
+            return duplicate_ack(data)
+    
+    t_sanitize = time.perf_counter()
+    features = validate_features(data)
+    _, window_info = timeline.place(
+        data.n_samples, received_at.timestamp() * 1000, data.sample_rate, data.t0_ms, data.seq,
+    )
+    metrics.timeline_windows.labels(data.sensor_id, window_info["status"]).inc()
+    # Mesma triagem das janelas brutas, com o que o vetor permite ver (std por eixo)
+    std = features[model_artifact.FEATURE_NAMES.index("std")::len(model_artifact.FEATURE_NAMES)]
+    quality, quality_details, quality_changed = signal_quality.observe_features(data.sensor_id, std, data.n_samples)
+    metrics.quality_windows.labels(data.sensor_id, quality).inc()
+    if quality_changed:
+        logger.warning("📉 Qualidade do sinal de %s: %s %s", data.sensor_id, quality, quality_details)
+    sanitize_elapsed = time.perf_counter() - t_sanitize
+    
+    if quality == "ok":
+        result = detector.score(features, data.sensor_id)
+        if explain:
+            result["explanation"] = detector.explain(data.sensor_id)
+    else:
+        result = detector.unscored()
+        result["quality_details"] = quality_details
+    result["quality"] = quality
+    result["window"] = window_info
+    result["input"] = "features"
+    if data.digest is not None:
+        result["digest"] = data.digest.model_dump()
+    return await publish_result(data.sensor_id, received_at, result, [], sanitize_elapsed)
+
+
+class FeatureSchemaError(ValueError):
+    """Vetor de features incompatível com o modelo carregado"""
+
+
+# Limites físicos das features do dispositivo: amplitudes de um MPU6050 na
+# maior faixa (±16 g) e curtose de Fisher (≥ −2, ≤ n_samples)
+MAX_AMPLITUDE = 2 * 16 * 9.80665
+AMPLITUDE_FEATURES = ("std", "peak_amplitude", "rms", "peak_to_peak")
+
+
+def validate_features(data: FeatureWindow) -> np.ndarray:
+    """
+    Confere o vetor enviado pelo dispositivo:
+      - schema_id (se enviado) igual ao do modelo;
+      - tamanho igual ao número de features do modelo;
+      - todos os valores finitos (non_finite): NaN/Infinity não são
+        trocados por 0/1e10 como nas amostras brutas, o vetor é recusado;
+      - amplitudes em [0, MAX_AMPLITUDE] e curtose em [−2, n_samples]
+        (out_of_range);
+      - peak_to_peak de cada eixo igual a max - min do digest
+        (pega vetor em ordem errada ou calculado sobre outra janela).
+    """
+    if data.schema_id is not None and data.schema_id != detector.feature_schema:
+        raise FeatureSchemaError("schema_id")
+    if len(data.features) != len(detector.feature_names):
+        raise FeatureSchemaError("length")
+    features = np.asarray(data.features, dtype=np.float64)
+    if not np.isfinite(features).all():
+        raise FeatureSchemaError("non_finite")
+    per_axis = features.reshape(-1, len(model_artifact.FEATURE_NAMES))
+    amplitude_idx = [model_artifact.FEATURE_NAMES.index(name) for name in AMPLITUDE_FEATURES]
+    amplitudes = per_axis[:, amplitude_idx]
+    kurtosis = per_axis[:, model_artifact.FEATURE_NAMES.index("kurtosis")]
+    if ((amplitudes < 0).any() or (amplitudes > MAX_AMPLITUDE).any()
+            or (kurtosis < -2).any() or (kurtosis > data.n_samples).any()):
+        raise FeatureSchemaError("out_of_range")
+    
+    if data.digest is not None:
+        n_axes = len(detector.feature_names) // len(model_artifact.FEATURE_NAMES)
+        digest = np.array([data.digest.max, data.digest.min], dtype=np.float64)
+        if not np.isfinite(digest).all():
+            raise FeatureSchemaError("non_finite")
+        digest_ptp = digest[0] - digest[1]
+        if digest_ptp.shape != (n_axes,):
+            raise FeatureSchemaError("digest")
+        ptp_idx = model_artifact.FEATURE_NAMES.index("peak_to_peak")
+        feature_ptp = features[ptp_idx::len(model_artifact.FEATURE_NAMES)]
+        # Tolerância para float32 no dispositivo
+        if not np.allclose(feature_ptp, digest_ptp, rtol=1e-3, atol=1e-3):
+            raise FeatureSchemaError("digest")
+    return features
+
+
+def sketch_distance(result: Dict[str, Any]) -> Tuple[Optional[float], int]:
+    """
+    (distância, peso) para o sketch de quantis. Com a cascata, a distância de
+    uma janela dispensada é só o limite inferior e fica fora; cada auditada
+    representa as 1/audit_rate janelas de dentro do envelope (ver sketches.py).
+    """
+    stage = result.get("stage")
+    if stage == "gate":
+        return None, 1
+    if stage == "audit" and detector.gate is not None and detector.gate.audit_rate > 0:
+        return result["distance"], max(1, round(1.0 / detector.gate.audit_rate))
+    return result["distance"], 1
+
+
+async def publish_result(sensor_id: str, received_at: datetime, result: Dict[str, Any],
+                         samples: List[Dict[str, Any]], sanitize_elapsed: float) -> Payload:
+    """
+    Parte comum às janelas brutas e de features: serializa o resultado uma
+    vez, atualiza o estado em tempo real e notifica os assinantes.
+    """
+    send_raw = raw_request_remaining(sensor_id)
+    if send_raw:
+        result["send_raw_seconds"] = send_raw
+    scored = result.get("quality", "ok") == "ok"
+    if scored:
+        rate = rate_policy.observe(
+            sensor_id, result["distance"], result["threshold"], result["is_anomaly"]
+        )
+    else:
+        # Distância 0 de janela não pontuada não é calma: mantém taxa cheia
+        rate = rate_policy.unscored(sensor_id)
+    result["rate"] = rate
+    metrics.upload_interval.labels(sensor_id).set(rate["interval_ms"] / 1000)
+    if rate["changed"]:
+        metrics.rate_changes.labels(sensor_id, rate["mode"]).inc()
+        logger.info("📶 Taxa de envio de %s: %s (%s)", sensor_id, rate["mode"], rate["reason"])
+
+    # Só transições viram eventos de alerta; quem gerou grava no histórico
+    alert_events = []
+    if scored:
+        distance, weight = sketch_distance(result)
+        quantile_sketches.observe(sensor_id, distance, result["feature_values"], weight)
+        alert_events = alert_engine.observe(
+            sensor_id, result["distance"], result["threshold"], received_at.timestamp()
+        )
+    # Alerta aberto ou agravado: explica a janela que o disparou
+    if any(alert["event"] != "cleared" for alert in alert_events):
+        if "explanation" not in result:
+            result["explanation"] = detector.explain(sensor_id)
+        for alert in alert_events:
+            if alert["event"] != "cleared":
+                alert["explanation"] = result["explanation"]
+    # Alerta aberto ou escalado: congela as amostras em volta dele
+    for alert in alert_events:
+        if alert["event"] in TRIGGER_EVENTS:
+            alert["capture_id"] = capture_recorder.trigger(sensor_id, alert, {
+                "distance": result["distance"],
+                "probability": result.get("probability"),
+                "feature_values": result["feature_values"],
+                "explanation": result.get("explanation"),
+                "model": model_identity(),
+            })
+    for alert in alert_events:
+        alert_log.persist(alert)
+        metrics.alert_events.labels(alert["event"], alert["severity"]).inc()
+        logger.warning("🚨 Alerta %s: %s (%s, distância %.2f)",
+                       alert["event"], sensor_id, alert["severity"], alert["distance"])
+
+    last_results[sensor_id] = result
+
+    # Serializa uma única vez: o mesmo texto vai para SSE, WebSocket e HTTP
+    t_sanitize = time.perf_counter()
+    status = make_status_payload(result)
+    status_payload = Payload(status)
+    result_payload = Payload(result)
+    t_broadcast = time.perf_counter()
+    metrics.STAGE_SANITIZE.observe(sanitize_elapsed + t_broadcast - t_sanitize)
+    
+    metrics.PREDICTIONS.inc()
+    if result["distance"] > result["threshold"]:
+        metrics.anomaly_candidates.labels(sensor_id).inc()
+    if result["is_anomaly"]:
+        metrics.anomalies.labels(sensor_id).inc()
+    
+    # Atualiza o estado e notifica os assinantes (deste e dos demais workers)
+    await state_bus.publish({
+        "kind": "window",
+        "sensor_id": sensor_id,
+        "received_at": received_at.isoformat(),
+        "samples": samples,
+        "status": status,
+        "status_text": status_payload.text,
+        "result_text": result_payload.text,
+        "alerts": alert_events,
+    })
+    metrics.STAGE_BROADCAST.observe(time.perf_counter() - t_broadcast)
+
+    return result_payload
+
+
+def model_identity() -> Dict[str, Any]:
+    """O que identifica o modelo que pontuou uma janela (gravado nas capturas)"""
+    return {
+        "model_type": detector.model_type,
+        "training_date": detector.training_date,
+        "feature_schema": detector.feature_schema,
+        "threshold": detector.threshold,
+        "artifact_version": model_artifact.ARTIFACT_VERSION,
+    }
+
+
+def schedule_capture_write(capture: PendingCapture):
+    asyncio.create_task(write_capture(capture))
+
+
+async def write_capture(capture: PendingCapture):
+    # Compressão e disco numa thread: não segura o event loop
+    try:
+        entry = await asyncio.to_thread(capture_store.write, capture)
+        logger.info("🎞️ Captura %s gravada: %s (%d amostras, %s)",
+                    entry["capture_id"], capture.sensor_id, entry["samples"], entry["status"])
+    except OSError as e:
+        logger.error(f"Erro ao gravar captura {capture.capture_id}: {e}")
+
+
+def raw_request_remaining(sensor_id: str) -> Optional[float]:
+    """Segundos restantes de um pedido de envio bruto para o sensor"""
+    deadline = raw_requests.get(sensor_id)
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        del raw_requests[sensor_id]
+        return None
+    return round(remaining, 1)
+
+
+def duplicate_ack(data: Union[AccelerometerData, FeatureWindow]) -> Payload:
+    """
+    Resposta a uma janela repetida: repete o último resultado do sensor
+    (o ESP32 acende os LEDs a partir dele) marcado como duplicata.
+    """
+    return Payload({
+        **last_results.get(data.sensor_id, {}),
+        "duplicate": True,
+        "window": {"status": "duplicate", "seq": data.seq},
+    })
+
+
+def sensor_timeline(sensor_id: str) -> SensorTimeline:
+    timeline = sensor_timelines.get(sensor_id)
+    if timeline is None:
+        timeline = sensor_timelines[sensor_id] = SensorTimeline(sensor_id)
+    return timeline
+
+
+def mark_sensor_data(received_at: datetime):
+    """Registra recebimento de dados do sensor"""
+    # Primeira vez recebendo dados
+    if sensor_connection_status["last_data_time"] is None:
+        sensor_connection_status["connection_start_time"] = received_at
+        logger.info("🔌 SENSOR CONECTADO pela primeira vez!")
+    
+    last = sensor_connection_status["last_data_time"]
+    if last is None or received_at > last:
+        sensor_connection_status["last_data_time"] = received_at
+    
+    # Atualiza status de conexão
+    update_sensor_connection_status()
+
+
+async def apply_state_event(event: Dict[str, Any]):
+    """
+    Aplica um evento de estado ao espelho local e faz o fan-out para os
+    clientes conectados a ESTE processo. Chamado pelo barramento tanto para
+    janelas processadas aqui quanto para as recebidas de outros workers.
+    """
+    global latest_status
+    kind = event.get("kind")
+    
+    if kind == "snapshot":
+        # Estado acumulado pelo broker, recebido ao (re)conectar
+        if event.get("status"):
+            latest_status = event["status"]
+        recent_samples.clear()
+        recent_samples.extend(event.get("samples") or [])
+        if event.get("last_data_time"):
+            mark_sensor_data(datetime.fromisoformat(event["last_data_time"]))
+        return
+    if kind != "window":
+        return
+    
+    mark_sensor_data(datetime.fromisoformat(event["received_at"]))
+    recent_samples.extend(event["samples"])
+    latest_status = event["status"]
+    status_payload = Payload(latest_status, event["status_text"])
+    
+    sensor_id = event["sensor_id"]
+    samples = event["samples"]
+    if samples:
+        # Fluxo de amostras: não é coalescido (cada janela traz amostras novas)
+        await ws_manager.publish("samples", sensor_id, lambda: dumps({
+            "type": "samples", "sensor_id": sensor_id, "samples": samples,
+        }))
+    
+    # SSE e WebSocket: no máximo uma atualização por sensor por intervalo
+    await broadcaster.submit(sensor_id, status_payload, event.get("result_text"))
+    
+    # Canal de alertas: poucos eventos, só nas transições
+    for alert in event.get("alerts") or []:
+        alert_log.remember(alert)
+        alert_payload = Payload({"type": "alert", **alert})
+        for q in list(alert_subscribers):
+            try:
+                q.put_nowait(alert_payload)
+            except asyncio.QueueFull:
+                metrics.DROPPED_SSE.inc()
+        await ws_manager.publish("alerts", alert["sensor_id"], lambda: alert_payload.text)
+
+
+async def deliver_status(sensor_id: str, changed: Dict[str, Any], status: Payload,
+                         result_text: Optional[str]):
+    """Entrega de uma atualização coalescida (chamada pelo broadcaster)"""
+    if changed:
         # Broadcast to SSE subscribers
         for q in list(subscribers):
             try:
-                q.put_nowait(latest_status)
+                q.put_nowait(status)
+                metrics.SENT_SSE.inc()
             except Exception:
                 # Skip if subscriber is clogged
-                pass
+                metrics.DROPPED_SSE.inc()
         
-        # Broadcast to WebSocket clients (frontend em tempo real)
-        await ws_manager.broadcast({
-            "type": "prediction",
-            "status": latest_status,
-            "samples_count": len(recent_samples),
-            "result": result
-        })
+        # WebSocket: delta compacto para quem assinou status deste sensor
+        await ws_manager.publish(
+            "status", sensor_id,
+            lambda: status_message(sensor_id, changed, status.data.get("timestamp")),
+            lambda: broadcaster.state_message(sensor_id),
+        )
+    
+    # Resultado completo só para quem assinou features
+    if result_text is not None:
+        await ws_manager.publish("features", sensor_id, lambda: (
+            f'{{"type":"features","sensor_id":{dumps(sensor_id)},"result":{result_text}}}'
+        ))
 
-        return result
+
+broadcaster = CoalescingBroadcaster(deliver_status, broadcast_hz_from_env())
+broadcaster.on_tick = lambda: ws_manager.flush_stale(broadcaster.state_message)
+
+# Barramento de estado: local (um processo) ou via broker (vários workers)
+state_bus = bus_from_env(apply_state_event)
+
+
+@app.post("/predict/features")
+async def predict_features(data: FeatureWindow, explain: bool = False):
+    """
+    Ingestão com features calculadas no ESP32 (vetor + digest da janela).
+    A resposta traz send_raw_seconds quando o servidor quer amostras brutas.
+    """
+    handler_start = time.perf_counter()
+    metrics.observe_parse(handler_start)
+    try:
+        payload = await process_features(data, explain)
+        metrics.PREDICT_LATENCY.observe(time.perf_counter() - handler_start)
+        return payload.response()
+    except FeatureSchemaError as e:
+        metrics.feature_rejected.labels(str(e)).inc()
+        return json_response({
+            "error": f"Features incompatíveis com o modelo ({e})",
+            "expected_schema_id": detector.feature_schema,
+            "expected_features": detector.feature_names,
+        }, status_code=422)
     except Exception as e:
-        logger.error("Error during prediction: %s", str(e))
+        metrics.PREDICTION_ERRORS.inc()
+        logger.error("Error during feature prediction: %s", str(e))
         return {"error": str(e), "timestamp": datetime.now().isoformat()}
 
 
+@app.get("/model/schema")
+async def get_model_schema():
+    """Esquema que o dispositivo deve seguir para enviar features"""
+    return {
+        "schema_id": detector.feature_schema,
+        "feature_names": detector.feature_names,
+        "n_features": len(detector.feature_names),
+        "preprocess": "remove_mean",  # features sobre (amostra - média da janela), por eixo
+        "kurtosis": "fisher",
+        "digest": ["min", "max", "mean"],
+        "threshold": detector.threshold,
+    }
+
+
+@app.post("/sensor/{sensor_id}/raw")
+async def request_raw_upload(sensor_id: str, seconds: float = 30.0):
+    """Pede ao sensor (via resposta do /predict/features) amostras brutas por N segundos"""
+    if seconds <= 0:
+        raw_requests.pop(sensor_id, None)
+    else:
+        raw_requests[sensor_id] = time.monotonic() + seconds
+    return {"sensor_id": sensor_id, "send_raw_seconds": raw_request_remaining(sensor_id)}
+
+
+@app.get("/sensor/quality")
+async def get_sensor_qualities():
+    """Qualidade do sinal (ok, short, nan_heavy, flatline, saturated) de cada sensor"""
+    return {
+        "config": signal_quality.describe_config(),
+        "statuses": signal_quality.status_counts(),
+        "sensors": [signal_quality.sensor_stats(sensor_id) for sensor_id in signal_quality.sensors],
+    }
+
+
+@app.get("/sensor/{sensor_id}/quality")
+async def get_sensor_quality(sensor_id: str):
+    return signal_quality.sensor_stats(sensor_id)
+
+
+@app.get("/sensor/drift")
+async def get_sensor_drifts():
+    """Deriva das features (PSI/KS contra o treino) de cada sensor"""
+    if detector.drift is None:
+        return json_response({"error": "Artefato do modelo sem histograma de referência"}, status_code=409)
+    drift = detector.drift
+    return json_response({
+        "config": drift.describe(),
+        "statuses": drift.status_counts(),
+        "sensors": [drift.sensor_summary(sensor_id) for sensor_id in drift.sensors],
+    })
+
+
+@app.get("/sensor/{sensor_id}/drift")
+async def get_sensor_drift(sensor_id: str):
+    """PSI, KS e proporções ao vivo de cada feature do sensor"""
+    if detector.drift is None:
+        return json_response({"error": "Artefato do modelo sem histograma de referência"}, status_code=409)
+    return json_response(detector.drift.sensor_stats(sensor_id))
+
+
+@app.get("/sensor/{sensor_id}/explain")
+async def explain_sensor(sensor_id: str):
+    """Contribuição de cada feature e eixo para a distância da última janela do sensor"""
+    explanation = detector.explain(sensor_id)
+    if explanation is None:
+        return json_response(
+            {"error": "Nenhuma janela pontuada por completo para este sensor"}, status_code=404
+        )
+    return {"sensor_id": sensor_id, **explanation}
+
+
+@app.get("/sensor/quantiles")
+async def get_sensor_quantiles(window: str = "1h"):
+    """
+    p50/p95/p99 das distâncias de todos os sensores e de cada um, na janela
+    de tempo. No modo shard o dispatcher funde os sketches de todos os shards.
+    """
+    try:
+        return json_response(quantile_sketches.quantiles_report(window))
+    except ValueError as e:
+        return json_response({"error": str(e)}, status_code=400)
+
+
+@app.get("/sensor/{sensor_id}/quantiles")
+async def get_sensor_quantile(sensor_id: str, window: str = "1h"):
+    """Quantis das distâncias do sensor na janela de tempo e de cada feature desde o início"""
+    try:
+        summary = quantile_sketches.sensor_summary(sensor_id, window)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status_code=400)
+    if summary is None:
+        return json_response({"error": "Nenhuma janela pontuada para este sensor"}, status_code=404)
+    return json_response(summary)
+
+
+@app.get("/sensor/{sensor_id}/sketches")
+async def export_sensor_sketches(sensor_id: str):
+    """Sketches serializados do sensor (fundíveis com os de outros workers)"""
+    return json_response(quantile_sketches.to_dict(sensor_id))
+
+
+@app.get("/sketches")
+async def export_sketches():
+    """Sketches serializados de todos os sensores deste processo"""
+    return json_response(quantile_sketches.to_dict())
+
+
+def threshold_proposal(sensor_id: Optional[str], window: str, quantile: float, margin: float,
+                       min_count: int):
+    try:
+        proposal = quantile_sketches.propose_threshold(
+            sensor_id, detector.threshold, window, quantile, margin, min_count
+        )
+    except ValueError as e:
+        return json_response({"error": str(e)}, status_code=400)
+    return json_response(proposal)
+
+
+@app.get("/threshold/proposal")
+async def propose_fleet_threshold(window: str = "24h", quantile: float = 0.999, margin: float = 3.0,
+                                  min_count: int = 1000):
+    """Threshold sugerido pelas distâncias de todos os sensores (não altera o modelo)"""
+    return threshold_proposal(None, window, quantile, margin, min_count)
+
+
+@app.get("/sensor/{sensor_id}/threshold/proposal")
+async def propose_sensor_threshold(sensor_id: str, window: str = "24h", quantile: float = 0.999,
+                                   margin: float = 3.0, min_count: int = 1000):
+    """Threshold sugerido pelas distâncias do sensor (não altera o modelo)"""
+    return threshold_proposal(sensor_id, window, quantile, margin, min_count)
+
+
+@app.get("/sensor/{sensor_id}/captures")
+async def list_sensor_captures(sensor_id: str, limit: int = 50):
+    """Capturas de forma de onda do sensor, mais recentes primeiro"""
+    return {"captures": capture_store.list(limit, sensor_id)}
+
+
+@app.get("/sensor/{sensor_id}/storage")
+async def get_sensor_storage(sensor_id: str):
+    """Espaço em disco do sensor por camada (raw, rollup, captures)"""
+    usage = await asyncio.to_thread(retention.usage, sensor_id)
+    return json_response({"sensor_id": sensor_id, "tiers": usage["sensors"].get(safe_sensor_id(sensor_id), {})})
+
+
+@app.get("/sensor/rate")
+async def get_sensor_rates():
+    """Modo de envio atual (full, reduced, idle) de cada sensor"""
+    return {
+        "modes": rate_policy.mode_counts(),
+        "sensors": [rate_policy.sensor_stats(sensor_id) for sensor_id in rate_policy.sensors],
+    }
+
+
+@app.get("/sensor/{sensor_id}/rate")
+async def get_sensor_rate(sensor_id: str):
+    return rate_policy.sensor_stats(sensor_id)
+
+
+@app.put("/sensor/{sensor_id}/rate")
+async def configure_sensor_rate(sensor_id: str, update: RateConfigUpdate):
+    """Ajusta a política de taxa de um sensor (ex.: desligar em máquina crítica)"""
+    try:
+        rate_policy.configure(sensor_id, **update.model_dump())
+    except ValueError as e:
+        return json_response({"error": str(e)}, status_code=422)
+    return rate_policy.sensor_stats(sensor_id)
+
+
+@app.delete("/sensor/{sensor_id}/rate")
+async def reset_sensor_rate(sensor_id: str):
+    """Volta o sensor para a configuração padrão"""
+    rate_policy.reset(sensor_id)
+    return rate_policy.sensor_stats(sensor_id)
+
+
+@app.get("/sensor/{sensor_id}/alerts")
+async def get_sensor_alerts(sensor_id: str):
+    """Estado e configuração do alerta do sensor, com os últimos eventos"""
+    return json_response({
+        **alert_engine.sensor_stats(sensor_id),
+        "events": alert_log.recent(20, sensor_id),
+    })
+
+
+@app.put("/sensor/{sensor_id}/alerts")
+async def configure_sensor_alerts(sensor_id: str, update: AlertConfigUpdate):
+    """Ajusta k de n, histerese, durações mínimas e cooldown de um sensor"""
+    try:
+        alert_engine.configure(sensor_id, **update.model_dump())
+    except ValueError as e:
+        return json_response({"error": str(e)}, status_code=422)
+    return json_response(alert_engine.sensor_stats(sensor_id))
+
+
+@app.delete("/sensor/{sensor_id}/alerts")
+async def reset_sensor_alerts(sensor_id: str):
+    """Volta o sensor para a configuração padrão de alertas"""
+    alert_engine.reset(sensor_id)
+    return json_response(alert_engine.sensor_stats(sensor_id))
+
+
+@app.get("/alerts")
+async def get_alerts(limit: int = 50, sensor_id: Optional[str] = None):
+    """Eventos de alerta mais recentes (de todos os workers)"""
+    return json_response({"events": alert_log.recent(limit, sensor_id)})
+
+
+@app.get("/alerts/active")
+async def get_active_alerts():
+    """Alertas abertos nos sensores processados por este worker"""
+    return json_response({"active": alert_engine.active(), "counts": alert_engine.active_counts()})
+
+
+@app.get("/alerts/stream")
+async def alerts_stream():
+    """SSE só com eventos de alerta (para notificadores e dashboards)"""
+    async def event_generator():
+        q: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_MAXSIZE)
+        alert_subscribers.append(q)
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(q.get(), timeout=30.0)
+                    yield f"event: alert\ndata: {item.text}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if q in alert_subscribers:
+                alert_subscribers.remove(q)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/captures")
+async def list_captures(limit: int = 50, sensor_id: Optional[str] = None):
+    """Capturas de forma de onda em volta dos alertas (de todos os workers)"""
+    return json_response({
+        "captures": capture_store.list(limit, sensor_id),
+        "recorder": capture_recorder.stats(),
+    })
+
+
+@app.get("/captures/{capture_id}")
+async def get_capture(capture_id: str):
+    """Metadados de uma captura (evento, features, explicação, modelo)"""
+    loaded = capture_store.load(capture_id)
+    if loaded is None:
+        return json_response({"error": "Captura não encontrada"}, status_code=404)
+    return json_response(loaded[0])
+
+
+@app.get("/captures/{capture_id}/download")
+async def download_capture(capture_id: str, format: str = "npz"):
+    """Arquivo da captura: npz (t_ms, xyz, meta) ou csv (t_ms,x,y,z)"""
+    if format not in ("npz", "csv"):
+        return json_response({"error": "format deve ser npz ou csv"}, status_code=400)
+    path = capture_store.path(capture_id)
+    if path is None:
+        return json_response({"error": "Captura não encontrada"}, status_code=404)
+    if format == "npz":
+        return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+    _, t_ms, xyz = capture_store.load(capture_id)
+    lines = ["t_ms,x,y,z"]
+    lines.extend(f"{t:.3f},{x:.6g},{y:.6g},{z:.6g}" for t, (x, y, z) in zip(t_ms.tolist(), xyz.tolist()))
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{capture_id}.csv"'},
+    )
+
+
+@app.get("/storage")
+async def get_storage():
+    """Espaço em disco por sensor e camada, políticas de retenção e a última passada"""
+    usage = await asyncio.to_thread(retention.usage)
+    return json_response({
+        **usage,
+        "retention": retention.describe(),
+        "history": history_writer.stats() if history_writer is not None else None,
+    })
+
+
 @app.get("/realtime/state")
-async def get_state():
+async def get_state(sensor_id: Optional[str] = None):
     """
-    Retorna o estado atual do sistema com valores sanitizados.
-    Garante que nunca retorne NaN ou Infinity.
+    Retorna o estado atual do sistema (com sensor_id, o último estado
+    enviado daquele sensor).
+    latest_status só contém valores validados em process_window().
     """
-    # Sanitiza o status antes de retornar para garantir JSON válido
-    return sanitize_dict(latest_status)
+    if sensor_id is not None:
+        state = broadcaster.snapshot().get(sensor_id)
+        if state is None:
+            return json_response({"error": "Sensor sem estado"}, status_code=404)
+        return json_response({"sensor_id": sensor_id, **state})
+    return json_response(latest_status)
 
 
 @app.get("/realtime/samples")
 async def get_samples(limit: int = 300):
     """
-    Retorna as amostras mais recentes com valores sanitizados.
-    Garante que nunca retorne NaN ou Infinity.
+    Retorna as amostras mais recentes.
+    As amostras já entram no buffer validadas (finite() na ingestão).
     """
     # Return up to 'limit' most recent samples
     data = list(recent_samples)[-limit:]
-    # Sanitiza cada amostra para garantir JSON válido
-    sanitized_data = [sanitize_dict(sample) for sample in data]
-    return {"samples": sanitized_data}
+    return json_response({"samples": data})
 
 
 @app.get("/realtime/stream")
 async def sse_stream():
     """
-    Stream SSE com valores sanitizados.
+    Stream SSE com payloads pré-serializados.
     Fallback para quando WebSocket não está disponível.
     """
     async def event_generator():
-        q: asyncio.Queue = asyncio.Queue()
+        q: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_MAXSIZE)
         subscribers.append(q)
         
         try:
             # Envia estado inicial
-            initial = sanitize_dict(latest_status)
-            yield f"data: {json.dumps(initial)}\n\n"
+            yield f"data: {dumps(latest_status)}\n\n"
             
             # Loop de eventos
             while True:
                 try:
                     item = await asyncio.wait_for(q.get(), timeout=30.0)
-                    sanitized_item = sanitize_dict(item)
-                    yield f"data: {json.dumps(sanitized_item)}\n\n"
+                    yield f"data: {item.text}\n\n"
                 except asyncio.TimeoutError:
                     # Envia heartbeat para manter conexão viva
                     yield f": heartbeat\n\n"
@@ -622,13 +1536,13 @@ async def websocket_endpoint(websocket: WebSocket):
     
     try:
         # Envia estado inicial
-        initial_state = sanitize_dict({
+        await websocket.send_text(dumps({
             "type": "connected",
             "status": latest_status,
             "samples_count": len(recent_samples),
+            "sensors": broadcaster.snapshot(),
             "message": "Conectado ao servidor de anomalias"
-        })
-        await websocket.send_text(json.dumps(initial_state))
+        }))
         
         # Mantém conexão aberta e processa mensagens do cliente
         while True:
@@ -641,29 +1555,52 @@ async def websocket_endpoint(websocket: WebSocket):
                 
                 # Processa comandos do cliente
                 try:
-                    message = json.loads(data)
+                    message = loads(data)
                     if message.get("type") == "ping":
-                        await websocket.send_text(json.dumps({"type": "pong"}))
+                        await websocket.send_text(dumps({"type": "pong"}))
                     elif message.get("type") == "get_state":
-                        await websocket.send_text(json.dumps(sanitize_dict({
+                        await websocket.send_text(dumps({
                             "type": "state",
                             "status": latest_status,
                             "samples_count": len(recent_samples)
-                        })))
+                        }))
+                    elif message.get("type") in ("subscribe", "unsubscribe"):
+                        # Sensores, tópicos e max_hz deste cliente (ver subscriptions.py)
+                        registry = ws_manager.subscriptions
+                        try:
+                            if message["type"] == "subscribe":
+                                subscription = registry.subscribe(websocket, message)
+                            else:
+                                subscription = registry.unsubscribe(websocket, message)
+                        except SubscriptionError as e:
+                            await websocket.send_text(dumps({"type": "error", "message": str(e)}))
+                        else:
+                            await websocket.send_text(dumps({
+                                "type": "subscribed",
+                                **subscription.describe(),
+                                # Base para os deltas dos sensores assinados
+                                "sensors_state": {
+                                    sensor_id: state for sensor_id, state in broadcaster.snapshot().items()
+                                    if subscription.wants(sensor_id)
+                                },
+                            }))
+                    elif message.get("type") == "features":
+                        # Atalho antigo: {"type": "features", "enabled": true}
+                        ws_manager.subscriptions.set_topic(websocket, "features", message.get("enabled", True))
                     elif message.get("type") == "get_samples":
                         limit = message.get("limit", 100)
                         samples = list(recent_samples)[-limit:]
-                        await websocket.send_text(json.dumps(sanitize_dict({
+                        await websocket.send_text(dumps({
                             "type": "samples",
                             "samples": samples
-                        })))
-                except json.JSONDecodeError:
+                        }))
+                except (ValueError, AttributeError):
                     pass
                     
             except asyncio.TimeoutError:
                 # Envia ping para manter conexão viva
                 try:
-                    await websocket.send_text(json.dumps({"type": "ping"}))
+                    await websocket.send_text(dumps({"type": "ping"}))
                 except Exception:
                     break
                     
@@ -686,14 +1623,25 @@ async def get_status():
     """Status detalhado do sistema"""
     sensor_status = get_sensor_status()
     
-    return sanitize_dict({
+    return json_response({
         "api_running": True,
         "sensor_connected": sensor_status["connected"],
         "sensor_status": sensor_status,
         "samples_count": len(recent_samples),
         "websocket_clients": len(ws_manager.active_connections),
+        "state_bus": state_bus.status(),
+        "broadcast": broadcaster.stats(),
+        "batching": batcher.stats(),
+        "cascade": cascade_status(),
+        "websocket_topics": ws_manager.subscriptions.topic_counts(),
+        "shard": os.environ.get("SHARD_INDEX"),
         "latest_status": latest_status,
         "threshold": float(detector.threshold),
+        "confidence_calibration": detector.cdf.describe(),
+        "quantile_sketches": quantile_sketches.stats(),
+        "drift": detector.drift.status_counts() if detector.drift is not None else None,
+        "captures": {**capture_recorder.stats(), "written": capture_store.written},
+        "history": history_writer.stats() if history_writer is not None else None,
         "timestamp": datetime.now().isoformat()
     })
 
@@ -703,6 +1651,214 @@ async def get_sensor_status_endpoint():
     return get_sensor_status()
 
 
+@app.get("/sensor/timeline")
+async def get_sensor_timeline():
+    """
+    Lacunas, duplicatas, janelas fora de ordem, deriva de relógio e
+    amostras ainda faltando (bitmap de seq) por sensor
+    """
+    return json_response({
+        sensor_id: timeline.stats() for sensor_id, timeline in sensor_timelines.items()
+    })
+
+
+# ============================================================
+# MÉTRICAS (PROMETHEUS)
+# ============================================================
+def _collect_subscriber_queues():
+    for idx, q in enumerate(list(subscribers)):
+        yield {"subscriber": f"sse_{idx}"}, q.qsize()
+
+
+metrics.collector(
+    "anomaly_sse_queue_depth",
+    "Mensagens pendentes na fila de cada assinante SSE",
+    "gauge",
+    _collect_subscriber_queues,
+)
+metrics.collector(
+    "anomaly_websocket_clients",
+    "Clientes WebSocket conectados",
+    "gauge",
+    lambda: [({}, len(ws_manager.active_connections))],
+)
+metrics.collector(
+    "anomaly_websocket_topic_clients",
+    "Clientes WebSocket assinantes de cada tópico",
+    "gauge",
+    lambda: [({"topic": topic}, count) for topic, count in ws_manager.subscriptions.topic_counts().items()],
+)
+metrics.collector(
+    "anomaly_sse_subscribers",
+    "Assinantes SSE conectados",
+    "gauge",
+    lambda: [({}, len(subscribers))],
+)
+metrics.collector(
+    "anomaly_recent_samples",
+    "Amostras no buffer de tempo real",
+    "gauge",
+    lambda: [({}, len(recent_samples))],
+)
+def _collect_clock_offsets():
+    for sensor_id, timeline in list(sensor_timelines.items()):
+        offset_ms = timeline.clock_offset_ms()
+        if offset_ms is not None:
+            yield {"sensor_id": sensor_id}, offset_ms / 1000.0
+
+
+metrics.collector(
+    "anomaly_sensor_clock_offset_seconds",
+    "Offset estimado relógio do servidor - relógio do dispositivo",
+    "gauge",
+    _collect_clock_offsets,
+)
+metrics.collector(
+    "anomaly_rate_sensors",
+    "Sensores por modo de envio (full, reduced, idle)",
+    "gauge",
+    lambda: [({"mode": mode}, count) for mode, count in rate_policy.mode_counts().items()],
+)
+metrics.collector(
+    "anomaly_quality_sensors",
+    "Sensores por estado de qualidade do sinal (ok, short, nan_heavy, flatline, saturated)",
+    "gauge",
+    lambda: [({"status": status}, count) for status, count in signal_quality.status_counts().items()],
+)
+metrics.collector(
+    "anomaly_sketch_bins",
+    "Baldes ocupados nos sketches de quantis (distâncias e features)",
+    "gauge",
+    lambda: [({}, quantile_sketches.bins())],
+)
+def _collect_drift(score: int):
+    if detector.drift is None:
+        return
+    for sensor_id, psi, ks in detector.drift.worst_scores():
+        yield {"sensor_id": sensor_id}, (psi, ks)[score]
+
+
+metrics.collector(
+    "anomaly_drift_psi",
+    "Maior PSI entre as features do sensor (histograma ao vivo contra o do treino)",
+    "gauge",
+    lambda: _collect_drift(0),
+)
+metrics.collector(
+    "anomaly_drift_ks",
+    "Maior distância KS entre as features do sensor",
+    "gauge",
+    lambda: _collect_drift(1),
+)
+metrics.collector(
+    "anomaly_drift_sensors",
+    "Sensores por estado de deriva (insufficient, stable, moderate, significant)",
+    "gauge",
+    lambda: [({"status": status}, count) for status, count in
+             (detector.drift.status_counts().items() if detector.drift is not None else [])],
+)
+metrics.collector(
+    "anomaly_cascade_skip_ratio",
+    "Fração das janelas dispensadas pelo estágio rápido da cascata",
+    "gauge",
+    lambda: [({}, detector.gate.skip_ratio() if detector.gate is not None else 0.0)],
+)
+metrics.collector(
+    "anomaly_storage_bytes",
+    "Espaço em disco por camada de retenção (medido na última passada ou consulta)",
+    "gauge",
+    lambda: [({"tier": tier}, t["bytes"]) for tier, t in
+             (retention.usage_snapshot["tiers"].items() if retention.usage_snapshot else ())],
+)
+metrics.collector(
+    "anomaly_captures_pending",
+    "Capturas de forma de onda aguardando o fim do pós-disparo",
+    "gauge",
+    lambda: [({}, len(capture_recorder.pending))],
+)
+metrics.collector(
+    "anomaly_alerts_active",
+    "Alertas abertos por severidade",
+    "gauge",
+    lambda: [({"severity": severity}, count) for severity, count in alert_engine.active_counts().items()],
+)
+metrics.collector(
+    "anomaly_broadcast_suppressed_total",
+    "Atualizações não enviadas: fundidas no intervalo ou sem mudança visível",
+    "counter",
+    lambda: [({"reason": "coalesced"}, broadcaster.coalesced), ({"reason": "unchanged"}, broadcaster.unchanged)],
+)
+metrics.collector(
+    "anomaly_sensor_connected",
+    "1 se o sensor enviou dados dentro do timeout",
+    "gauge",
+    lambda: [({}, int(sensor_connection_status["connected"]))],
+)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas no formato texto do Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# ============================================================
+# PROFILER (ADMIN)
+# ============================================================
+class ProfilerConfig(BaseModel):
+    enabled: Optional[bool] = None
+    request_threshold_ms: Optional[float] = None
+    stall_threshold_ms: Optional[float] = None
+    sample_interval_ms: Optional[float] = None
+
+
+@app.get("/admin/profiler")
+async def get_profiler_status():
+    """Estado e configuração do profiler de chamadas lentas"""
+    return profiler.status()
+
+
+@app.post("/admin/profiler")
+async def configure_profiler(config: ProfilerConfig):
+    """Liga/desliga o profiler e ajusta thresholds em tempo de execução"""
+    profiler.configure(**config.model_dump())
+    return profiler.status()
+
+
+class CascadeConfig(BaseModel):
+    enabled: Optional[bool] = None
+    audit_rate: Optional[float] = Field(None, ge=0, le=1)
+
+
+def cascade_status() -> Dict[str, Any]:
+    if detector.gate is None:
+        return {"available": False, "enabled": False}
+    return {"available": True, **detector.gate.status()}
+
+
+@app.get("/admin/cascade")
+async def get_cascade_status():
+    """Estado da cascata de pontuação (envelope, janelas dispensadas, auditorias)"""
+    return cascade_status()
+
+
+@app.post("/admin/cascade")
+async def configure_cascade(config: CascadeConfig):
+    """Liga/desliga a cascata e ajusta a fração auditada em tempo de execução"""
+    if detector.gate is None:
+        return json_response(
+            {"error": "Artefato do modelo sem envelope; recompile com model_artifact.py"}, status_code=409
+        )
+    detector.gate.configure(**config.model_dump())
+    return cascade_status()
+
+
+@app.get("/admin/profiler/reports")
+async def get_profiler_reports(limit: int = 20):
+    """Relatórios mais recentes de requisições lentas e travamentos do event loop"""
+    return {"reports": profiler.reports(limit)}
+
+
 @app.post("/test/simulate")
 async def simulate_esp32_data():
     """
@@ -711,29 +1867,23 @@ async def simulate_esp32_data():
     
     Uso: POST http://localhost:8000/test/simulate
     """
-    import random
-    
     # Gera 200 amostras simuladas (1 segundo a 200Hz)
+    # Simula vibração normal com pequeno ruído (z = gravidade + ruído)
     num_samples = 200
-    simulated_data = []
-    
-    for _ in range(num_samples):
-        # Simula vibração normal com pequeno ruído
-        x = random.gauss(0.1, 0.5)
-        y = random.gauss(0.2, 0.5)
-        z = random.gauss(9.8, 0.3)  # Gravidade + ruído
-        simulated_data.append([x, y, z])
+    simulated_data = np.random.normal(
+        loc=[0.1, 0.2, 9.8], scale=[0.5, 0.5, 0.3], size=(num_samples, 3)
+    )
     
     # Cria objeto de dados como se fosse do ESP32
-    data = AccelerometerData(data=simulated_data, sensor_id="test_simulator")
+    data = AccelerometerData(data=simulated_data.tolist(), sensor_id="test_simulator")
     
     # Processa como se fosse dados reais
-    result = await predict_anomaly(data)
+    result = await process_window(data)
     
     return {
         "message": "Dados simulados enviados com sucesso!",
         "samples_generated": num_samples,
-        "prediction": result
+        "prediction": result.data
     }
 
 
@@ -744,67 +1894,183 @@ async def simulate_anomaly():
     
     Uso: POST http://localhost:8000/test/anomaly
     """
-    import random
-    
-    # Gera dados anômalos (vibração muito alta)
+    # Gera dados anômalos (vibração muito alta, muito diferente da gravidade)
     num_samples = 200
-    simulated_data = []
-    
-    for _ in range(num_samples):
-        # Simula vibração anômala (valores muito altos)
-        x = random.gauss(5.0, 2.0)  # Muito mais alto que normal
-        y = random.gauss(5.0, 2.0)
-        z = random.gauss(15.0, 3.0)  # Muito diferente da gravidade
-        simulated_data.append([x, y, z])
+    simulated_data = np.random.normal(
+        loc=[5.0, 5.0, 15.0], scale=[2.0, 2.0, 3.0], size=(num_samples, 3)
+    )
     
-    data = AccelerometerData(data=simulated_data, sensor_id="test_anomaly")
-    result = await predict_anomaly(data)
+    data = AccelerometerData(data=simulated_data.tolist(), sensor_id="test_anomaly")
+    result = await process_window(data)
     
     return {
         "message": "Dados ANÔMALOS simulados!",
         "samples_generated": num_samples,
-        "prediction": result
+        "prediction": result.data
     }
 
 
-# Serve static frontend UI (deve ser o último mount)
-# Verifica se o diretório web existe antes de montar
-web_dir = Path(__file__).parent / "web"
-if web_dir.exists():
-    app.mount("/", StaticFiles(directory=str(web_dir), html=True), name="web")
-
-
 @app.get("/config")
 async def get_config():
     """Retorna a configuração do servidor para o frontend"""
+    config = load_config()
     return {
-        "host": CONFIG["server"]["host"],
-        "port": CONFIG["server"]["port"],
-        "url": f"http://{CONFIG['server']['host']}:{CONFIG['server']['port']}"
+        "host": config["server"]["host"],
+        "port": config["server"]["port"],
+        "url": f"http://{config['server']['host']}:{config['server']['port']}"
     }
 
 
 # Task em background para monitorar conexão do sensor
 @app.on_event("startup")
 async def startup_event():
-    """Inicia monitoramento de conexão do sensor"""
+    """Inicia monitoramento de conexão do sensor e do event loop"""
+    logger.info(
+        "🚀 Startup: importação %.1f ms (modelo %.1f ms), pronto em %.1f ms",
+        _IMPORT_FINISHED_MS, detector.load_time_ms,
+        (time.perf_counter() - _IMPORT_STARTED) * 1000,
+    )
+    alert_log.load()
+    try:
+        if quantile_sketches.load(SKETCHES_FILE):
+            logger.info("📏 Sketches de quantis recuperados: %d sensores (%s)",
+                        len(quantile_sketches.sensors), SKETCHES_FILE)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Erro ao ler sketches de quantis: {e}")
+    await state_bus.start()
+    broadcaster.start()
     asyncio.create_task(monitor_sensor_connection())
+    asyncio.create_task(metrics.monitor_event_loop_lag())
+    asyncio.create_task(persist_sketches_periodically())
+    if detector.drift is not None:
+        asyncio.create_task(monitor_drift())
+    if history_writer is not None:
+        asyncio.create_task(flush_history_periodically())
+    asyncio.create_task(enforce_retention())
+    if profiler_enabled_from_env():
+        profiler.enable()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Grava os sketches de quantis para o próximo início e o histórico pendente"""
+    await save_sketches()
+    if history_writer is not None:
+        await flush_history()
+
+
+async def save_sketches():
+    # Cópia feita no event loop; JSON e disco numa thread
+    snapshot = quantile_sketches.to_dict()
+    try:
+        await asyncio.to_thread(write_snapshot, snapshot, SKETCHES_FILE)
+        quantile_sketches.saved_at = snapshot["saved_at"]
+    except OSError as e:
+        logger.error(f"Erro ao gravar sketches de quantis: {e}")
+
+
+async def persist_sketches_periodically():
+    """Grava os sketches a cada SKETCHES_SAVE_S segundos (0 = só no desligamento)"""
+    interval = save_interval_from_env()
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        if quantile_sketches.sensors:
+            await save_sketches()
+
+async def flush_history():
+    # Troca do buffer no event loop; compressão e disco numa thread
+    pending = history_writer.take()
+    if not pending:
+        return
+    try:
+        await asyncio.to_thread(history_writer.write, pending)
+    except OSError as e:
+        logger.error(f"Erro ao gravar histórico bruto: {e}")
+
+
+async def flush_history_periodically():
+    """Grava as janelas brutas acumuladas a cada RECORD_FLUSH_S segundos"""
+    interval = flush_interval_from_env()
+    while True:
+        await asyncio.sleep(interval)
+        await flush_history()
+
+
+async def enforce_retention():
+    """Passada de retenção a cada RETENTION_INTERVAL_S segundos, numa thread e com trava de taxa"""
+    # Primeira medição logo no início (métricas e /storage), primeira passada depois de um minuto
+    try:
+        await asyncio.to_thread(retention.usage)
+    except OSError as e:
+        logger.error(f"Erro ao medir o espaço em disco: {e}")
+    await asyncio.sleep(60)
+    while True:
+        try:
+            throttle = Throttle(retention.max_mb_s * 1e6)
+            result = await asyncio.to_thread(retention.run, throttle)
+            if result is not None and (result["compacted"] or any(result["deleted"].values())):
+                logger.info("🧹 Retenção: %d dias compactados, removidos %s (%.1f MB) em %.1f s",
+                            result["compacted"], result["deleted"],
+                            sum(result["freed_bytes"].values()) / 1e6, result["elapsed_s"])
+            if result is not None and result["errors"]:
+                logger.error("Erros na retenção (%d): %s", result["errors"], result.get("last_error"))
+        except Exception as e:
+            logger.error(f"Erro na passada de retenção: {e}")
+        await asyncio.sleep(retention.interval_s)
+
+
+async def monitor_drift():
+    """Recalcula a deriva das features a cada DRIFT_INTERVAL_S segundos"""
+    while True:
+        await asyncio.sleep(detector.drift.interval_s)
+        try:
+            for sensor_id, previous, status in detector.drift.evaluate():
+                if status in ("moderate", "significant"):
+                    summary = detector.drift.sensor_summary(sensor_id)
+                    logger.warning("📉 Deriva %s em %s: PSI %.3f (%s)", status, sensor_id,
+                                   summary["psi_max"], summary["worst_feature"])
+                elif previous in ("moderate", "significant"):
+                    logger.info("📉 Deriva de %s voltou a %s", sensor_id, status)
+        except Exception as e:
+            logger.error(f"Erro no monitor de deriva: {e}")
+
 
 async def monitor_sensor_connection():
     """Monitora conexão do sensor em background"""
     while True:
         try:
             update_sensor_connection_status()
+            # Capturas de sensores que pararam antes do fim do pós-disparo
+            for capture in capture_recorder.expire():
+                schedule_capture_write(capture)
             await asyncio.sleep(5)  # Verifica a cada 5 segundos
         except Exception as e:
             logger.error(f"Erro no monitoramento do sensor: {e}")
             await asyncio.sleep(10)
 
+def mount_static_frontend():
+    """
+    Serve static frontend UI (deve ser o último mount, depois de todas as rotas).
+    Verifica se o diretório web existe antes de montar.
+    """
+    web_dir = Path(__file__).parent / "web"
+    if web_dir.exists():
+        from fastapi.staticfiles import StaticFiles
+        app.mount("/", StaticFiles(directory=str(web_dir), html=True), name="web")
+
+
+mount_static_frontend()
+_IMPORT_FINISHED_MS = (time.perf_counter() - _IMPORT_STARTED) * 1000
+
+
 if __name__ == "__main__":
     import uvicorn
     
-    host = CONFIG["server"]["host"]
-    port = CONFIG["server"]["port"]
+    config = load_config()
+    host = config["server"]["host"]
+    port = config["server"]["port"]
     print(f"\n🚀 Servidor rodando em http://{host}:{port}")
     print(f"📊 Monitor de vibração: http://{host}:{port}/")
     print(f"🔌 Status do sensor: http://{host}:{port}/sensor/status")
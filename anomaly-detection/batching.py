@@ -0,0 +1,150 @@
+"""
+Micro-batching das janelas de /predict.
+
+Com muitos sensores enviando ao mesmo tempo, cada requisição fazia sua
+própria extração de features e distância: operações NumPy pequenas, em que
+o custo do interpretador domina. O agendador junta as janelas que chegam
+dentro de um prazo curto (BATCH_WINDOW_MS, ex.: 2 ms) ou até
+BATCH_MAX_SIZE janelas, e as pontua juntas:
+
+  - janelas de mesmo formato viram um array (B, n, 3);
+  - features e distâncias de Mahalanobis saem em uma passada vetorizada;
+  - a votação e a confiança de cada sensor são aplicadas janela a janela,
+    na ordem de chegada (detector.score), então o estado por sensor não
+    muda em relação ao caminho sem batch;
+  - explain=True viaja com a janela: a explicação é lida logo depois de a
+    janela ser pontuada dentro do batch, antes da próxima do mesmo sensor;
+  - cada requisição recebe o próprio resultado pela sua future.
+
+O prazo é pago também por uma janela sozinha (sensor isolado, carga
+baixa), por isso o agendador é opt-in: o padrão BATCH_WINDOW_MS=0 pontua
+cada janela na hora. Vale ligar com muitos sensores enviando ao mesmo
+tempo, quando o ganho da passada vetorizada supera a espera.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_MS = 0.0
+DEFAULT_MAX_SIZE = 64
+
+batch_size = metrics.histogram(
+    "anomaly_batch_size",
+    "Janelas pontuadas juntas em cada batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+BATCH_SIZE = batch_size.root
+batch_wait = metrics.histogram(
+    "anomaly_batch_wait_seconds",
+    "Espera de cada janela na fila do batch",
+)
+BATCH_WAIT = batch_wait.root
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class InferenceBatcher:
+    def __init__(self, detector, window_ms: float = DEFAULT_WINDOW_MS, max_size: int = DEFAULT_MAX_SIZE):
+        self.detector = detector
+        self.window_s = max(0.0, window_ms) / 1000.0
+        self.max_size = max(1, int(max_size))
+        self._pending: List[Tuple[np.ndarray, str, bool, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.batches = 0
+        self.windows = 0
+        self.largest = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_s > 0
+
+    async def predict(self, data: np.ndarray, sensor_id: str, explain: bool = False) -> Dict[str, Any]:
+        """Pontua a janela dentro do próximo batch e retorna o resultado dela"""
+        if not self.enabled or data.ndim != 2:
+            return self.detector.predict(data, sensor_id, explain)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((data, sensor_id, explain, future, time.perf_counter()))
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self.flush)
+        return await future
+
+    def flush(self):
+        """Pontua tudo o que está na fila (chamado pelo timer ou ao encher)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        now = time.perf_counter()
+        BATCH_SIZE.observe(len(pending))
+        self.batches += 1
+        self.windows += len(pending)
+        self.largest = max(self.largest, len(pending))
+
+        # Agrupa por formato (janelas de tamanhos diferentes não empilham)
+        groups: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+        for idx, (data, _, _, _, enqueued) in enumerate(pending):
+            BATCH_WAIT.observe(now - enqueued)
+            groups[data.shape].append(idx)
+
+        results: List[Any] = [None] * len(pending)
+        for indices in groups.values():
+            try:
+                windows = np.stack([pending[i][0] for i in indices])
+                scored = self.detector.predict_batch(
+                    windows, [pending[i][1] for i in indices], [pending[i][2] for i in indices]
+                )
+                for i, result in zip(indices, scored):
+                    results[i] = result
+            except Exception as e:
+                logger.error(f"Erro no batch de {len(indices)} janelas: {e}")
+                for i in indices:
+                    results[i] = e
+
+        for (_, _, _, future, _), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window_s * 1000,
+            "max_size": self.max_size,
+            "batches": self.batches,
+            "windows": self.windows,
+            "mean_size": self.windows / self.batches if self.batches else None,
+            "largest": self.largest,
+        }
+
+
+def batcher_from_env(detector) -> InferenceBatcher:
+    return InferenceBatcher(
+        detector,
+        _env_number("BATCH_WINDOW_MS", DEFAULT_WINDOW_MS),
+        int(_env_number("BATCH_MAX_SIZE", DEFAULT_MAX_SIZE)),
+    )
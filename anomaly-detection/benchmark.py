@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos Caminhos Críticos (inferência e ingestão)
+=======================================================
+Mede, em processo e sem rede, o custo dos trechos quentes do servidor:
+
+  1. Extração de features (preprocess + extract_features)
+  2. Distância de Mahalanobis
+  3. Requisição completa POST /predict (via cliente ASGI em processo)
+  4. Throughput com N sensores simulados enviando em paralelo
+  5. Custo de fan-out do broadcast com M clientes WebSocket
+  6. Custo por janela do micro-batching (predict_batch com B janelas)
+  7. predict() numa janela normal com a cascata desligada e ligada
+  8. POST /predict com janelas anômalas (alerta, explicação e captura)
+
+As janelas são gravações reais de datasets/ac: operação normal
+(silent_0_baseline, distância ~7, o caso comum) em todos os itens e, só no
+item 8, operação anômala (high_0), que passa pelo caminho de alertas.
+Os tempos são reportados em p50/p99 para janelas de 25, 100 e 200 amostras
+e gravados num relatório JSON, para comparar regressões entre commits.
+
+O estado do servidor (alertas, sketches, capturas, gravações e relatórios do
+profiler) vai para um diretório temporário apagado no fim: os sensores
+bench_* nunca chegam ao logs/ de produção.
+
+Uso:
+  python benchmark.py
+  python benchmark.py --output bench_novo.json --baseline bench_antigo.json
+  python benchmark.py --quick             # menos iterações (smoke test)
+
+Os clientes WebSocket do item 5 são conexões falsas registradas no
+ConnectionManager e no registro de assinaturas (padrão: todos os sensores e
+tópicos), como uma conexão real: o broadcast medido é um delta de status
+passando pelo broadcaster coalescido e por publish(), o caminho de produção,
+sem depender de sockets reais.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+# O api.py carrega config.json e o modelo com caminhos relativos
+script_dir = Path(__file__).parent
+sys.path.insert(0, str(script_dir))
+os.chdir(script_dir)
+
+# Arquivos de estado do api.py redirecionados para o diretório temporário
+STATE_PATHS = {
+    "ALERTS_PATH": "alerts.jsonl",
+    "SKETCHES_PATH": "sketches.json",
+    "CAPTURES_DIR": "captures",
+    "RECORDINGS_DIR": "recordings",
+    "PROFILER_REPORTS_PATH": "slow_calls.jsonl",
+}
+NORMAL_DIR = script_dir / "datasets" / "ac" / "silent_0_baseline"
+ANOMALY_DIR = script_dir / "datasets" / "ac" / "high_0"
+
+WINDOW_SIZES = [25, 100, 200]
+BATCH_SIZES = [1, 8, 32, 64]
+DEFAULT_SENSORS = [1, 10, 50]
+DEFAULT_WS_CLIENTS = [1, 10, 100, 500]
+
+
+# ============================================================
+# UTILITÁRIOS
+# ============================================================
+def isolate_state(directory: Path):
+    """Aponta os arquivos de estado do api.py para `directory` (antes de importá-lo)"""
+    for name, relative in STATE_PATHS.items():
+        os.environ[name] = str(directory / relative)
+
+
+_recorded: Dict[Path, List[np.ndarray]] = {}
+
+
+def make_window(rng: np.random.Generator, n_samples: int, directory: Path = NORMAL_DIR) -> np.ndarray:
+    """Janela gravada sorteada (operação normal por padrão), cortada em n amostras"""
+    if directory not in _recorded:
+        from recording import load_windows
+        _recorded[directory] = load_windows(directory)
+        if not _recorded[directory]:
+            raise SystemExit(f"Nenhuma janela gravada em {directory}")
+    windows = _recorded[directory]
+    # Janelas seguidas quando n passa do tamanho gravado
+    first = int(rng.integers(len(windows)))
+    parts, total = [], 0
+    while total < n_samples:
+        parts.append(windows[(first + len(parts)) % len(windows)])
+        total += parts[-1].shape[0]
+    return np.concatenate(parts)[:n_samples]
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    """Resume uma lista de durações (segundos) em microssegundos"""
+    arr = np.asarray(durations) * 1e6
+    return {
+        "p50_us": float(np.percentile(arr, 50)),
+        "p99_us": float(np.percentile(arr, 99)),
+        "mean_us": float(arr.mean()),
+        "min_us": float(arr.min()),
+        "iterations": int(arr.size),
+    }
+
+
+def time_calls(fn: Callable[[], Any], iterations: int, warmup: int = 10) -> List[float]:
+    """Executa fn várias vezes e retorna a duração de cada chamada"""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - t0)
+    return durations
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=script_dir,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+class _FakeWebSocket:
+    """Conexão WebSocket falsa: só conta bytes enviados"""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes_sent = 0
+
+    async def send_text(self, data: str):
+        self.messages += 1
+        self.bytes_sent += len(data)
+
+
+# ============================================================
+# BENCHMARKS
+# ============================================================
+def bench_features(api, rng, iterations: int) -> Dict[str, Any]:
+    results = {}
+    detector = api.detector
+    for n in WINDOW_SIZES:
+        window = make_window(rng, n)
+        durations = time_calls(
+            lambda: detector.extract_features(detector.preprocess(window)), iterations
+        )
+        results[str(n)] = summarize(durations)
+    return results
+
+
+def bench_distance(api, rng, iterations: int) -> Dict[str, Any]:
+    results = {}
+    detector = api.detector
+    for n in WINDOW_SIZES:
+        features = detector.extract_features(detector.preprocess(make_window(rng, n)))
+        durations = time_calls(lambda: detector.mahalanobis_distance(features), iterations)
+        results[str(n)] = summarize(durations)
+    return results
+
+
+def bench_batch(api, rng, batch_sizes: List[int], iterations: int, window_size: int) -> Dict[str, Any]:
+    """Custo por janela de predict_batch com B janelas (B=1 ≈ caminho sem batch)"""
+    results = {}
+    detector = api.detector
+    for b in batch_sizes:
+        windows = np.stack([make_window(rng, window_size) for _ in range(b)])
+        sensor_ids = [f"bench_batch_{i}" for i in range(b)]
+        durations = time_calls(lambda: detector.predict_batch(windows, sensor_ids), iterations)
+        results[str(b)] = summarize([d / b for d in durations])
+    return results
+
+
+def bench_cascade(api, rng, iterations: int, window_size: int) -> Dict[str, Any]:
+    """predict() numa janela de operação normal (dentro do envelope), sem e com cascata"""
+    detector = api.detector
+    if detector.gate is None:
+        return {}
+    window = make_window(rng, window_size)
+    saved = detector.gate.enabled
+    results = {}
+    try:
+        for label, enabled in (("off", False), ("on", True)):
+            detector.gate.configure(enabled=enabled)
+            results[label] = summarize(
+                time_calls(lambda: detector.predict(window, "bench_cascade"), iterations)
+            )
+    finally:
+        detector.gate.configure(enabled=saved)
+    return results
+
+
+async def bench_predict(api, client, rng, iterations: int) -> Dict[str, Any]:
+    results = {}
+    for n in WINDOW_SIZES:
+        payload = {"data": make_window(rng, n).tolist(), "sensor_id": "bench_predict"}
+        for _ in range(10):
+            await client.post("/predict", json=payload)
+        durations = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            resp = await client.post("/predict", json=payload)
+            durations.append(time.perf_counter() - t0)
+            resp.raise_for_status()
+        results[str(n)] = summarize(durations)
+    return results
+
+
+async def bench_predict_anomaly(api, client, rng, iterations: int, window_size: int) -> Dict[str, Any]:
+    """POST /predict com janelas anômalas: votação, alerta, explicação e captura"""
+    windows = [make_window(rng, window_size, ANOMALY_DIR).tolist() for _ in range(8)]
+    durations = []
+    for i in range(iterations):
+        payload = {"data": windows[i % len(windows)], "sensor_id": "bench_anomaly"}
+        t0 = time.perf_counter()
+        resp = await client.post("/predict", json=payload)
+        durations.append(time.perf_counter() - t0)
+        resp.raise_for_status()
+    return {str(window_size): summarize(durations)}
+
+
+async def bench_throughput(
+    api, client, rng, sensor_counts: List[int], windows_per_sensor: int, window_size: int
+) -> Dict[str, Any]:
+    """N sensores postando em paralelo, cada um sequencialmente (como o ESP32)"""
+    results = {}
+    for n_sensors in sensor_counts:
+        payloads = [
+            {"data": make_window(rng, window_size).tolist(), "sensor_id": f"bench_{i:04d}"}
+            for i in range(n_sensors)
+        ]
+        latencies: List[float] = []
+
+        async def sensor_loop(payload):
+            for _ in range(windows_per_sensor):
+                t0 = time.perf_counter()
+                resp = await client.post("/predict", json=payload)
+                latencies.append(time.perf_counter() - t0)
+                resp.raise_for_status()
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(sensor_loop(p) for p in payloads))
+        elapsed = time.perf_counter() - t_start
+
+        total = n_sensors * windows_per_sensor
+        results[str(n_sensors)] = {
+            "windows": total,
+            "elapsed_s": elapsed,
+            "windows_per_s": total / elapsed,
+            "samples_per_s": total * window_size / elapsed,
+            "latency": summarize(latencies),
+        }
+    return results
+
+
+async def bench_fanout(
+    api, client, rng, client_counts: List[int], iterations: int, window_size: int
+) -> Dict[str, Any]:
+    """Custo do broadcast e do /predict completo com M clientes WebSocket"""
+    results = {}
+    manager = api.ws_manager
+    broadcaster = api.broadcaster
+    saved_connections = set(manager.active_connections)
+    saved_registry = manager.subscriptions
+    sensor_id = "bench_fanout"
+    payload = {"data": make_window(rng, window_size).tolist(), "sensor_id": sensor_id}
+
+    try:
+        # Status real de uma predição, capturado com zero clientes
+        resp = await client.post("/predict", json=payload)
+        status = api.make_status_payload(resp.json())
+
+        for n_clients in client_counts:
+            fakes = [_FakeWebSocket() for _ in range(n_clients)]
+            manager.active_connections = set(fakes)
+            manager.subscriptions = api.SubscriptionRegistry()
+            for fake in fakes:
+                manager.subscriptions.add(fake)
+
+            broadcast_durations = []
+            for i in range(iterations):
+                # Distância alternada: o delta nunca é vazio; intervalo zerado: envio imediato
+                varied = dict(status, distance=status["distance"] + (i % 2) * 0.5)
+                broadcaster._stream(sensor_id).last_flush = float("-inf")
+                t0 = time.perf_counter()
+                await broadcaster.submit(sensor_id, api.Payload(varied))
+                broadcast_durations.append(time.perf_counter() - t0)
+
+            predict_durations = []
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                await client.post("/predict", json=payload)
+                predict_durations.append(time.perf_counter() - t0)
+
+            results[str(n_clients)] = {
+                "broadcast": summarize(broadcast_durations),
+                "predict": summarize(predict_durations),
+                "bytes_per_client": fakes[0].bytes_sent // max(fakes[0].messages, 1),
+            }
+    finally:
+        manager.active_connections = saved_connections
+        manager.subscriptions = saved_registry
+    return results
+
+
+# ============================================================
+# RELATÓRIO E COMPARAÇÃO
+# ============================================================
+def flatten_latencies(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Achata o relatório em {caminho: valor} para chaves p50/p99"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten_latencies(value, path))
+        elif key in ("p50_us", "p99_us"):
+            flat[path] = float(value)
+    return flat
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Imprime a variação por métrica e retorna as que regrediram além da tolerância"""
+    cur = flatten_latencies(current["results"])
+    base = flatten_latencies(baseline["results"])
+    regressions = []
+
+    print(f"\n📊 Comparação com baseline ({baseline['meta'].get('commit', '?')}):")
+    for path in sorted(cur):
+        if path not in base or base[path] <= 0:
+            continue
+        delta = (cur[path] - base[path]) / base[path]
+        marker = ""
+        if delta > tolerance:
+            marker = "  ⚠️ REGRESSÃO"
+            regressions.append(path)
+        elif delta < -tolerance:
+            marker = "  ✓ melhora"
+        print(f"   {path:<45} {base[path]:>12.1f} → {cur[path]:>12.1f} µs ({delta:+.1%}){marker}")
+    return regressions
+
+
+def print_summary(results: Dict[str, Any]):
+    print("\n" + "=" * 60)
+    print("  RESULTADOS (p50 / p99)")
+    print("=" * 60)
+    for section in ("features", "distance", "predict", "predict_anomaly"):
+        print(f"\n  {section}:")
+        for n, stats in results[section].items():
+            print(f"    {n:>4} amostras: {stats['p50_us']:>10.1f} / {stats['p99_us']:>10.1f} µs")
+    print("\n  batch (por janela):")
+    for b, stats in results["batch"].items():
+        print(f"    {b:>4} janelas: {stats['p50_us']:>10.1f} / {stats['p99_us']:>10.1f} µs")
+    print("\n  cascata (janela normal):")
+    for label, stats in results["cascade"].items():
+        print(f"    {label:>12}: {stats['p50_us']:>10.1f} / {stats['p99_us']:>10.1f} µs")
+    print("\n  throughput:")
+    for n, stats in results["throughput"].items():
+        print(f"    {n:>4} sensores: {stats['windows_per_s']:>10.1f} janelas/s")
+    print("\n  fan-out (broadcast):")
+    for m, stats in results["fanout"].items():
+        b = stats["broadcast"]
+        print(f"    {m:>4} clientes: {b['p50_us']:>10.1f} / {b['p99_us']:>10.1f} µs")
+    print()
+
+
+async def run_benchmarks(args) -> Dict[str, Any]:
+    import httpx
+    import api
+
+    rng = np.random.default_rng(args.seed)
+    results: Dict[str, Any] = {}
+
+    print("⏱️  Extração de features...")
+    results["features"] = bench_features(api, rng, args.iterations)
+    print("⏱️  Distância de Mahalanobis...")
+    results["distance"] = bench_distance(api, rng, args.iterations)
+    print("⏱️  Micro-batching...")
+    results["batch"] = bench_batch(api, rng, BATCH_SIZES, args.predict_iterations, args.window_size)
+    print("⏱️  Cascata de pontuação...")
+    results["cascade"] = bench_cascade(api, rng, args.iterations, args.window_size)
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print("⏱️  POST /predict...")
+        results["predict"] = await bench_predict(api, client, rng, args.predict_iterations)
+        print("⏱️  POST /predict (janelas anômalas)...")
+        results["predict_anomaly"] = await bench_predict_anomaly(
+            api, client, rng, args.predict_iterations, args.window_size
+        )
+        print("⏱️  Throughput com N sensores...")
+        results["throughput"] = await bench_throughput(
+            api, client, rng, args.sensors, args.windows_per_sensor, args.window_size
+        )
+        print("⏱️  Fan-out com M clientes WebSocket...")
+        results["fanout"] = await bench_fanout(
+            api, client, rng, args.ws_clients, args.predict_iterations, args.window_size
+        )
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos caminhos críticos do servidor")
+    parser.add_argument("-o", "--output", type=str, default="benchmark_report.json")
+    parser.add_argument("--baseline", type=str, help="Relatório anterior para comparação")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Variação relativa tolerada antes de acusar regressão (0.10 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Retorna código 1 se houver regressão em relação ao baseline")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--predict-iterations", type=int, default=300)
+    parser.add_argument("--sensors", type=int, nargs="+", default=DEFAULT_SENSORS)
+    parser.add_argument("--windows-per-sensor", type=int, default=20)
+    parser.add_argument("--ws-clients", type=int, nargs="+", default=DEFAULT_WS_CLIENTS)
+    parser.add_argument("--window-size", type=int, default=200,
+                        help="Tamanho da janela usado no throughput e no fan-out")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", type=str, default="WARNING",
+                        help="Nível de log do servidor durante o benchmark")
+    parser.add_argument("--quick", action="store_true", help="Poucas iterações (smoke test)")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.iterations = 200
+        args.predict_iterations = 30
+        args.windows_per_sensor = 5
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as state_dir:
+        isolate_state(Path(state_dir))
+        return run(args)
+
+
+def run(args):
+    # O api.py chama logging.basicConfig na importação; ajusta o nível depois
+    import api  # noqa: F401
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger("api").setLevel(args.log_level)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    results = asyncio.run(run_benchmarks(args))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "duration_s": time.perf_counter() - started,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+    print_summary(results)
+
+    output = Path(args.output)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"💾 Relatório salvo em: {output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare_reports(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} métrica(s) regrediram mais de {args.tolerance:.0%}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Broadcast coalescido do estado dos sensores.
+
+Antes, cada janela virava uma mensagem "prediction" completa (com o
+resultado e as features por eixo) para todos os clientes WebSocket e um
+status para cada fila SSE, mesmo sem nada visível ter mudado. Agora:
+
+  - cada sensor envia no máximo uma atualização por intervalo
+    (BROADCAST_HZ, padrão 10 Hz): a primeira janela depois de um intervalo
+    sai na hora, as seguintes dentro do intervalo são fundidas e só a
+    última sai no fim dele;
+  - a mensagem é um delta compacto ("type": "status") só com os campos que
+    mudaram desde o último envio daquele sensor (cor, anomalia, distância,
+    confiança, threshold, qualidade do sinal), arredondados ao que a UI mostra;
+  - sem mudança visível, nada é enviado;
+  - o resultado completo (features) vai à parte, só para quem assinou;
+  - o texto das mensagens só é montado por quem entrega, se houver
+    destinatário (ver subscriptions.py).
+
+Com isso o volume de broadcast fica limitado por sensores × BROADCAST_HZ,
+não pela taxa de ingestão.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from payloads import Payload, dumps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROADCAST_HZ = 10.0
+# Campos do delta e casas decimais (None = sem arredondar)
+DELTA_FIELDS: Dict[str, Optional[int]] = {
+    "status_color": None,
+    "is_anomaly": None,
+    "distance": 3,
+    "confidence": 3,
+    "threshold": 3,
+    "quality": None,
+}
+
+# deliver(sensor_id, changed, status, result_text): changed vazio = sem mudança visível
+Deliver = Callable[[str, Dict[str, Any], Payload, Optional[str]], Awaitable[None]]
+
+
+def status_message(sensor_id: str, fields: Dict[str, Any], timestamp: Optional[str]) -> str:
+    return dumps({"type": "status", "sensor_id": sensor_id, **fields, "timestamp": timestamp})
+
+
+def broadcast_hz_from_env() -> float:
+    try:
+        hz = float(os.environ.get("BROADCAST_HZ", DEFAULT_BROADCAST_HZ))
+    except ValueError:
+        return DEFAULT_BROADCAST_HZ
+    return hz if hz > 0 else DEFAULT_BROADCAST_HZ
+
+
+class SensorStream:
+    """Último estado enviado e atualização pendente de um sensor"""
+
+    __slots__ = ("sent", "timestamp", "pending", "pending_result", "last_flush")
+
+    def __init__(self):
+        self.sent: Dict[str, Any] = {}
+        self.timestamp: Optional[str] = None
+        self.pending: Optional[Payload] = None
+        self.pending_result: Optional[str] = None
+        self.last_flush = 0.0
+
+
+class CoalescingBroadcaster:
+    def __init__(self, deliver: Deliver, hz: float = DEFAULT_BROADCAST_HZ,
+                 clock: Callable[[], float] = time.monotonic):
+        self.deliver = deliver
+        self.interval_s = 1.0 / hz
+        self.clock = clock
+        self.streams: Dict[str, SensorStream] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Chamado a cada tique da tarefa de fundo (ex.: reenvios limitados por max_hz)
+        self.on_tick: Optional[Callable[[], Awaitable[None]]] = None
+
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.unchanged = 0
+
+    def _stream(self, sensor_id: str) -> SensorStream:
+        stream = self.streams.get(sensor_id)
+        if stream is None:
+            stream = self.streams[sensor_id] = SensorStream()
+        return stream
+
+    async def submit(self, sensor_id: str, status: Payload, result_text: Optional[str] = None):
+        """Nova janela processada: envia agora ou deixa para o fim do intervalo"""
+        self.submitted += 1
+        stream = self._stream(sensor_id)
+        if stream.pending is not None:
+            self.coalesced += 1
+        stream.pending = status
+        stream.pending_result = result_text
+        if self.clock() - stream.last_flush >= self.interval_s:
+            await self._flush(sensor_id, stream)
+
+    def delta(self, stream: SensorStream, status: Dict[str, Any]) -> Dict[str, Any]:
+        changed = {}
+        for field, digits in DELTA_FIELDS.items():
+            value = status.get(field)
+            if digits is not None and value is not None:
+                value = round(value, digits)
+            if stream.sent.get(field) != value:
+                changed[field] = value
+        return changed
+
+    async def _flush(self, sensor_id: str, stream: SensorStream):
+        status, result_text = stream.pending, stream.pending_result
+        stream.pending = stream.pending_result = None
+        stream.last_flush = self.clock()
+
+        changed = self.delta(stream, status.data)
+        if changed:
+            stream.sent.update(changed)
+            stream.timestamp = status.data.get("timestamp")
+            self.sent += 1
+        else:
+            self.unchanged += 1
+        await self.deliver(sensor_id, changed, status, result_text)
+
+    async def flush_due(self):
+        """Envia as atualizações pendentes cujo intervalo terminou"""
+        now = self.clock()
+        for sensor_id, stream in list(self.streams.items()):
+            if stream.pending is not None and now - stream.last_flush >= self.interval_s:
+                await self._flush(sensor_id, stream)
+
+    # ------------------------------------------------------------
+    # Tarefa de fundo
+    # ------------------------------------------------------------
+    async def _run(self):
+        while True:
+            # Meio intervalo: a última janela fundida sai no máximo ~1,5 intervalo depois
+            await asyncio.sleep(self.interval_s / 2)
+            try:
+                await self.flush_due()
+                if self.on_tick is not None:
+                    await self.on_tick()
+            except Exception as e:
+                logger.error(f"Erro no broadcast coalescido: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def state_message(self, sensor_id: str) -> Optional[str]:
+        """Estado completo já enviado de um sensor (mensagem status com todos os campos)"""
+        stream = self.streams.get(sensor_id)
+        if stream is None or not stream.sent:
+            return None
+        return status_message(sensor_id, stream.sent, stream.timestamp)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Último estado enviado de cada sensor (para clientes que acabam de conectar)"""
+        return {sensor_id: dict(stream.sent) for sensor_id, stream in self.streams.items() if stream.sent}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hz": 1.0 / self.interval_s,
+            "sensors": len(self.streams),
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "unchanged": self.unchanged,
+        }
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Confiança Calibrada (CDF das Distâncias Normais)
+================================================
+A confiança era uma escada de faixas relativas ao threshold (0,05 / 0,15 /
+... / 0,90) ajustada por média e desvio de uma lista refatiada a cada
+chamada. Agora ela vem de uma tabela de quantis das distâncias de janelas
+normais, gravada no modelo:
+
+  probabilidade(d) = fração das janelas normais com distância ≤ d
+  confiança(d)     = log(1 - probabilidade(d)) / log(1 - probabilidade(threshold))
+
+  - 0,5 é uma janela normal típica; 0,99 é mais extrema que 99% delas;
+  - a tabela tem CDF_POINTS quantis (p = 0, 1/128, ..., 1) e a consulta é
+    um bisect mais interpolação linear entre os vizinhos;
+  - acima do quantil TAIL_P a tabela vira a cauda da lei chi (escalada para
+    passar pelo mesmo ponto): o último 1% vem de poucas janelas e o máximo
+    empírico fica abaixo do threshold, o que saturava a probabilidade em 1;
+  - sem tabela no modelo, o artefato usa a lei chi com k = nº de features
+    (d² ~ χ²(k) para features gaussianas), calculada sem SciPy;
+  - a confiança de anomalia mede a raridade da janela em "noves" relativos
+    aos do threshold: ≈ 0 numa janela normal típica, 1 no threshold;
+  - a confiança publicada é a média das últimas CONFIDENCE_WINDOW
+    confianças do sensor (mesma janela da votação 2 de 3), num anel de
+    tamanho fixo: custo constante e sem alocação por chamada.
+
+A tabela empírica é gerada no treinamento (train_real_model.py, training.py)
+ou depois, a partir de janelas normais gravadas (que também dão o histograma
+de referência do monitor de deriva, ver drift.py):
+
+  python calibration.py datasets/ac/silent_0_baseline
+  python calibration.py datasets/ac/silent_0_baseline --model models/outro.npz
+"""
+
+import argparse
+import math
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+from drift import reference_histogram
+from payloads import finite
+from recording import load_windows
+
+CDF_POINTS = 129
+TAIL_P = 0.99
+CONFIDENCE_WINDOW = 3
+MODEL_PATH = Path("models/mahalanobis_model.npz")
+
+
+# ============================================================
+# TABELAS
+# ============================================================
+def empirical_table(distances: np.ndarray, points: int = CDF_POINTS) -> np.ndarray:
+    """Quantis das distâncias normais em p = 0, 1/(points-1), ..., 1"""
+    distances = np.asarray(distances, dtype=np.float64)
+    distances = distances[np.isfinite(distances)]
+    if distances.size < 2:
+        raise ValueError("São precisas ao menos 2 distâncias finitas para a CDF")
+    return np.quantile(distances, np.linspace(0.0, 1.0, points))
+
+
+def chi_cdf(d: np.ndarray, k: int, terms: int = 500) -> np.ndarray:
+    """
+    CDF da lei chi com k graus de liberdade: P(k/2, d²/2), gama incompleta
+    regularizada pela série de potências (convergente para todo x).
+    """
+    a = k / 2.0
+    x = np.square(np.asarray(d, dtype=np.float64)) / 2.0
+    term = np.full_like(x, 1.0 / a)
+    total = term.copy()
+    for n in range(1, terms):
+        term = term * x / (a + n)
+        total += term
+    with np.errstate(divide="ignore"):
+        log_prefix = -x + a * np.log(x) - math.lgamma(a)
+    return np.clip(np.exp(log_prefix) * total, 0.0, 1.0)
+
+
+def chi_log_sf(d: float, k: int) -> float:
+    """
+    log P(chi(k) > d) para um escalar: série da gama incompleta inferior
+    perto do centro, fração contínua (Lentz) da superior na cauda, onde
+    1 - CDF perderia toda a precisão.
+    """
+    a = k / 2.0
+    x = d * d / 2.0
+    if x <= 0.0:
+        return 0.0
+    log_prefix = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1.0:
+        term = total = 1.0 / a
+        n = 1
+        while term > total * 1e-15:
+            term *= x / (a + n)
+            total += term
+            n += 1
+        return math.log1p(-min(math.exp(log_prefix) * total, 1.0 - 1e-16))
+    tiny = 1e-300
+    b = x + 1.0 - a
+    c = 1.0 / tiny
+    f = h = 1.0 / b
+    for n in range(1, 500):
+        an = -n * (n - a)
+        b += 2.0
+        f = an * f + b
+        f = tiny if abs(f) < tiny else f
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        f = 1.0 / f
+        delta = f * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-15:
+            break
+    return log_prefix + math.log(h)
+
+
+def chi_table(k: int, points: int = CDF_POINTS) -> np.ndarray:
+    """Quantis da lei chi(k), invertendo a CDF numa grade fina"""
+    grid = np.linspace(0.0, math.sqrt(k) + 12.0, 8193)
+    cdf = np.maximum.accumulate(chi_cdf(grid, k))
+    probs = np.linspace(0.0, 1.0, points)
+    table = np.interp(probs, cdf, grid)
+    table[-1] = grid[-1]
+    return table
+
+
+# ============================================================
+# CONSULTA
+# ============================================================
+class CdfTable:
+    """Probabilidade e confiança de anomalia de uma distância pela tabela de quantis"""
+
+    def __init__(self, quantiles: Sequence[float], kind: str, k: int):
+        n = len(quantiles) - 1
+        self.step = 1.0 / n
+        self.tail_index = round(n * TAIL_P)
+        # Lista Python: bisect sobre ela não aloca nem cria escalares NumPy
+        self.quantiles = [float(q) for q in quantiles[:self.tail_index + 1]]
+        self.kind = kind
+        self.k = k
+        # Cauda chi(k) com escala que leva o quantil TAIL_P dela ao da tabela
+        tail_start = self.quantiles[-1]
+        chi_start = float(chi_table(self.k, len(quantiles))[self.tail_index])
+        self.tail_scale = chi_start / tail_start if tail_start > 0 else 1.0
+        self.tail_offset = math.log1p(-self.tail_index * self.step) - chi_log_sf(chi_start, self.k)
+        self._threshold = (None, 0.0)
+
+    def log_survival(self, distance: float) -> float:
+        """log(1 - probabilidade): preciso também muito acima do threshold"""
+        q = self.quantiles
+        if distance >= q[-1]:
+            return self.tail_offset + chi_log_sf(distance * self.tail_scale, self.k)
+        i = bisect_right(q, distance)
+        if i == 0:
+            return 0.0
+        low, high = q[i - 1], q[i]
+        frac = (distance - low) / (high - low) if high > low else 0.0
+        return math.log1p(-((i - 1) + frac) * self.step)
+
+    def probability(self, distance: float) -> float:
+        return -math.expm1(self.log_survival(distance))
+
+    def confidence(self, log_survival: float, threshold: float) -> float:
+        """Raridade da janela relativa à do threshold: 0 típica, 1 no threshold"""
+        cached, reference = self._threshold
+        if cached != threshold:
+            reference = self.log_survival(threshold)
+            self._threshold = (threshold, reference)
+        if reference >= 0.0:
+            return 1.0
+        return min(max(log_survival / reference, 0.0), 1.0)
+
+    def describe(self) -> dict:
+        q = self.quantiles
+        n = round(1.0 / self.step)
+        return {
+            "kind": self.kind,
+            "points": n + 1,
+            "p50": q[n // 2],
+            "p99": q[self.tail_index],
+            "tail": f"chi({self.k})",
+        }
+
+
+class ConfidenceRing:
+    """Últimas confianças de um sensor: média móvel em anel de tamanho fixo"""
+
+    __slots__ = ("values", "index", "count", "total")
+
+    def __init__(self, size: int = CONFIDENCE_WINDOW):
+        self.values = array("d", bytes(8 * size))
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, confidence: float) -> float:
+        """Adiciona uma confiança e retorna a média do anel"""
+        size = len(self.values)
+        self.total += confidence - self.values[self.index]
+        self.values[self.index] = confidence
+        self.index = (self.index + 1) % size
+        if self.count < size:
+            self.count += 1
+        return min(max(self.total / self.count, 0.0), 1.0)
+
+
+# ============================================================
+# CALIBRAÇÃO A PARTIR DE JANELAS GRAVADAS
+# ============================================================
+def calibrate(model_path: Path, directories: Sequence[Path]) -> np.ndarray:
+    """
+    Distâncias (com o extrator e o artefato do servidor) das janelas normais
+    gravadas (CSV ou .vrec); grava a tabela como cdf_distances no modelo de origem,
+    junto com o histograma de referência das features (drift_edges/drift_expected).
+    """
+    from api import AnomalyDetector
+
+    detector = AnomalyDetector(str(model_path))
+    distances, rows = [], []
+    for window in load_windows(directories):
+        if window.shape[0] < 2:
+            continue
+        features = detector.extract_features(detector.preprocess(window))
+        distances.append(detector.mahalanobis_distance(features))
+        rows.append(finite(features))
+    table = empirical_table(np.array(distances))
+    drift_edges, drift_expected = reference_histogram(np.array(rows))
+
+    with np.load(model_path, allow_pickle=False) as model:
+        arrays = {key: model[key] for key in model.files}
+    arrays["cdf_distances"] = table
+    arrays["drift_edges"] = drift_edges
+    arrays["drift_expected"] = drift_expected
+    tmp = model_path.with_name(model_path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    tmp.replace(model_path)
+    return np.array(distances)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grava a CDF das distâncias normais no modelo")
+    parser.add_argument("directories", type=Path, nargs="+", help="Pastas com janelas normais (CSV x,y,z ou .vrec)")
+    parser.add_argument("--model", type=Path, default=MODEL_PATH)
+    args = parser.parse_args()
+
+    distances = calibrate(args.model, args.directories)
+    print(f"📏 {len(distances)} janelas normais")
+    print(f"   p50: {np.percentile(distances, 50):.3f}  p99: {np.percentile(distances, 99):.3f}"
+          f"  máx: {distances.max():.3f}")
+    print(f"💾 Tabela com {CDF_POINTS} quantis e histograma de deriva gravados em: {args.model}")
+    print("   (o artefato compilado é regenerado na próxima inicialização)")
+
+
+if __name__ == "__main__":
+    main()
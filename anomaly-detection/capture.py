@@ -0,0 +1,247 @@
+"""
+Captura da forma de onda em torno dos alertas.
+
+As amostras brutas que abriram um alerta só existiam no deque de 1000
+amostras do tempo real (recent_samples) e sumiam em segundos. Em vez de
+gravar tudo continuamente, cada sensor mantém um anel curto das últimas
+janelas brutas e, num alerta, o trecho em volta dele é congelado e gravado:
+
+  - anel pré-disparo: referências às janelas já sanitizadas (timestamps e
+    xyz), descartadas pela esquerda quando ficam mais velhas que pre_s; não
+    há cópia nem trabalho por amostra na ingestão;
+  - alerta aberto ou escalado: o anel é congelado (últimos pre_s segundos até
+    a última amostra da janela que disparou) e as janelas seguintes entram na
+    captura até post_s segundos depois do disparo;
+  - sem novas janelas (sensor caiu), a captura é gravada incompleta
+    ("truncated") post_s + GRACE_S segundos depois do disparo;
+  - outro evento do mesmo sensor durante a captura só é anotado nela.
+
+Cada captura é um .npz comprimido em CAPTURES_DIR (padrão logs/captures):
+t_ms (float64, relógio da linha do tempo do sensor), xyz (float32) e meta
+(JSON com o evento, as features, a explicação e a identificação do modelo).
+O índice (index.jsonl no mesmo diretório) tem uma linha por captura e é o que
+a listagem lê: todos os workers enxergam as capturas de todos.
+"""
+
+import json
+import os
+import re
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+CAPTURES_DIR = Path(os.environ.get("CAPTURES_DIR", "logs/captures"))
+INDEX_NAME = "index.jsonl"
+DEFAULT_PRE_S = 5.0
+DEFAULT_POST_S = 5.0
+GRACE_S = 5.0
+TRIGGER_EVENTS = ("opened", "escalated")
+MAX_INDEX_IN_MEMORY = 1000
+
+_ID_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+captures_written = metrics.counter(
+    "anomaly_captures_total",
+    "Capturas de forma de onda gravadas (complete = pós-disparo inteiro, truncated = sensor parou)",
+    ["status"],
+)
+
+
+class PendingCapture:
+    __slots__ = ("capture_id", "sensor_id", "trigger_ms", "end_ms", "triggered_at", "deadline", "chunks", "meta")
+
+    def __init__(self, sensor_id: str, trigger_ms: float, post_s: float,
+                 chunks: List[Tuple[np.ndarray, np.ndarray]], meta: Dict[str, Any]):
+        self.sensor_id = sensor_id
+        self.trigger_ms = trigger_ms
+        self.end_ms = trigger_ms + post_s * 1000
+        # Prazo no relógio do servidor (os timestamps podem ser do dispositivo)
+        self.triggered_at = time.time()
+        self.deadline = self.triggered_at + post_s + GRACE_S
+        stamp = datetime.fromtimestamp(self.triggered_at)
+        self.capture_id = f"{_UNSAFE_RE.sub('_', sensor_id)}_{stamp:%Y%m%dT%H%M%S_%f}"
+        self.chunks = chunks
+        self.meta = meta
+
+    def samples(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.chunks:
+            return np.empty(0), np.empty((0, 3), dtype=np.float32)
+        t_ms = np.concatenate([t for t, _ in self.chunks])
+        xyz = np.concatenate([x for _, x in self.chunks]).astype(np.float32)
+        return t_ms, xyz
+
+
+class CaptureRecorder:
+    """Anéis pré-disparo e capturas em andamento de cada sensor"""
+
+    def __init__(self, pre_s: float = DEFAULT_PRE_S, post_s: float = DEFAULT_POST_S):
+        self.pre_s = pre_s
+        self.post_s = post_s
+        self.rings: Dict[str, Deque[Tuple[np.ndarray, np.ndarray]]] = {}
+        self.pending: Dict[str, PendingCapture] = {}
+        self.triggered = 0
+
+    def add(self, sensor_id: str, t_ms: np.ndarray, xyz: np.ndarray) -> List[PendingCapture]:
+        """Janela bruta aceita pela linha do tempo; retorna capturas que terminaram"""
+        if not t_ms.size:
+            return []
+        ring = self.rings.get(sensor_id)
+        if ring is None:
+            ring = self.rings[sensor_id] = deque()
+        ring.append((t_ms, xyz))
+        # Janelas inteiras mais velhas que pre_s saem (a última sempre fica)
+        oldest = t_ms[-1] - self.pre_s * 1000
+        while len(ring) > 1 and ring[0][0][-1] < oldest:
+            ring.popleft()
+
+        capture = self.pending.get(sensor_id)
+        if capture is None:
+            return []
+        after = t_ms > capture.trigger_ms
+        if after.any():
+            capture.chunks.append((t_ms[after], xyz[after]))
+        if t_ms[-1] < capture.end_ms:
+            return []
+        del self.pending[sensor_id]
+        capture.meta["status"] = "complete"
+        return [capture]
+
+    def trigger(self, sensor_id: str, event: Dict[str, Any], meta: Dict[str, Any]) -> str:
+        """
+        Congela o anel do sensor e retorna o id da captura. Com uma captura
+        já em andamento, o evento só é anotado nela (e o id é o dela).
+        """
+        capture = self.pending.get(sensor_id)
+        if capture is not None:
+            capture.meta["events"].append(event)
+            return capture.capture_id
+        ring = self.rings.get(sensor_id)
+        chunks: List[Tuple[np.ndarray, np.ndarray]] = []
+        trigger_ms = time.time() * 1000
+        if ring:
+            trigger_ms = float(ring[-1][0][-1])
+            start = trigger_ms - self.pre_s * 1000
+            for t_ms, xyz in ring:
+                keep = t_ms >= start
+                if keep.any():
+                    chunks.append((t_ms[keep], xyz[keep]))
+        capture = self.pending[sensor_id] = PendingCapture(sensor_id, trigger_ms, self.post_s, chunks, {
+            **meta,
+            "sensor_id": sensor_id,
+            "events": [event],
+            "trigger_ms": trigger_ms,
+            "pre_s": self.pre_s,
+            "post_s": self.post_s,
+        })
+        self.triggered += 1
+        return capture.capture_id
+
+    def expire(self) -> List[PendingCapture]:
+        """Capturas cujo sensor parou de enviar antes do fim do pós-disparo"""
+        now = time.time()
+        expired = [c for c in self.pending.values() if now >= c.deadline]
+        for capture in expired:
+            del self.pending[capture.sensor_id]
+            capture.meta["status"] = "truncated"
+        return expired
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pre_s": self.pre_s,
+            "post_s": self.post_s,
+            "sensors": len(self.rings),
+            "pending": len(self.pending),
+            "triggered": self.triggered,
+        }
+
+
+# ============================================================
+# ARMAZENAMENTO
+# ============================================================
+class CaptureStore:
+    """Arquivos .npz das capturas e o índice em JSONL"""
+
+    def __init__(self, directory: Path = CAPTURES_DIR):
+        self.directory = directory
+        self.index_path = directory / INDEX_NAME
+        self.written = 0
+
+    def write(self, capture: PendingCapture) -> Dict[str, Any]:
+        """Grava a captura e acrescenta sua linha ao índice (chamado fora do event loop)"""
+        t_ms, xyz = capture.samples()
+        entry = {
+            "capture_id": capture.capture_id,
+            **capture.meta,
+            "samples": int(t_ms.size),
+            "start_ms": float(t_ms[0]) if t_ms.size else None,
+            "end_ms": float(t_ms[-1]) if t_ms.size else None,
+            "triggered_at": datetime.fromtimestamp(capture.triggered_at).isoformat(),
+        }
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{capture.capture_id}.npz"
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, t_ms=t_ms, xyz=xyz, meta=np.array(json.dumps(entry)))
+        tmp.replace(path)
+        entry["bytes"] = path.stat().st_size
+        # Uma linha por write em modo append: seguro entre workers
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.written += 1
+        captures_written.labels(entry["status"]).inc()
+        return entry
+
+    def list(self, limit: int = 50, sensor_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Capturas mais recentes primeiro (do índice em disco: inclui as de outros workers)"""
+        if not self.index_path.exists():
+            return []
+        with open(self.index_path, encoding="utf-8") as f:
+            tail = deque(f, maxlen=MAX_INDEX_IN_MEMORY)
+        entries = []
+        for line in reversed(tail):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if sensor_id is not None and entry["sensor_id"] != sensor_id:
+                continue
+            # Arquivo já removido (retenção ou manual) não aparece
+            if not (self.directory / f"{entry['capture_id']}.npz").exists():
+                continue
+            entries.append(entry)
+            if len(entries) >= limit:
+                break
+        return entries
+
+    def path(self, capture_id: str) -> Optional[Path]:
+        """Arquivo da captura; None para id inválido ou inexistente"""
+        if not _ID_RE.match(capture_id):
+            return None
+        path = self.directory / f"{capture_id}.npz"
+        return path if path.is_file() else None
+
+    def load(self, capture_id: str) -> Optional[Tuple[Dict[str, Any], np.ndarray, np.ndarray]]:
+        """(meta, t_ms, xyz) da captura"""
+        path = self.path(capture_id)
+        if path is None:
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            return json.loads(str(data["meta"])), data["t_ms"], data["xyz"]
+
+
+def capture_options_from_env() -> Dict[str, float]:
+    options = {}
+    for key, name, default in (("pre_s", "CAPTURE_PRE_S", DEFAULT_PRE_S),
+                               ("post_s", "CAPTURE_POST_S", DEFAULT_POST_S)):
+        try:
+            options[key] = max(0.0, float(os.environ.get(name, default)))
+        except ValueError:
+            options[key] = default
+    return options
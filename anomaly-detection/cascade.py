@@ -0,0 +1,153 @@
+"""
+Cascata de pontuação: um estágio rápido antes da Mahalanobis completa.
+
+Numa máquina funcionando normalmente, quase todas as janelas são
+claramente normais, mas cada uma pagava a extração das 15 features e a
+distância completa. Com a cascata ligada:
+
+  1. o estágio rápido calcula o desvio padrão de cada eixo (= RMS depois de
+     remover a média) e o pico a pico, em passadas vetorizadas, e compara
+     com o envelope normal do treinamento, gravado no artefato do modelo
+     (ver model_artifact.py). O pico a pico pega faltas impulsivas: alguns
+     picos mudam pouco o desvio padrão, mas a distância completa dispara;
+  2. só as janelas fora do envelope seguem para a pontuação completa;
+  3. uma amostra aleatória das janelas dentro do envelope (audit_rate)
+     também é pontuada por completo: se alguma passa do threshold, é uma
+     anomalia que o estágio rápido deixaria passar (contador de auditoria).
+
+Janelas dispensadas recebem como distância a Mahalanobis marginal das
+features do envelope (std e pico a pico), limite inferior da completa, e
+passam pela votação e pela confiança normalmente (como janela normal).
+
+Desligada por padrão: CASCADE_ENABLED=1 liga, CASCADE_AUDIT_RATE (padrão
+0,02) define a fração auditada; ambos ajustáveis em /admin/cascade.
+"""
+
+import os
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+DEFAULT_AUDIT_RATE = 0.02
+# Features do envelope, nesta ordem dentro de cada eixo (valores de route())
+GATE_FEATURES = ("std", "peak_to_peak")
+
+cascade_windows = metrics.counter(
+    "anomaly_cascade_windows_total",
+    "Janelas por estágio da cascata (gate = dispensada, audit = auditada, full = fora do envelope)",
+    ["stage"],
+)
+CASCADE_GATE = cascade_windows.labels("gate")
+CASCADE_AUDIT = cascade_windows.labels("audit")
+CASCADE_FULL = cascade_windows.labels("full")
+cascade_audit_misses = metrics.counter(
+    "anomaly_cascade_audit_misses_total",
+    "Janelas auditadas dentro do envelope com distância acima do threshold",
+)
+CASCADE_AUDIT_MISSES = cascade_audit_misses.root
+
+
+class ScoringGate:
+    def __init__(self, low: np.ndarray, high: np.ndarray, mu: np.ndarray, whitening: np.ndarray,
+                 enabled: bool = False, audit_rate: float = DEFAULT_AUDIT_RATE, seed: Optional[int] = None):
+        self.low = low
+        self.high = high
+        self.mu = mu
+        self.whitening = whitening
+        self.enabled = enabled
+        self.audit_rate = audit_rate
+        self.rng = np.random.default_rng(seed)
+
+        self.gated = 0
+        self.audited = 0
+        self.full = 0
+        self.audit_misses = 0
+
+    @classmethod
+    def from_artifact(cls, model: Mapping[str, np.ndarray], **kwargs: Any) -> Optional["ScoringGate"]:
+        """Envelope gravado no artefato; None se o artefato não tem envelope"""
+        if "gate_low" not in model:
+            return None
+        return cls(model["gate_low"], model["gate_high"], model["gate_mu"], model["gate_whitening"], **kwargs)
+
+    def configure(self, enabled: Optional[bool] = None, audit_rate: Optional[float] = None):
+        if audit_rate is not None:
+            if not 0.0 <= audit_rate <= 1.0:
+                raise ValueError("audit_rate deve estar entre 0 e 1")
+            self.audit_rate = audit_rate
+        if enabled is not None:
+            self.enabled = enabled
+
+    def route(self, windows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Estágio rápido para (n, 3) ou (B, n, 3): retorna (dispensar, auditar,
+        valores do envelope), com uma entrada por janela. Os valores vêm eixo a
+        eixo na ordem de GATE_FEATURES: (std₀, ptp₀, std₁, ptp₁, ...).
+        """
+        # Uma passada: E[x²] − E[x]² (np.std faz duas e aloca a janela centrada)
+        n = windows.shape[-2]
+        mean = windows.sum(axis=-2) / n
+        mean_sq = np.einsum("...ij,...ij->...j", windows, windows) / n
+        std = np.sqrt(np.maximum(mean_sq - np.square(mean), 0.0))
+        ptp = windows.max(axis=-2) - windows.min(axis=-2)
+        values = np.stack([std, ptp], axis=-1).reshape(*std.shape[:-1], -1)
+        inside = np.all((values >= self.low) & (values <= self.high), axis=-1)
+        audit = inside & (self.rng.random(inside.shape) < self.audit_rate)
+        skip = inside & ~audit
+
+        # int(): contadores vão para o JSON de /admin/cascade
+        n_skip, n_audit = int(np.count_nonzero(skip)), int(np.count_nonzero(audit))
+        n_full = inside.size - n_skip - n_audit
+        self.gated += n_skip
+        self.audited += n_audit
+        self.full += n_full
+        CASCADE_GATE.inc(n_skip)
+        CASCADE_AUDIT.inc(n_audit)
+        CASCADE_FULL.inc(n_full)
+        return skip, audit, values
+
+    @staticmethod
+    def split(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(std, pico a pico) por eixo a partir dos valores de route()"""
+        return values[..., 0::2], values[..., 1::2]
+
+    def estimate(self, values: np.ndarray) -> np.ndarray:
+        """Mahalanobis marginal das features do envelope (≤ distância completa)"""
+        z = (values - self.mu) @ self.whitening.T
+        return np.sqrt(np.sum(np.square(z), axis=-1))
+
+    def record_audit(self, distance: float, threshold: float):
+        if distance > threshold:
+            self.audit_misses += 1
+            CASCADE_AUDIT_MISSES.inc()
+
+    def skip_ratio(self) -> float:
+        total = self.gated + self.audited + self.full
+        return self.gated / total if total else 0.0
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "audit_rate": self.audit_rate,
+            "envelope_features": list(GATE_FEATURES),
+            "envelope_low": self.low.tolist(),
+            "envelope_high": self.high.tolist(),
+            "gated": self.gated,
+            "audited": self.audited,
+            "full": self.full,
+            "audit_misses": self.audit_misses,
+            "skip_ratio": self.skip_ratio(),
+        }
+
+
+def gate_options_from_env() -> Dict[str, Any]:
+    try:
+        audit_rate = float(os.environ.get("CASCADE_AUDIT_RATE", DEFAULT_AUDIT_RATE))
+    except ValueError:
+        audit_rate = DEFAULT_AUDIT_RATE
+    return {
+        "enabled": os.environ.get("CASCADE_ENABLED", "").lower() in ("1", "true", "yes", "on"),
+        "audit_rate": min(max(audit_rate, 0.0), 1.0),
+    }
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Dispatcher com afinidade de sensor (modo shard)
+===============================================
+Com vários workers uvicorn atrás da mesma porta, as janelas de um sensor
+caem em processos diferentes e o histórico do detector (votação 2 de 3,
+distâncias recentes) fica espalhado. Neste modo:
+
+  - N processos api.py ("shards") rodam em portas locais;
+  - este dispatcher ouve a porta pública e encaminha POST /predict para
+    o shard dono do sensor: crc32(sensor_id) % N (estável entre processos,
+    ao contrário de hash());
+  - cada shard guarda o estado completo dos seus sensores e publica os
+    resultados no broker de estado (shared_state.py), que faz o fan-out
+    para os dashboards conectados a qualquer shard;
+  - o WebSocket /ws, /realtime/* e as demais rotas HTTP vão para os shards
+    em rodízio: só o status e as amostras em tempo real são espelhados em
+    todos (pelo broker), o resto do estado é de quem processou o sensor;
+  - leituras da frota com estado por shard (/alerts/active, /sensor/rate,
+    /sensor/quality, /sensor/drift, /sensor/timeline) são pedidas a todos os
+    shards e fundidas (listas concatenadas, contagens somadas); /status e
+    as leituras de /admin/... respondem com uma entrada por shard;
+  - POST /admin/cascade e /admin/profiler reconfiguram todos os shards;
+    /test/simulate e /test/anomaly vão ao shard dono do sensor simulado;
+  - /shard/{i}/... encaminha para um shard específico
+    (ex.: /shard/2/metrics para o Prometheus);
+  - /sensor/{sensor_id}/... vai para o shard dono do sensor;
+  - /sketches, /sensor/quantiles e /threshold/proposal (visão da frota)
+    são respondidas aqui: o dispatcher pede /sketches a todos os shards e
+    funde os sketches (SketchStore.merge_dict, QuantileSketch.merge) antes
+    de calcular quantis e proposta.
+
+O sensor_id é lido do cabeçalho X-Sensor-Id ou, sem ele, do corpo JSON
+com uma busca por regex (sem decodificar a janela inteira).
+
+Uso:
+  python dispatcher.py --shards 4
+  python start_server.py --shards 4
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, unquote
+
+import httpx
+import websockets
+
+from sketches import SketchStore
+
+logger = logging.getLogger(__name__)
+
+SHARD_ENV = "SHARD_INDEX"
+DEFAULT_BASE_PORT = 8100
+DEFAULT_SENSOR_ID = "default"  # mesmo padrão de AccelerometerData
+SENSOR_HEADER = b"x-sensor-id"
+
+_SENSOR_RE = re.compile(rb'"sensor_id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_SHARD_PATH_RE = re.compile(r"^/shard/(\d+)(/.*)$")
+_SENSOR_PATH_RE = re.compile(r"^/sensor/([^/]+)/")
+# Rotas de ingestão: o sensor_id vem do cabeçalho ou do corpo
+INGEST_PATHS = ("/predict", "/predict/features")
+# Rotas da frota: cada shard só tem os sketches dos seus sensores
+AGGREGATE_PATHS = ("/sketches", "/sensor/quantiles", "/threshold/proposal")
+# Parâmetros de /threshold/proposal (ausentes = padrão de propose_threshold)
+PROPOSAL_PARAMS = {"window": str, "quantile": float, "margin": float, "min_count": int}
+# Leituras da frota com estado por shard: chave → "concat" (listas) ou "sum"
+# (contagens por nome); as demais chaves vêm do primeiro shard. None = união
+# dos dicionários {sensor_id: ...} de cada shard
+MERGED_READS: Dict[str, Optional[Dict[str, str]]] = {
+    "/alerts/active": {"active": "concat", "counts": "sum"},
+    "/sensor/rate": {"sensors": "concat", "modes": "sum"},
+    "/sensor/quality": {"sensors": "concat", "statuses": "sum"},
+    "/sensor/drift": {"sensors": "concat", "statuses": "sum"},
+    "/sensor/timeline": None,
+}
+# Estado de cada processo, sem fusão que faça sentido: uma entrada por shard
+PER_SHARD_READS = ("/status", "/sensor/status", "/admin/cascade", "/admin/profiler",
+                   "/admin/profiler/reports")
+# Reconfiguração em tempo de execução: vale para todos os shards
+BROADCAST_WRITES = ("/admin/cascade", "/admin/profiler")
+# Endpoints de teste que geram uma janela: sensor fixo, vão ao shard dono dele
+TEST_SENSORS = {"/test/simulate": "test_simulator", "/test/anomaly": "test_anomaly"}
+# Cabeçalhos hop-by-hop não são repassados
+_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "upgrade", "host"}
+
+
+def shard_for(sensor_id: str, n_shards: int) -> int:
+    return zlib.crc32(sensor_id.encode()) % n_shards
+
+
+def merge_responses(parts: List[Dict], spec: Optional[Dict[str, str]]) -> Dict:
+    """Funde as respostas JSON dos shards segundo a regra de MERGED_READS"""
+    if spec is None:
+        merged: Dict = {}
+        for part in parts:
+            merged.update(part)
+        return merged
+    merged = dict(parts[0])
+    for key, how in spec.items():
+        values = [part[key] for part in parts if key in part]
+        if how == "concat":
+            merged[key] = [item for value in values for item in value]
+        else:
+            totals: Dict[str, float] = {}
+            for value in values:
+                for name, count in value.items():
+                    totals[name] = totals.get(name, 0) + count
+            merged[key] = totals
+    return merged
+
+
+def sensor_id_from(headers: List, body: bytes) -> str:
+    for name, value in headers:
+        if name == SENSOR_HEADER:
+            return value.decode()
+    match = _SENSOR_RE.search(body)
+    if match is None:
+        return DEFAULT_SENSOR_ID
+    return json.loads(b'"' + match.group(1) + b'"')
+
+
+class Dispatcher:
+    """Aplicação ASGI que encaminha HTTP e WebSocket para os shards"""
+
+    def __init__(self, shard_urls: List[str]):
+        self.shard_urls = [url.rstrip("/") for url in shard_urls]
+        self.client: Optional[httpx.AsyncClient] = None
+        self._round_robin = itertools.cycle(range(len(self.shard_urls)))
+        self.forwarded: Dict[int, int] = {i: 0 for i in range(len(self.shard_urls))}
+        self.errors = 0
+
+    # ------------------------------------------------------------
+    # Roteamento
+    # ------------------------------------------------------------
+    def route(self, path: str, headers: List, body: bytes, is_predict: bool):
+        """Retorna (índice do shard, caminho no shard)"""
+        match = _SHARD_PATH_RE.match(path)
+        if match and int(match.group(1)) < len(self.shard_urls):
+            return int(match.group(1)), match.group(2)
+        if is_predict:
+            return shard_for(sensor_id_from(headers, body), len(self.shard_urls)), path
+        match = _SENSOR_PATH_RE.match(path)
+        if match:
+            return shard_for(unquote(match.group(1)), len(self.shard_urls)), path
+        if path in TEST_SENSORS:
+            return shard_for(TEST_SENSORS[path], len(self.shard_urls)), path
+        return next(self._round_robin), path
+
+    # ------------------------------------------------------------
+    # Sketches da frota
+    # ------------------------------------------------------------
+    async def _get_json(self, shard: int, path: str) -> Dict:
+        response = await self.client.get(self.shard_urls[shard] + path)
+        response.raise_for_status()
+        self.forwarded[shard] += 1
+        return response.json()
+
+    async def aggregate(self, path: str, query: str, send):
+        """Funde os sketches de todos os shards e responde como um shard único"""
+        params = dict(parse_qsl(query))
+        try:
+            snapshots = await asyncio.gather(
+                *(self._get_json(i, "/sketches") for i in range(len(self.shard_urls)))
+            )
+            # Todos os shards carregam o mesmo modelo: o threshold atual vem de um deles
+            threshold = None
+            if path == "/threshold/proposal":
+                threshold = (await self._get_json(0, "/model/schema"))["threshold"]
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            self.errors += 1
+            logger.error(f"Sketches dos shards indisponíveis: {e}")
+            await self._send_json(send, 502, {"error": "sketches dos shards indisponíveis"})
+            return
+
+        try:
+            store = SketchStore(float(snapshots[0]["alpha"]))
+            for snapshot in snapshots:
+                store.merge_dict(snapshot)
+            if path == "/sketches":
+                data = store.to_dict()
+            elif path == "/sensor/quantiles":
+                data = store.quantiles_report(params.get("window", "1h"))
+            else:
+                options = {name: cast(params[name]) for name, cast in PROPOSAL_PARAMS.items()
+                           if name in params}
+                data = store.propose_threshold(None, threshold, **options)
+        except ValueError as e:
+            await self._send_json(send, 400, {"error": str(e)})
+            return
+        data["merged_shards"] = len(snapshots)
+        await self._send_json(send, 200, data)
+
+    # ------------------------------------------------------------
+    # Leituras e comandos em todos os shards
+    # ------------------------------------------------------------
+    async def _fan_out(self, method: str, path: str, query: str, headers: List,
+                       body: bytes, send) -> Optional[List[httpx.Response]]:
+        """Mesma requisição a todos os shards; None (já respondido 502) se algum falha"""
+        suffix = "?" + query if query else ""
+        try:
+            responses = await asyncio.gather(*(
+                self.client.request(method, url + path + suffix, headers=headers, content=body)
+                for url in self.shard_urls
+            ))
+        except httpx.HTTPError as e:
+            self.errors += 1
+            logger.error(f"{method} {path}: shard indisponível: {e}")
+            await self._send_json(send, 502, {"error": "shard indisponível"})
+            return None
+        for shard in range(len(responses)):
+            self.forwarded[shard] += 1
+        return responses
+
+    async def fan_out(self, method: str, path: str, query: str, headers: List, body: bytes, send):
+        responses = await self._fan_out(method, path, query, headers, body, send)
+        if responses is None:
+            return
+        failed = next((r for r in responses if r.status_code >= 400), None)
+        try:
+            parts = [r.json() for r in responses]
+        except ValueError:
+            self.errors += 1
+            await self._send_json(send, 502, {"error": "resposta inválida de um shard"})
+            return
+
+        if method == "GET" and path in MERGED_READS:
+            if failed is not None:
+                # Ex.: /sensor/drift sem histograma (409): mesmo erro em todos
+                await self._send_json(send, failed.status_code, failed.json())
+                return
+            data = merge_responses(parts, MERGED_READS[path])
+            data["merged_shards"] = len(parts)
+        else:
+            # Posição na lista = índice do shard (como em /shard/{i}/...)
+            data = {"shards": parts}
+            if path == "/status":
+                data["dispatcher"] = self.status()
+        await self._send_json(send, failed.status_code if failed is not None else 200, data)
+
+    def status(self) -> Dict:
+        return {
+            "shards": self.shard_urls,
+            "forwarded": self.forwarded,
+            "errors": self.errors,
+        }
+
+    # ------------------------------------------------------------
+    # ASGI
+    # ------------------------------------------------------------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self.proxy_http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self.proxy_websocket(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(30.0, connect=2.0),
+                    limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100),
+                )
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.client:
+                    await self.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _send_json(self, send, status: int, data):
+        body = json.dumps(data).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def proxy_http(self, scope, receive, send):
+        path = scope["path"]
+        if path == "/dispatcher/status":
+            await self._send_json(send, 200, self.status())
+            return
+
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+
+        if scope["method"] == "GET" and path in AGGREGATE_PATHS:
+            await self.aggregate(path, scope["query_string"].decode(), send)
+            return
+        if (scope["method"] == "GET" and (path in MERGED_READS or path in PER_SHARD_READS)) or (
+                scope["method"] == "POST" and path in BROADCAST_WRITES):
+            headers = [(k, v) for k, v in scope["headers"] if k.decode().lower() not in _HOP_HEADERS]
+            await self.fan_out(scope["method"], path, scope["query_string"].decode(), headers, body, send)
+            return
+
+        is_predict = scope["method"] == "POST" and path in INGEST_PATHS
+        shard, shard_path = self.route(path, scope["headers"], body, is_predict)
+        url = self.shard_urls[shard] + shard_path
+        if scope["query_string"]:
+            url += "?" + scope["query_string"].decode()
+        headers = [(k, v) for k, v in scope["headers"] if k.decode().lower() not in _HOP_HEADERS]
+
+        try:
+            request = self.client.build_request(scope["method"], url, headers=headers, content=body)
+            response = await self.client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            self.errors += 1
+            logger.error(f"Shard {shard} indisponível: {e}")
+            await self._send_json(send, 502, {"error": f"shard {shard} indisponível"})
+            return
+
+        self.forwarded[shard] += 1
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [
+                    (k, v) for k, v in response.headers.raw if k.decode().lower() not in _HOP_HEADERS
+                ],
+            })
+            # Streams longos (SSE): para quando o cliente desconecta
+            disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+            async for chunk in response.aiter_raw():
+                if disconnected.done():
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            disconnected.cancel()
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def proxy_websocket(self, scope, receive, send):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+
+        shard, shard_path = self.route(scope["path"], scope["headers"], b"", False)
+        url = self.shard_urls[shard].replace("http://", "ws://", 1) + shard_path
+        if scope["query_string"]:
+            url += "?" + scope["query_string"].decode()
+
+        try:
+            upstream = await websockets.connect(url, max_size=None)
+        except (OSError, websockets.WebSocketException) as e:
+            self.errors += 1
+            logger.error(f"WebSocket: shard {shard} indisponível: {e}")
+            await send({"type": "websocket.close", "code": 1011})
+            return
+
+        self.forwarded[shard] += 1
+        await send({"type": "websocket.accept"})
+
+        async def client_to_shard():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("text") is not None:
+                    await upstream.send(message["text"])
+                elif message.get("bytes") is not None:
+                    await upstream.send(message["bytes"])
+
+        async def shard_to_client():
+            async for data in upstream:
+                if isinstance(data, str):
+                    await send({"type": "websocket.send", "text": data})
+                else:
+                    await send({"type": "websocket.send", "bytes": data})
+            await send({"type": "websocket.close", "code": 1000})
+
+        tasks = [asyncio.ensure_future(client_to_shard()), asyncio.ensure_future(shard_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        except Exception as e:
+            logger.debug(f"WebSocket encerrado: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+
+
+# ============================================================
+# INICIALIZAÇÃO DOS SHARDS
+# ============================================================
+def spawn_shards(n_shards: int, base_port: int, log_level: str = "warning") -> List[subprocess.Popen]:
+    """Inicia N processos api.py em portas locais consecutivas"""
+    script_dir = Path(__file__).resolve().parent
+    procs = []
+    for i in range(n_shards):
+        env = dict(os.environ, **{SHARD_ENV: str(i)})
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app",
+             "--host", "127.0.0.1", "--port", str(base_port + i), "--log-level", log_level],
+            cwd=script_dir, env=env,
+        ))
+    return procs
+
+
+def wait_ready(urls: List[str], procs: List[subprocess.Popen], timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    pending = list(zip(urls, procs))
+    while pending:
+        url, proc = pending[0]
+        if proc.poll() is not None:
+            raise RuntimeError(f"Shard {url} terminou durante a inicialização")
+        try:
+            if httpx.get(url + "/health", timeout=0.5).status_code == 200:
+                pending.pop(0)
+                continue
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Shard {url} não respondeu em {timeout:.0f}s")
+        time.sleep(0.1)
+
+
+def serve(n_shards: int, port: int, base_port: int = DEFAULT_BASE_PORT, broker_port: int = 8799):
+    """Broker + N shards + dispatcher na porta pública (bloqueia)"""
+    import uvicorn
+    from shared_state import spawn_broker
+
+    broker = spawn_broker(port=broker_port)
+    shards = spawn_shards(n_shards, base_port)
+    urls = [f"http://127.0.0.1:{base_port + i}" for i in range(n_shards)]
+    try:
+        wait_ready(urls, shards)
+        logger.info("🔀 %d shards prontos; dispatcher em :%d", n_shards, port)
+        uvicorn.run(Dispatcher(urls), host="0.0.0.0", port=port, log_level="info", access_log=False)
+    finally:
+        for proc in shards + [broker]:
+            proc.send_signal(signal.SIGTERM)
+        for proc in shards + [broker]:
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dispatcher com afinidade de sensor")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--port", type=int, default=8000, help="Porta pública")
+    parser.add_argument("--base-port", type=int, default=DEFAULT_BASE_PORT,
+                        help="Porta do primeiro shard (os demais usam as seguintes)")
+    parser.add_argument("--broker-port", type=int, default=8799)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    os.chdir(Path(__file__).resolve().parent)
+    serve(args.shards, args.port, args.base_port, args.broker_port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Deriva das features em relação ao treinamento.
+
+mu e cov descrevem as janelas normais do treinamento; quando a máquina, a
+montagem do sensor ou o ambiente mudam, a distribuição das features ao vivo
+se afasta delas e a primeira notícia era uma enxurrada de falsos positivos
+(e outra rodada de calibrate_sensor.py). O monitor compara, por sensor, o
+histograma ao vivo de cada feature com o do treinamento:
+
+  - bordas fixas por feature, gravadas no artefato do modelo: decis das
+    features das janelas normais (drift_edges/drift_expected do modelo, ver
+    calibration.py); sem elas, decis da normal N(μ, σ²) de cada feature;
+  - cada janela só entra numa lista do sensor (custo de um append); a
+    contagem nos baldes é feita em lote, um np.count_nonzero sobre
+    (janelas × features × bordas) e um np.bincount, na próxima avaliação ou
+    a cada MAX_PENDING janelas;
+  - a cada DRIFT_INTERVAL_S segundos os escores são recalculados e as
+    contagens decaem com meia-vida DRIFT_HALF_LIFE_S (o histograma reflete
+    a última hora, não o servidor inteiro);
+  - PSI = Σ (a − e)·ln(a/e) por feature (< 0,1 estável, 0,1–0,25 moderado,
+    > 0,25 significativo) e KS = maior diferença entre as CDFs acumuladas
+    pelos baldes; o estado do sensor é o da pior feature.
+
+Com a cascata ligada, só std, rms e pico a pico de cada eixo (as features
+calculadas em toda janela) entram no monitor: as demais só existiriam para as janelas fora
+do envelope e o histograma delas pareceria deriva.
+"""
+
+import os
+import time
+from statistics import NormalDist
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+DRIFT_BINS = 10
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+PSI_EPSILON = 1e-4  # proporção mínima por balde (evita log 0)
+
+DEFAULT_INTERVAL_S = 60.0
+DEFAULT_HALF_LIFE_S = 3600.0
+DEFAULT_MIN_WINDOWS = 200
+MAX_PENDING = 1024
+
+STATUSES = ("insufficient", "stable", "moderate", "significant")
+
+
+# ============================================================
+# HISTOGRAMA DE REFERÊNCIA
+# ============================================================
+def bin_counts(features: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Contagem (F, B) das janelas (N, F) nos baldes (−∞, e₀], (e₀, e₁], ..., (e_last, ∞)"""
+    index = np.count_nonzero(features[..., None] > edges, axis=-1)
+    n_bins = edges.shape[1] + 1
+    return np.stack([np.bincount(index[:, f], minlength=n_bins) for f in range(edges.shape[0])])
+
+
+def reference_histogram(features: np.ndarray, bins: int = DRIFT_BINS) -> Tuple[np.ndarray, np.ndarray]:
+    """Bordas nos quantis das features de treino (N, F) e a proporção real de cada balde"""
+    features = np.asarray(features, dtype=np.float64)
+    if features.ndim != 2 or features.shape[0] < bins:
+        raise ValueError(f"São precisas ao menos {bins} janelas para o histograma de referência")
+    edges = np.quantile(features, np.linspace(0.0, 1.0, bins + 1)[1:-1], axis=0).T
+    counts = bin_counts(features, edges)
+    return edges, counts / features.shape[0]
+
+
+def gaussian_histogram(mu: np.ndarray, cov: np.ndarray, bins: int = DRIFT_BINS) -> Tuple[np.ndarray, np.ndarray]:
+    """Sem features de treino: decis de N(μ, σ²) de cada feature, 1/B por balde"""
+    z = np.array([NormalDist().inv_cdf(q) for q in np.linspace(0.0, 1.0, bins + 1)[1:-1]])
+    edges = mu[:, None] + np.sqrt(np.diag(cov))[:, None] * z[None, :]
+    return edges, np.full((mu.shape[0], bins), 1.0 / bins)
+
+
+# ============================================================
+# MONITOR
+# ============================================================
+class SensorDrift:
+    __slots__ = ("counts", "pending", "psi", "ks", "status", "since")
+
+    def __init__(self, shape: Tuple[int, int], now: float):
+        self.counts = np.zeros(shape)
+        # Janelas ainda não contadas (vetores de features; NaN = feature ausente)
+        self.pending: List[np.ndarray] = []
+        self.psi: Optional[np.ndarray] = None
+        self.ks: Optional[np.ndarray] = None
+        self.status = "insufficient"
+        self.since = now
+
+
+def _nan_to_none(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+
+class DriftMonitor:
+    def __init__(self, edges: np.ndarray, expected: np.ndarray, feature_names: Sequence[str],
+                 kind: str = "empirical", interval_s: float = DEFAULT_INTERVAL_S,
+                 half_life_s: float = DEFAULT_HALF_LIFE_S, min_windows: int = DEFAULT_MIN_WINDOWS,
+                 clock: Callable[[], float] = time.time):
+        self.edges = edges
+        self.expected = expected
+        self.feature_names = list(feature_names)
+        self.kind = kind
+        self.interval_s = interval_s
+        self.half_life_s = half_life_s
+        self.min_windows = min_windows
+        self.clock = clock
+        self.sensors: Dict[str, SensorDrift] = {}
+        self.evaluated_at: Optional[float] = None
+
+        self._blank = np.full(edges.shape[0], np.nan)
+        # Deslocamento de cada feature no histograma achatado (F·B baldes)
+        self._offsets = np.arange(edges.shape[0]) * expected.shape[1]
+        # Proporção esperada (com o piso do PSI) e sua CDF são fixas: calculadas uma vez
+        self._expected_floor = np.maximum(expected, PSI_EPSILON)
+        self._expected_cdf = np.cumsum(expected, axis=1)
+
+    @classmethod
+    def from_artifact(cls, model: Mapping[str, np.ndarray], feature_names: Sequence[str],
+                      **kwargs: Any) -> Optional["DriftMonitor"]:
+        """Histograma de referência gravado no artefato; None se o artefato não tem"""
+        if "drift_edges" not in model:
+            return None
+        return cls(model["drift_edges"], model["drift_expected"], feature_names,
+                   str(model["drift_kind"]), **kwargs)
+
+    def observe(self, sensor_id: str, features: np.ndarray, index: Optional[np.ndarray] = None):
+        """Adiciona uma janela ao sensor; index = quais features vieram (None = todas)"""
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            state = self.sensors[sensor_id] = SensorDrift(self.expected.shape, self.clock())
+        if index is not None:
+            partial, features = features, self._blank.copy()
+            features[index] = partial
+        state.pending.append(features)
+        if len(state.pending) >= MAX_PENDING:
+            self._flush(state)
+
+    def _flush(self, state: SensorDrift):
+        """Conta as janelas pendentes nos baldes, todas de uma vez"""
+        if not state.pending:
+            return
+        windows = np.array(state.pending)
+        state.pending.clear()
+        bins = np.count_nonzero(windows[:, :, None] > self.edges, axis=-1) + self._offsets
+        counts = np.bincount(bins[~np.isnan(windows)], minlength=state.counts.size)
+        state.counts += counts.reshape(state.counts.shape)
+
+    def evaluate(self) -> List[Tuple[str, str, str]]:
+        """
+        Recalcula PSI e KS de todos os sensores e aplica o decaimento.
+        Retorna (sensor_id, estado anterior, estado novo) dos que mudaram.
+        """
+        now = self.clock()
+        elapsed = self.interval_s if self.evaluated_at is None else now - self.evaluated_at
+        decay = 0.5 ** (elapsed / self.half_life_s) if self.half_life_s > 0 else 1.0
+        self.evaluated_at = now
+
+        changed = []
+        for sensor_id, state in self.sensors.items():
+            self._flush(state)
+            totals = state.counts.sum(axis=1)
+            enough = totals >= self.min_windows
+            with np.errstate(divide="ignore", invalid="ignore"):
+                actual = state.counts / totals[:, None]
+            observed = np.maximum(actual, PSI_EPSILON)
+            psi = np.sum((observed - self._expected_floor) * np.log(observed / self._expected_floor), axis=1)
+            ks = np.max(np.abs(np.cumsum(actual, axis=1) - self._expected_cdf), axis=1)
+            state.psi = np.where(enough, psi, np.nan)
+            state.ks = np.where(enough, ks, np.nan)
+
+            status = "insufficient"
+            if enough.any():
+                worst = np.nanmax(state.psi)
+                status = ("significant" if worst > PSI_SIGNIFICANT
+                          else "moderate" if worst > PSI_MODERATE else "stable")
+            if status != state.status:
+                changed.append((sensor_id, state.status, status))
+                state.status = status
+                state.since = now
+            state.counts *= decay
+        return changed
+
+    def _worst(self, state: SensorDrift) -> Dict[str, Any]:
+        if state.psi is None or np.all(np.isnan(state.psi)):
+            return {"psi_max": None, "ks_max": None, "worst_feature": None}
+        worst = int(np.nanargmax(state.psi))
+        return {
+            "psi_max": float(state.psi[worst]),
+            "ks_max": float(np.nanmax(state.ks)),
+            "worst_feature": self.feature_names[worst],
+        }
+
+    def sensor_summary(self, sensor_id: str) -> Dict[str, Any]:
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            return {"sensor_id": sensor_id, "status": None}
+        return {
+            "sensor_id": sensor_id,
+            "status": state.status,
+            "for_s": self.clock() - state.since,
+            **self._worst(state),
+        }
+
+    def sensor_stats(self, sensor_id: str) -> Dict[str, Any]:
+        """Resumo do sensor e, por feature, PSI, KS, janelas (com decaimento) e proporções ao vivo"""
+        summary = self.sensor_summary(sensor_id)
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            return summary
+        self._flush(state)
+        totals = state.counts.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            actual = state.counts / totals[:, None]
+        nan = np.full(len(self.feature_names), np.nan)
+        psi = _nan_to_none(state.psi if state.psi is not None else nan)
+        ks = _nan_to_none(state.ks if state.ks is not None else nan)
+        summary["features"] = {
+            name: {
+                "psi": psi[i],
+                "ks": ks[i],
+                "windows": float(totals[i]),
+                "actual": _nan_to_none(actual[i]) if totals[i] else None,
+            }
+            for i, name in enumerate(self.feature_names)
+        }
+        return summary
+
+    def status_counts(self) -> Dict[str, int]:
+        counts = {status: 0 for status in STATUSES}
+        for state in self.sensors.values():
+            counts[state.status] += 1
+        return counts
+
+    def worst_scores(self):
+        """(sensor_id, maior PSI, maior KS) dos sensores já avaliados"""
+        for sensor_id, state in list(self.sensors.items()):
+            worst = self._worst(state)
+            if worst["psi_max"] is not None:
+                yield sensor_id, worst["psi_max"], worst["ks_max"]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "bins": int(self.expected.shape[1]),
+            "interval_s": self.interval_s,
+            "half_life_s": self.half_life_s,
+            "min_windows": self.min_windows,
+            "psi_moderate": PSI_MODERATE,
+            "psi_significant": PSI_SIGNIFICANT,
+            "evaluated_at": self.evaluated_at,
+        }
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def drift_options_from_env() -> Dict[str, Any]:
+    return {
+        "interval_s": max(1.0, _env_number("DRIFT_INTERVAL_S", DEFAULT_INTERVAL_S)),
+        "half_life_s": max(0.0, _env_number("DRIFT_HALF_LIFE_S", DEFAULT_HALF_LIFE_S)),
+        "min_windows": int(max(1, _env_number("DRIFT_MIN_WINDOWS", DEFAULT_MIN_WINDOWS))),
+    }
@@ -52,6 +52,10 @@ Adafruit_MPU6050 mpu;
 String serverUrl;
 unsigned long lastSendTime = 0;
 unsigned long totalSamplesSent = 0;
+unsigned long sampleSeq = 0;          // Contador de amostras coletadas (seq)
+unsigned long batchStartMs = 0;       // millis() da 1ª amostra do batch
+unsigned long batchSeq = 0;           // seq da 1ª amostra do batch
+unsigned long uploadPauseMs = 0;      // Pausa extra pedida pelo servidor (rate.interval_ms)
 bool mpuInitialized = false;
 
 // ============================================================
@@ -158,6 +162,11 @@ bool collectSensorData(float* dataBuffer, int numSamples) {
   unsigned long sampleInterval = 1000000 / SAMPLE_RATE_HZ;  // microsegundos
   unsigned long nextSampleTime = micros();
   
+  // Tempo e posição da 1ª amostra, enviados com o batch (timeline no servidor)
+  batchStartMs = millis();
+  batchSeq = sampleSeq;
+  sampleSeq += numSamples;
+  
   for (int i = 0; i < numSamples; i++) {
     // Aguarda o momento certo para coletar
     while (micros() < nextSampleTime) {
@@ -196,16 +205,19 @@ bool sendDataToServer(float* dataBuffer, int numSamples) {
   }
   
   // Monta o JSON no formato esperado pela API
-  // {"data": [[x,y,z], [x,y,z], ...], "sensor_id": "..."}
+  // {"data": [[x,y,z], ...], "sensor_id": "...", "sample_rate": 200, "t0_ms": ..., "seq": ...}
   
   // Calcula tamanho necessário para o JSON
-  const size_t jsonCapacity = JSON_OBJECT_SIZE(2) + 
+  const size_t jsonCapacity = JSON_OBJECT_SIZE(5) + 
                                JSON_ARRAY_SIZE(numSamples) + 
                                numSamples * JSON_ARRAY_SIZE(3) + 
                                512;
   
   DynamicJsonDocument doc(jsonCapacity);
   doc["sensor_id"] = SENSOR_ID;
+  doc["sample_rate"] = SAMPLE_RATE_HZ;
+  doc["t0_ms"] = batchStartMs;
+  doc["seq"] = batchSeq;
   
   JsonArray dataArray = doc.createNestedArray("data");
   
@@ -237,15 +249,30 @@ bool sendDataToServer(float* dataBuffer, int numSamples) {
     if (httpCode == HTTP_CODE_OK) {
       String response = http.getString();
       
-      // Parse da resposta
-      DynamicJsonDocument respDoc(1024);
-      DeserializationError error = deserializeJson(respDoc, response);
+      // Parse da resposta (só os campos usados; o resultado completo é maior)
+      StaticJsonDocument<128> filter;
+      filter["is_anomaly"] = true;
+      filter["confidence"] = true;
+      filter["distance"] = true;
+      filter["rate"]["mode"] = true;
+      filter["rate"]["interval_ms"] = true;
+      DynamicJsonDocument respDoc(512);
+      DeserializationError error = deserializeJson(respDoc, response,
+                                                   DeserializationOption::Filter(filter));
       
       if (!error) {
         bool isAnomaly = respDoc["is_anomaly"] | false;
         float confidence = respDoc["confidence"] | 0.0f;
         float distance = respDoc["distance"] | 0.0f;
         
+        // Diretiva de taxa: máquina calma envia menos, perto do threshold volta ao normal
+        unsigned long pause = respDoc["rate"]["interval_ms"] | 0UL;
+        if (pause != uploadPauseMs) {
+          Serial.printf("[Taxa] Modo %s: pausa de %lu ms entre envios\n",
+                        respDoc["rate"]["mode"] | "full", pause);
+          uploadPauseMs = pause;
+        }
+        
         Serial.println("\n[Resultado] ==================");
         Serial.printf("[Resultado] Anomalia: %s\n", isAnomaly ? "SIM ⚠️" : "NÃO ✓");
         Serial.printf("[Resultado] Confiança: %.1f%%\n", confidence * 100);
@@ -335,7 +362,7 @@ void loop() {
   }
   
   // Envia dados no intervalo configurado
-  if (currentTime - lastSendTime >= SEND_INTERVAL_MS) {
+  if (currentTime - lastSendTime >= SEND_INTERVAL_MS + uploadPauseMs) {
     lastSendTime = currentTime;
     
     // Aloca buffer para os dados
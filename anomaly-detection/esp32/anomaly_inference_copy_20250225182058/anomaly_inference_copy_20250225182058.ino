@@ -8,15 +8,26 @@
 const int LED_PIN = 2;
 const char* WIFI_SSID = "your_network_here";
 const char* WIFI_PASS = "your_password_here";
-const char* SERVER_URL = "http://your_api_ip_here:8000/predict";  // Endpoint da API de inferência
+const char* SERVER_URL = "http://your_api_ip_here:8000/predict";  // Endpoint da API de inferência (bruto)
+const char* FEATURES_URL = "http://your_api_ip_here:8000/predict/features";  // Features calculadas aqui
+// schema_id de GET /model/schema (muda se o modelo mudar nomes/ordem das features)
+const char* FEATURE_SCHEMA_ID = "01ca6500";
+const char* SENSOR_ID = "esp32_edge_01";
 
 const int SAMPLE_RATE = 200;
 const int NUM_SAMPLES = 100;  // 0.5 segundos de dados em 200Hz
 const int I2C_SDA = 21, I2C_SCL = 22;
+const int NUM_AXES = 3;
+const int FEATURES_PER_AXIS = 5;  // std, kurtosis, peak_amplitude, rms, peak_to_peak
 
 Adafruit_MPU6050 mpu;
 HTTPClient http;
 
+float samplesBuf[NUM_SAMPLES][NUM_AXES];
+unsigned long sampleSeq = 0;      // contador de amostras coletadas
+unsigned long rawUntilMs = 0;     // servidor pediu amostras brutas até este millis()
+unsigned long uploadPauseMs = 0;  // pausa extra pedida pelo servidor (rate.interval_ms)
+
 void blinkLED(int times, int delayMs) {
     for (int i = 0; i < times; i++) {
         digitalWrite(LED_PIN, HIGH);
@@ -53,8 +64,8 @@ void setup() {
     Serial.printf("\nConectado! IP: %s\n", WiFi.localIP().toString().c_str());
 }
 
-void sendData(JsonDocument& json) {
-  http.begin(SERVER_URL);
+void sendData(const char* url, JsonDocument& json) {
+  http.begin(url);
   http.addHeader("Content-Type", "application/json");
   String jsonString;
   serializeJson(json, jsonString);
@@ -66,12 +77,26 @@ void sendData(JsonDocument& json) {
       String response = http.getString();
       
       // Parse da resposta da API
-      DynamicJsonDocument responseDoc(1024);
-      deserializeJson(responseDoc, response);
+      // Só os campos usados (o resultado completo traz as features por eixo)
+      StaticJsonDocument<128> filter;
+      filter["is_anomaly"] = true;
+      filter["distance"] = true;
+      filter["send_raw_seconds"] = true;
+      filter["rate"]["interval_ms"] = true;
+      DynamicJsonDocument responseDoc(512);
+      deserializeJson(responseDoc, response, DeserializationOption::Filter(filter));
       
       bool isAnomaly = responseDoc["is_anomaly"].as<bool>();
       float distance = responseDoc["distance"].as<float>();
       
+      // Servidor pode pedir amostras brutas por alguns segundos
+      float rawSeconds = responseDoc["send_raw_seconds"] | 0.0f;
+      if (rawSeconds > 0) {
+        rawUntilMs = millis() + (unsigned long)(rawSeconds * 1000);
+      }
+      // Diretiva de taxa: pausa entre janelas quando a máquina está calma
+      uploadPauseMs = responseDoc["rate"]["interval_ms"] | 0UL;
+      
       // Feedback visual
       if (isAnomaly) {
         blinkLED(3, 100);  // Pisca 3x rápido se for anomalia
@@ -84,13 +109,47 @@ void sendData(JsonDocument& json) {
   http.end();
 }
 
+// Mesmas features do servidor (api.py: extract_features sobre a janela sem média)
+void computeFeatures(float* features, float* mins, float* maxs, float* means) {
+  for (int a = 0; a < NUM_AXES; a++) {
+    double sum = 0;
+    float mn = samplesBuf[0][a], mx = samplesBuf[0][a];
+    for (int i = 0; i < NUM_SAMPLES; i++) {
+      float v = samplesBuf[i][a];
+      sum += v;
+      if (v < mn) mn = v;
+      if (v > mx) mx = v;
+    }
+    double mean = sum / NUM_SAMPLES;
+    
+    double m2 = 0, m4 = 0, peak = 0;
+    for (int i = 0; i < NUM_SAMPLES; i++) {
+      double c = samplesBuf[i][a] - mean;
+      double c2 = c * c;
+      m2 += c2;
+      m4 += c2 * c2;
+      if (fabs(c) > peak) peak = fabs(c);
+    }
+    m2 /= NUM_SAMPLES;
+    m4 /= NUM_SAMPLES;
+    
+    float* f = features + a * FEATURES_PER_AXIS;
+    f[0] = sqrt(m2);                               // std
+    f[1] = m2 > 0 ? (m4 / (m2 * m2) - 3.0) : 0.0;  // kurtosis (Fisher)
+    f[2] = peak;                                   // peak_amplitude
+    f[3] = sqrt(m2);                               // rms (da janela sem média)
+    f[4] = mx - mn;                                // peak_to_peak
+    
+    mins[a] = mn;
+    maxs[a] = mx;
+    means[a] = mean;
+  }
+}
+
 void loop() {
-  // Prepare JSON (mudança no formato para matriz 2D)
-  DynamicJsonDocument json(16384);
-  JsonArray data = json.createNestedArray("data");
-  
   // Collect data
   unsigned long startTime = millis();
+  unsigned long windowSeq = sampleSeq;
   int samples = 0;
   
   while (samples < NUM_SAMPLES) {
@@ -98,11 +157,9 @@ void loop() {
       sensors_event_t accel, gyro, temp;
       mpu.getEvent(&accel, &gyro, &temp);
       
-      // Criar array [x,y,z] para cada amostra
-      JsonArray sample = data.createNestedArray();
-      sample.add(accel.acceleration.x);
-      sample.add(accel.acceleration.y);
-      sample.add(accel.acceleration.z);
+      samplesBuf[samples][0] = accel.acceleration.x;
+      samplesBuf[samples][1] = accel.acceleration.y;
+      samplesBuf[samples][2] = accel.acceleration.z;
       
       if (samples % 50 == 0) {
         Serial.printf("Sample %d: X:%.2f Y:%.2f Z:%.2f\n", 
@@ -112,10 +169,50 @@ void loop() {
       samples++;
     }
   }
+  sampleSeq += NUM_SAMPLES;
   
-  // Send data
   digitalWrite(LED_PIN, HIGH);
-  sendData(json);
+  if (millis() < rawUntilMs) {
+    // Modo bruto (pedido pelo servidor): matriz 2D como antes
+    DynamicJsonDocument json(16384);
+    json["sensor_id"] = SENSOR_ID;
+    json["sample_rate"] = SAMPLE_RATE;
+    json["t0_ms"] = startTime;
+    json["seq"] = windowSeq;
+    JsonArray data = json.createNestedArray("data");
+    for (int i = 0; i < NUM_SAMPLES; i++) {
+      JsonArray sample = data.createNestedArray();
+      sample.add(samplesBuf[i][0]);
+      sample.add(samplesBuf[i][1]);
+      sample.add(samplesBuf[i][2]);
+    }
+    sendData(SERVER_URL, json);
+  } else {
+    // Modo features: 15 números + digest em vez de 300
+    float features[NUM_AXES * FEATURES_PER_AXIS];
+    float mins[NUM_AXES], maxs[NUM_AXES], means[NUM_AXES];
+    computeFeatures(features, mins, maxs, means);
+    
+    DynamicJsonDocument json(2048);
+    json["sensor_id"] = SENSOR_ID;
+    json["schema_id"] = FEATURE_SCHEMA_ID;
+    json["n_samples"] = NUM_SAMPLES;
+    json["sample_rate"] = SAMPLE_RATE;
+    json["t0_ms"] = startTime;
+    json["seq"] = windowSeq;
+    JsonArray f = json.createNestedArray("features");
+    for (int i = 0; i < NUM_AXES * FEATURES_PER_AXIS; i++) f.add(features[i]);
+    JsonObject digest = json.createNestedObject("digest");
+    JsonArray dMin = digest.createNestedArray("min");
+    JsonArray dMax = digest.createNestedArray("max");
+    JsonArray dMean = digest.createNestedArray("mean");
+    for (int a = 0; a < NUM_AXES; a++) {
+      dMin.add(mins[a]);
+      dMax.add(maxs[a]);
+      dMean.add(means[a]);
+    }
+    sendData(FEATURES_URL, json);
+  }
   digitalWrite(LED_PIN, LOW);
-  delay(100);
-}
\ No newline at end of file
+  delay(100 + uploadPauseMs);
+}
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Simulador de Frota de Sensores ESP32
+====================================
+Gera carga realista contra o servidor com centenas de sensores simultâneos,
+para dimensionar a máquina antes de adicionar uma linha de produção.
+
+Cada sensor é uma tarefa asyncio que envia janelas na taxa configurada,
+com sessão HTTP própria (como um ESP32 real). Um ouvinte WebSocket em /ws
+casa cada broadcast de predição com o envio correspondente e mede a latência
+ponta a ponta (envio → broadcast).
+
+Fontes de sinal:
+  synth   - sinais sintéticos gerados com NumPy (vibração + ruído + gravidade)
+  replay  - janelas reais de datasets/ac/* (normais e anômalas)
+
+Uso:
+  python fleet_simulator.py --sensors 200 --rate 1 --duration 60
+  python fleet_simulator.py --source replay --anomaly-every 30 --anomaly-duration 10
+  python fleet_simulator.py --dropout-prob 0.01 --report fleet_report.json
+  python fleet_simulator.py --retry-prob 0.05   # reenvios (ack perdido), deduplicados por seq
+  python fleet_simulator.py --ignore-rate       # cadência fixa, sem seguir a diretiva "rate"
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+import aiohttp
+import numpy as np
+
+from recording import load_windows
+
+SAMPLE_RATE = 200  # Hz
+DATASET_PATH = Path(__file__).parent / "datasets" / "ac"
+NORMAL_OPS = ["silent_0_baseline"]
+ANOMALY_OPS = ["medium_0", "high_0", "medium_1", "high_1"]
+
+
+# ============================================================
+# FONTES DE SINAL
+# ============================================================
+class SynthSource:
+    """Sinais sintéticos: gravidade + vibração senoidal da máquina + ruído"""
+
+    def __init__(self, window_size: int, seed: int):
+        self.window_size = window_size
+        self.rng = np.random.default_rng(seed)
+        self.t = np.arange(window_size)[:, None] / SAMPLE_RATE
+
+    def window(self, sensor_idx: int, anomaly: bool) -> np.ndarray:
+        # Frequência de rotação levemente diferente por sensor
+        freq = 25.0 + (sensor_idx % 7)
+        amplitude = 2.5 if anomaly else 0.05
+        noise = 1.5 if anomaly else 0.03
+        phase = self.rng.uniform(0, 2 * np.pi, size=3)
+        vibration = amplitude * np.sin(2 * np.pi * freq * self.t + phase)
+        window = vibration + self.rng.normal(0.0, noise, size=(self.window_size, 3))
+        window[:, 2] += 9.8
+        return window
+
+
+class ReplaySource:
+    """Reproduz janelas reais gravadas em datasets/ac/*"""
+
+    def __init__(self, window_size: int, seed: int, max_files: int = 300):
+        self.window_size = window_size
+        self.rng = np.random.default_rng(seed)
+        self.normal = self._load(NORMAL_OPS, max_files)
+        self.anomaly = self._load(ANOMALY_OPS, max_files)
+        print(f"📁 Replay: {len(self.normal)} janelas normais, {len(self.anomaly)} anômalas")
+
+    def _load(self, operations: List[str], max_files: int) -> np.ndarray:
+        recorded = load_windows([DATASET_PATH / op for op in operations], max_files, self.rng)
+        if not recorded:
+            raise ValueError(f"Nenhum arquivo encontrado em {DATASET_PATH} para {operations}")
+
+        windows = []
+        for data in recorded:
+            if data.shape[1] != 3 or len(data) == 0:
+                continue
+            # Ajusta ao tamanho pedido (corta ou repete)
+            reps = -(-self.window_size // len(data))
+            windows.append(np.tile(data, (reps, 1))[: self.window_size])
+        return np.stack(windows)
+
+    def window(self, sensor_idx: int, anomaly: bool) -> np.ndarray:
+        pool = self.anomaly if anomaly else self.normal
+        return pool[self.rng.integers(len(pool))]
+
+
+# ============================================================
+# AGENDA DE ANOMALIAS
+# ============================================================
+class AnomalySchedule:
+    """
+    A cada `every` segundos abre um episódio de `duration` segundos em que
+    uma fração dos sensores (sorteada por episódio) envia dados anômalos.
+    """
+
+    def __init__(self, n_sensors: int, every: float, duration: float, fraction: float, seed: int):
+        self.n_sensors = n_sensors
+        self.every = every
+        self.duration = duration
+        self.fraction = fraction
+        self.rng = random.Random(seed)
+        self._episode = -1
+        self._affected: set = set()
+
+    def is_anomalous(self, sensor_idx: int, elapsed: float) -> bool:
+        if self.every <= 0 or self.fraction <= 0:
+            return False
+        episode, offset = divmod(elapsed, self.every)
+        if offset >= self.duration:
+            return False
+        if episode != self._episode:
+            self._episode = episode
+            k = max(1, int(round(self.n_sensors * self.fraction)))
+            self._affected = set(self.rng.sample(range(self.n_sensors), k))
+        return sensor_idx in self._affected
+
+
+# ============================================================
+# ESTATÍSTICAS
+# ============================================================
+@dataclass
+class FleetStats:
+    sent: int = 0
+    ok: int = 0
+    errors: int = 0
+    anomalies_sent: int = 0
+    anomalies_detected: int = 0
+    dropouts: int = 0
+    reconnects: int = 0
+    late_ticks: int = 0
+    broadcasts: int = 0
+    retries: int = 0
+    duplicates_acked: int = 0
+    # Janelas por modo de envio devolvido pelo servidor e pausa total pedida
+    rate_modes: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    rate_pause_s: float = 0.0
+    http_latencies: List[float] = field(default_factory=list)
+    e2e_latencies: List[float] = field(default_factory=list)
+    # Envios aguardando broadcast, por sensor (FIFO)
+    pending: Dict[str, Deque[float]] = field(default_factory=lambda: defaultdict(deque))
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "count": 0}
+    arr = np.asarray(values) * 1000.0
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "count": int(arr.size)}
+
+
+# ============================================================
+# TRANSPORTES DE INGESTÃO
+# ============================================================
+async def send_json(session: aiohttp.ClientSession, base_url: str, sensor_id: str,
+                    window: np.ndarray, seq: int) -> Dict[str, Any]:
+    """Caminho JSON padrão do ESP32: POST /predict com {"data": [[x,y,z],...]}"""
+    payload = {"data": window.tolist(), "sensor_id": sensor_id, "sample_rate": SAMPLE_RATE, "seq": seq}
+    async with session.post(f"{base_url}/predict", json=payload) as resp:
+        resp.raise_for_status()
+        return await resp.json()
+
+
+TRANSPORTS = {
+    "json": send_json,
+}
+
+
+# ============================================================
+# SENSOR SIMULADO
+# ============================================================
+async def sensor_task(idx: int, args, source, schedule: AnomalySchedule,
+                      stats: FleetStats, t_start: float, stop: asyncio.Event):
+    sensor_id = f"{args.prefix}_{idx:04d}"
+    send = TRANSPORTS[args.transport]
+    period = 1.0 / args.rate
+    rng = random.Random(args.seed + idx)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    def new_session():
+        # Um socket por sensor, como o ESP32
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=1), timeout=timeout)
+
+    session = new_session()
+    seq = 0  # contador de amostras do dispositivo
+    # Fase inicial aleatória para não sincronizar a frota
+    next_tick = time.perf_counter() + rng.uniform(0, period)
+
+    try:
+        while not stop.is_set():
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -period:
+                # Atrasado mais de um período: não tenta recuperar em rajada
+                stats.late_ticks += 1
+                next_tick = time.perf_counter()
+            next_tick += period
+            if stop.is_set():
+                break
+
+            # Queda de Wi-Fi: fecha a sessão, espera e reconecta
+            if args.dropout_prob > 0 and rng.random() < args.dropout_prob:
+                stats.dropouts += 1
+                await session.close()
+                await asyncio.sleep(rng.uniform(args.dropout_min, args.dropout_max))
+                session = new_session()
+                stats.reconnects += 1
+                next_tick = time.perf_counter()
+                continue
+
+            anomaly = schedule.is_anomalous(idx, time.perf_counter() - t_start)
+            window = source.window(idx, anomaly)
+
+            t0 = time.perf_counter()
+            stats.pending[sensor_id].append(t0)
+            stats.sent += 1
+            if anomaly:
+                stats.anomalies_sent += 1
+            window_seq = seq
+            seq += len(window)
+            try:
+                result = await send(session, args.url, sensor_id, window, window_seq)
+                stats.http_latencies.append(time.perf_counter() - t0)
+                if "error" in result:
+                    stats.errors += 1
+                else:
+                    stats.ok += 1
+                    if anomaly and result.get("is_anomaly"):
+                        stats.anomalies_detected += 1
+                    # Diretiva de taxa: pausa extra antes da próxima janela
+                    rate = result.get("rate") or {}
+                    stats.rate_modes[rate.get("mode", "none")] += 1
+                    if not args.ignore_rate and rate.get("interval_ms"):
+                        pause = rate["interval_ms"] / 1000.0
+                        stats.rate_pause_s += pause
+                        next_tick += pause
+                # Resposta "perdida": o dispositivo reenvia a mesma janela
+                if args.retry_prob > 0 and rng.random() < args.retry_prob:
+                    stats.retries += 1
+                    retry = await send(session, args.url, sensor_id, window, window_seq)
+                    if retry.get("duplicate"):
+                        stats.duplicates_acked += 1
+            except Exception:
+                stats.errors += 1
+                # Não haverá broadcast para este envio
+                pending = stats.pending[sensor_id]
+                if pending and pending[-1] == t0:
+                    pending.pop()
+    finally:
+        await session.close()
+
+
+async def websocket_listener(args, stats: FleetStats, stop: asyncio.Event, ready: asyncio.Event):
+    """
+    Casa cada atualização de status com o envio mais recente pendente do
+    sensor (o broadcast é coalescido: uma atualização cobre vários envios)
+    """
+    ws_url = args.url.replace("http://", "ws://").replace("https://", "wss://") + "/ws"
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(ws_url, heartbeat=20) as ws:
+            ready.set()
+            while not stop.is_set():
+                try:
+                    msg = await asyncio.wait_for(ws.receive(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        break
+                    continue
+                now = time.perf_counter()
+                data = json.loads(msg.data)
+                if data.get("type") != "status":
+                    continue
+                stats.broadcasts += 1
+                pending = stats.pending.get(data.get("sensor_id"))
+                if pending:
+                    stats.e2e_latencies.append(now - pending[-1])
+                    pending.clear()
+
+
+async def run_fleet(args) -> Dict[str, Any]:
+    if args.source == "replay":
+        source = ReplaySource(args.window, args.seed)
+    else:
+        source = SynthSource(args.window, args.seed)
+
+    schedule = AnomalySchedule(
+        args.sensors, args.anomaly_every, args.anomaly_duration, args.anomaly_fraction, args.seed
+    )
+    stats = FleetStats()
+    stop = asyncio.Event()
+    ready = asyncio.Event()
+
+    listener = None
+    if not args.no_websocket:
+        listener = asyncio.create_task(websocket_listener(args, stats, stop, ready))
+        await asyncio.wait_for(ready.wait(), timeout=10)
+
+    print(f"🚀 {args.sensors} sensores a {args.rate} janela(s)/s por {args.duration}s "
+          f"({args.source}, {args.window} amostras, transporte {args.transport})")
+
+    t_start = time.perf_counter()
+    tasks = [
+        asyncio.create_task(sensor_task(i, args, source, schedule, stats, t_start, stop))
+        for i in range(args.sensors)
+    ]
+
+    try:
+        while (remaining := args.duration - (time.perf_counter() - t_start)) > 0:
+            await asyncio.sleep(min(5.0, remaining))
+            elapsed = time.perf_counter() - t_start
+            print(f"⏳ {elapsed:5.0f}s | enviados {stats.sent} | ok {stats.ok} | "
+                  f"erros {stats.errors} | broadcasts {stats.broadcasts}")
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if listener:
+            # Dá tempo para os últimos broadcasts chegarem
+            await asyncio.sleep(1.0)
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+    elapsed = time.perf_counter() - t_start
+    return {
+        "config": {k: v for k, v in vars(args).items()},
+        "elapsed_s": elapsed,
+        "sent": stats.sent,
+        "ok": stats.ok,
+        "errors": stats.errors,
+        "windows_per_s": stats.ok / elapsed if elapsed > 0 else 0.0,
+        "samples_per_s": stats.ok * args.window / elapsed if elapsed > 0 else 0.0,
+        "anomalies_sent": stats.anomalies_sent,
+        "anomalies_detected": stats.anomalies_detected,
+        "dropouts": stats.dropouts,
+        "reconnects": stats.reconnects,
+        "late_ticks": stats.late_ticks,
+        "broadcasts_received": stats.broadcasts,
+        "retries": stats.retries,
+        "duplicates_acked": stats.duplicates_acked,
+        "rate_modes": dict(stats.rate_modes),
+        "rate_pause_s": stats.rate_pause_s,
+        "http_latency": percentiles(stats.http_latencies),
+        "e2e_latency": percentiles(stats.e2e_latencies),
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print("\n" + "=" * 60)
+    print("  RESULTADO DA SIMULAÇÃO")
+    print("=" * 60)
+    print(f"  Janelas ok/enviadas : {report['ok']}/{report['sent']} ({report['errors']} erros)")
+    print(f"  Throughput          : {report['windows_per_s']:.1f} janelas/s "
+          f"({report['samples_per_s']:.0f} amostras/s)")
+    print(f"  Anomalias           : {report['anomalies_detected']}/{report['anomalies_sent']} detectadas")
+    print(f"  Quedas/reconexões   : {report['dropouts']}/{report['reconnects']}")
+    print(f"  Ticks atrasados     : {report['late_ticks']}")
+    if report["retries"]:
+        print(f"  Reenvios            : {report['retries']} ({report['duplicates_acked']} confirmados como duplicata)")
+    if report["rate_modes"]:
+        modes = ", ".join(f"{mode} {count}" for mode, count in sorted(report["rate_modes"].items()))
+        print(f"  Modos de envio      : {modes} (pausas {report['rate_pause_s']:.0f}s)")
+    for name in ("http_latency", "e2e_latency"):
+        lat = report[name]
+        if lat["count"]:
+            print(f"  {name:<20}: p50 {lat['p50_ms']:.1f} ms | p95 {lat['p95_ms']:.1f} ms | "
+                  f"p99 {lat['p99_ms']:.1f} ms ({lat['count']})")
+    print("=" * 60 + "\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulador de frota de sensores ESP32")
+    parser.add_argument("--url", type=str, default="http://localhost:8000")
+    parser.add_argument("-n", "--sensors", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=1.0, help="Janelas por segundo por sensor")
+    parser.add_argument("--duration", type=float, default=30.0, help="Duração em segundos")
+    parser.add_argument("--window", type=int, default=200, help="Amostras por janela")
+    parser.add_argument("--source", choices=["synth", "replay"], default="synth")
+    parser.add_argument("--transport", choices=sorted(TRANSPORTS), default="json")
+    parser.add_argument("--prefix", type=str, default="sim", help="Prefixo dos sensor_id")
+    parser.add_argument("--anomaly-every", type=float, default=0.0,
+                        help="Intervalo entre episódios de anomalia (s); 0 desativa")
+    parser.add_argument("--anomaly-duration", type=float, default=10.0)
+    parser.add_argument("--anomaly-fraction", type=float, default=0.1,
+                        help="Fração dos sensores afetados em cada episódio")
+    parser.add_argument("--dropout-prob", type=float, default=0.0,
+                        help="Probabilidade de queda de Wi-Fi a cada janela")
+    parser.add_argument("--dropout-min", type=float, default=2.0)
+    parser.add_argument("--dropout-max", type=float, default=15.0)
+    parser.add_argument("--retry-prob", type=float, default=0.0,
+                        help="Probabilidade de reenviar a janela (simula ack perdido)")
+    parser.add_argument("--ignore-rate", action="store_true",
+                        help="Ignora a diretiva de taxa do servidor (cadência fixa)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Timeout HTTP (s)")
+    parser.add_argument("--no-websocket", action="store_true",
+                        help="Não mede latência ponta a ponta via /ws")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report", type=str, help="Salva o resultado em JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_fleet(args))
+    print_report(report)
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2))
+        print(f"💾 Relatório salvo em: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""
+Métricas no formato Prometheus para o servidor de anomalias.
+
+Instrumentação barata o suficiente para ficar sempre ligada em produção:
+contadores e histogramas são criados uma única vez (na importação ou na
+primeira vez que um sensor aparece) e a observação é só uma busca binária
+nos limites dos buckets e alguns incrementos, sem alocar estruturas.
+
+Uso no caminho quente:
+    t0 = time.perf_counter()
+    ...
+    metrics.STAGE_FEATURES.observe(time.perf_counter() - t0)
+
+A exposição em texto (GET /metrics) é montada somente no scrape.
+
+O primeiro rótulo das famílias (sensor_id, vindo do cliente) é limitado a
+METRICS_MAX_SERIES valores por família; os seguintes são somados em
+OVERFLOW_LABEL, para um cliente com ids aleatórios não crescer o processo
+e o scrape sem limite.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Buckets de latência em segundos (50 µs .. 1 s)
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+# Buckets de atraso do event loop em segundos (1 ms .. 5 s)
+LOOP_LAG_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+# Valores distintos do primeiro rótulo por família; o excedente vira "other"
+MAX_SERIES = int(os.environ.get("METRICS_MAX_SERIES", "1000"))
+OVERFLOW_LABEL = "other"
+
+
+# ============================================================
+# PRIMITIVAS
+# ============================================================
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: Union[int, float] = 1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Histogram:
+    """Histograma com buckets fixos; counts[i] é a contagem não cumulativa"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class Family:
+    """
+    Família de métricas com rótulos. Os filhos são criados uma vez por
+    combinação de rótulos e reutilizados; no caminho quente, guarde a
+    referência retornada por labels() em vez de chamar a cada evento.
+    Acima de max_series valores do primeiro rótulo, os novos valores são
+    contados em OVERFLOW_LABEL.
+    """
+
+    def __init__(self, name: str, help_text: str, kind: str,
+                 labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS,
+                 max_series: int = MAX_SERIES):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.max_series = max_series
+        self.children: Dict[Union[str, Tuple[str, ...]], Metric] = {}
+        # Valores do primeiro rótulo com filho próprio (limitados a max_series)
+        self.first_values: Set[str] = set()
+        self.overflowed = False
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+
+    def _new_child(self) -> Metric:
+        if self.kind == "counter":
+            return Counter()
+        if self.kind == "gauge":
+            return Gauge()
+        return Histogram(self.buckets)
+
+    def labels(self, *values: str) -> Metric:
+        key = values[0] if len(values) == 1 else values
+        child = self.children.get(key)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera rótulos {self.labelnames}")
+            first = values[0]
+            if first not in self.first_values and first != OVERFLOW_LABEL:
+                if len(self.first_values) >= self.max_series:
+                    if not self.overflowed:
+                        self.overflowed = True
+                        logger.warning(
+                            f"⚠️ {self.name}: mais de {self.max_series} valores de "
+                            f"{self.labelnames[0]}; os novos entram como \"{OVERFLOW_LABEL}\""
+                        )
+                    return self.labels(OVERFLOW_LABEL, *values[1:])
+                self.first_values.add(first)
+            child = self.children[key] = self._new_child()
+        return child
+
+    def remove(self, *values: str):
+        key = values[0] if len(values) == 1 else values
+        self.children.pop(key, None)
+        first = values[0]
+        if not any((k == first) if isinstance(k, str) else (k[0] == first) for k in self.children):
+            self.first_values.discard(first)
+
+    @property
+    def root(self) -> Metric:
+        return self.children[()]
+
+    def _label_str(self, key, extra: str = "") -> str:
+        values = (key,) if isinstance(key, str) else key
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for key, child in list(self.children.items()):
+            if isinstance(child, Histogram):
+                cumulative = 0
+                for bound, count in zip(child.bounds, child.counts):
+                    cumulative += count
+                    labels = self._label_str(key, 'le="%s"' % bound)
+                    out.append(f"{self.name}_bucket{labels} {cumulative}")
+                cumulative += child.counts[-1]
+                labels = self._label_str(key, 'le="+Inf"')
+                out.append(f"{self.name}_bucket{labels} {cumulative}")
+                out.append(f"{self.name}_sum{self._label_str(key)} {child.sum}")
+                out.append(f"{self.name}_count{self._label_str(key)} {child.count}")
+            else:
+                out.append(f"{self.name}{self._label_str(key)} {child.value}")
+
+
+class Collector:
+    """Métricas calculadas no momento do scrape (ex.: tamanho de filas)"""
+
+    def __init__(self, name: str, help_text: str, kind: str,
+                 fn: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.fn = fn
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        try:
+            for labels, value in self.fn():
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                out.append(f"{self.name}{{{label_str}}} {value}" if label_str else f"{self.name} {value}")
+        except Exception as e:
+            logger.error(f"Erro ao coletar métrica {self.name}: {e}")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ============================================================
+# REGISTRO
+# ============================================================
+_registry: List[Union[Family, Collector]] = []
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Family:
+    family = Family(name, help_text, "counter", labelnames)
+    _registry.append(family)
+    return family
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Family:
+    family = Family(name, help_text, "gauge", labelnames)
+    _registry.append(family)
+    return family
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Family:
+    family = Family(name, help_text, "histogram", labelnames, buckets)
+    _registry.append(family)
+    return family
+
+
+def collector(name: str, help_text: str, kind: str,
+              fn: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> Collector:
+    c = Collector(name, help_text, kind, fn)
+    _registry.append(c)
+    return c
+
+
+def render() -> str:
+    """Exposição em texto no formato Prometheus 0.0.4"""
+    out: List[str] = []
+    for item in _registry:
+        item.render(out)
+    out.append("")
+    return "\n".join(out)
+
+
+# ============================================================
+# MÉTRICAS DO SERVIDOR
+# ============================================================
+stage_latency = histogram(
+    "anomaly_stage_latency_seconds",
+    "Latência por estágio do caminho de predição",
+    ["stage"],
+)
+STAGE_PARSE = stage_latency.labels("parse")
+STAGE_SANITIZE = stage_latency.labels("sanitize")
+STAGE_GATE = stage_latency.labels("gate")
+STAGE_FEATURES = stage_latency.labels("features")
+STAGE_DISTANCE = stage_latency.labels("distance")
+STAGE_BROADCAST = stage_latency.labels("broadcast")
+
+predict_latency = histogram(
+    "anomaly_predict_latency_seconds",
+    "Latência total do handler /predict",
+)
+PREDICT_LATENCY = predict_latency.root
+
+ingest_windows = counter(
+    "anomaly_ingest_windows_total",
+    "Janelas recebidas por sensor (use rate() para taxa de ingestão)",
+    ["sensor_id"],
+)
+ingest_samples = counter(
+    "anomaly_ingest_samples_total",
+    "Amostras recebidas por sensor",
+    ["sensor_id"],
+)
+predictions = counter("anomaly_predictions_total", "Predições executadas")
+PREDICTIONS = predictions.root
+prediction_errors = counter("anomaly_prediction_errors_total", "Erros durante a predição")
+PREDICTION_ERRORS = prediction_errors.root
+anomaly_candidates = counter(
+    "anomaly_candidates_total",
+    "Janelas com distância acima do threshold (antes da votação)",
+    ["sensor_id"],
+)
+anomalies = counter(
+    "anomaly_detected_total",
+    "Janelas classificadas como anomalia estável (votação 2 de 3)",
+    ["sensor_id"],
+)
+
+timeline_windows = counter(
+    "anomaly_timeline_windows_total",
+    "Janelas por sensor e situação na linha do tempo (ok, gap, duplicate, ...)",
+    ["sensor_id", "status"],
+)
+feature_windows = counter(
+    "anomaly_feature_windows_total",
+    "Janelas recebidas com features calculadas no dispositivo",
+    ["sensor_id"],
+)
+feature_rejected = counter(
+    "anomaly_feature_rejected_total",
+    "Vetores de features recusados (schema_id, length, non_finite, out_of_range, digest)",
+    ["reason"],
+)
+quality_windows = counter(
+    "anomaly_quality_windows_total",
+    "Janelas por sensor e qualidade do sinal (só as ok são pontuadas)",
+    ["sensor_id", "status"],
+)
+duplicate_windows = counter(
+    "anomaly_duplicate_windows_total",
+    "Janelas reenviadas (seq já recebido): confirmadas sem reprocessar",
+    ["sensor_id"],
+)
+rate_changes = counter(
+    "anomaly_rate_changes_total",
+    "Mudanças de modo de envio dirigidas pelo servidor (full, reduced, idle)",
+    ["sensor_id", "mode"],
+)
+upload_interval = gauge(
+    "anomaly_upload_interval_seconds",
+    "Pausa entre janelas pedida ao sensor pela política de taxa",
+    ["sensor_id"],
+)
+alert_events = counter(
+    "anomaly_alert_events_total",
+    "Transições de alerta (opened, escalated, cleared) por severidade",
+    ["event", "severity"],
+)
+
+dropped_messages = counter(
+    "anomaly_broadcast_dropped_total",
+    "Mensagens descartadas por assinante lento ou desconectado",
+    ["channel"],
+)
+DROPPED_SSE = dropped_messages.labels("sse")
+DROPPED_WEBSOCKET = dropped_messages.labels("websocket")
+broadcast_messages = counter(
+    "anomaly_broadcast_messages_total",
+    "Mensagens enviadas aos assinantes",
+    ["channel"],
+)
+SENT_SSE = broadcast_messages.labels("sse")
+SENT_WEBSOCKET = broadcast_messages.labels("websocket")
+
+event_loop_lag = histogram(
+    "anomaly_event_loop_lag_seconds",
+    "Atraso do event loop medido por um timer periódico",
+    buckets=LOOP_LAG_BUCKETS,
+)
+EVENT_LOOP_LAG = event_loop_lag.root
+event_loop_lag_last = gauge("anomaly_event_loop_lag_last_seconds", "Último atraso medido do event loop")
+EVENT_LOOP_LAG_LAST = event_loop_lag_last.root
+
+model_info = gauge(
+    "anomaly_model_info",
+    "Modelo carregado (valor sempre 1; versão nos rótulos)",
+    ["model_type", "training_date", "n_features"],
+)
+model_threshold = gauge("anomaly_model_threshold", "Threshold de distância do modelo carregado")
+
+
+def set_model_info(model_type: str, training_date: str, n_features: int, threshold: float):
+    model_info.children.clear()
+    model_info.labels(model_type, training_date, str(n_features)).set(1)
+    model_threshold.root.set(threshold)
+
+
+# ============================================================
+# TEMPO DE PARSE DA REQUISIÇÃO
+# ============================================================
+# Instante em que a requisição chegou ao servidor (antes do parse/validação)
+request_received_at: ContextVar[Optional[float]] = ContextVar("request_received_at", default=None)
+
+
+class RequestTimingMiddleware:
+    """
+    Middleware ASGI puro: marca o instante de chegada da requisição para que
+    o handler meça o estágio "parse" (leitura do corpo + JSON + pydantic).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            token = request_received_at.set(time.perf_counter())
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                request_received_at.reset(token)
+        else:
+            await self.app(scope, receive, send)
+
+
+def observe_parse(handler_start: float):
+    received = request_received_at.get()
+    if received is not None:
+        STAGE_PARSE.observe(handler_start - received)
+
+
+# ============================================================
+# ATRASO DO EVENT LOOP
+# ============================================================
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Mede quanto o event loop atrasa para acordar um sleep periódico"""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - t0 - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Artefato Compilado do Modelo
+============================
+Converte o modelo de treinamento (models/mahalanobis_model.npz) num artefato
+pronto para servir:
+
+  - somente arrays numéricos/texto (carrega com allow_pickle=False)
+  - matriz de branqueamento W pré-calculada (W = L⁻¹, com Σ = L·Lᵀ),
+    de modo que a distância de Mahalanobis é só ||W·(x − μ)||,
+    sem inversão de matriz no servidor
+  - envelope do estágio rápido da cascata (ver cascade.py): faixa normal
+    do desvio padrão (μ ± GATE_SIGMAS·σ do treinamento) e do pico a pico
+    (mediana ± GATE_SIGMAS·σ robusto dos decis de drift_edges) de cada eixo,
+    e a projeção marginal dessas features
+  - tabela de quantis das distâncias normais para a confiança calibrada
+    (cdf_distances do modelo; sem ela, a lei chi com k = nº de features;
+    ver calibration.py)
+  - histograma de referência de cada feature para o monitor de deriva
+    (drift_edges/drift_expected do modelo; sem eles, decis da normal de
+    cada feature; ver drift.py)
+
+O servidor usa o artefato compilado se ele existir e estiver atualizado em
+relação ao modelo de origem; caso contrário compila na hora e tenta salvar.
+
+Uso:
+  python model_artifact.py
+  python model_artifact.py --source models/mahalanobis_model.npz --output models/x.compiled.npz
+"""
+
+import argparse
+import logging
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from calibration import chi_table
+from cascade import GATE_FEATURES
+from drift import gaussian_histogram
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_VERSION = 5
+MODEL_PATH = Path("models/mahalanobis_model.npz")
+
+# Mesma regularização usada historicamente no servidor
+COV_EPSILON = 1e-6
+
+FEATURE_NAMES = ["std", "kurtosis", "peak_amplitude", "rms", "peak_to_peak"]
+
+# Largura do envelope da cascata, em desvios padrão de cada feature no treino.
+# Nos dados de datasets/ac, 3σ mantém ~98% das janelas silent_* dentro, todas
+# as medium_*/high_* fora, e tira do envelope uma janela normal com dois picos
+# de 1 m/s² (std quase igual, distância completa 8× o threshold).
+GATE_SIGMAS = 3.0
+# Decis 10% e 90% de uma normal: (q90 − q10) / 2,563 = σ
+DECILE_SPREAD = 2.5631
+
+
+def feature_schema_id(feature_names) -> str:
+    """
+    Identificador curto do esquema de features (nomes e ordem). Dispositivos
+    que calculam as features na borda enviam esse id junto com o vetor.
+    """
+    return "%08x" % zlib.crc32(",".join(str(n) for n in feature_names).encode())
+
+
+def compiled_path_for(source: Path) -> Path:
+    return source.with_name(source.stem + ".compiled.npz")
+
+
+def _scalar(value, cast=str):
+    if isinstance(value, np.ndarray):
+        value = value.item()
+    return cast(value)
+
+
+def whitening_matrix(cov: np.ndarray) -> np.ndarray:
+    """
+    Retorna W tal que Wᵀ·W = Σ⁻¹ (Σ regularizada).
+    Usa Cholesky (W = L⁻¹, triangular inferior); se Σ não for positiva
+    definida, cai para autovalores com piso em COV_EPSILON.
+    """
+    cov_reg = cov + COV_EPSILON * np.eye(cov.shape[0])
+    try:
+        L = np.linalg.cholesky(cov_reg)
+        return np.linalg.solve(L, np.eye(cov.shape[0]))
+    except np.linalg.LinAlgError:
+        logger.warning("Covariância não é positiva definida; usando decomposição espectral")
+        eigvals, eigvecs = np.linalg.eigh(cov_reg)
+        eigvals = np.maximum(eigvals, COV_EPSILON)
+        return (eigvecs / np.sqrt(eigvals)).T
+
+
+def gate_envelope(mu: np.ndarray, cov: np.ndarray, drift_edges: np.ndarray,
+                  sigmas: float = GATE_SIGMAS) -> Dict[str, np.ndarray]:
+    """
+    Envelope do estágio rápido: limites por eixo de cada feature de
+    GATE_FEATURES (na ordem de ScoringGate.route) e W marginal dessas
+    features (distância parcial, limite inferior da distância completa).
+    O pico a pico usa os decis das janelas normais: a cauda real dele é mais
+    larga que a gaussiana do modelo.
+    """
+    n_axes = mu.shape[0] // len(FEATURE_NAMES)
+    offsets = [FEATURE_NAMES.index(name) for name in GATE_FEATURES]
+    index = np.array([a * len(FEATURE_NAMES) + o for a in range(n_axes) for o in offsets])
+    gate_mu = mu[index]
+    gate_cov = cov[np.ix_(index, index)]
+    center = gate_mu.copy()
+    spread = sigmas * np.sqrt(np.diag(gate_cov))
+    ptp = np.array([FEATURE_NAMES[i % len(FEATURE_NAMES)] == "peak_to_peak" for i in index])
+    edges = drift_edges[index[ptp]]
+    center[ptp] = edges[:, edges.shape[1] // 2]
+    spread[ptp] = sigmas * (edges[:, -1] - edges[:, 0]) / DECILE_SPREAD
+    return {
+        "gate_index": index,
+        "gate_low": np.maximum(center - spread, 0.0),
+        "gate_high": center + spread,
+        "gate_mu": gate_mu,
+        "gate_whitening": whitening_matrix(gate_cov),
+    }
+
+
+def compile_model(source: Path = MODEL_PATH) -> Dict[str, np.ndarray]:
+    """Lê o modelo de origem (sem pickle) e monta os arrays do artefato"""
+    model = np.load(source, allow_pickle=False)
+    mu = np.asarray(model["mu"], dtype=np.float64)
+    cov = np.asarray(model["cov"], dtype=np.float64)
+    threshold = _scalar(model["threshold"], float)
+
+    files = set(model.files)
+    model_type = _scalar(model["model_type"]) if "model_type" in files else "standard"
+    training_date = _scalar(model["training_date"]) if "training_date" in files else "unknown"
+
+    if "cdf_distances" in files:
+        cdf_table = np.asarray(model["cdf_distances"], dtype=np.float64)
+        cdf_kind = "empirical"
+    else:
+        cdf_table = chi_table(mu.shape[0])
+        cdf_kind = "chi"
+
+    if "drift_edges" in files:
+        drift_edges = np.asarray(model["drift_edges"], dtype=np.float64)
+        drift_expected = np.asarray(model["drift_expected"], dtype=np.float64)
+        drift_kind = "empirical"
+    else:
+        drift_edges, drift_expected = gaussian_histogram(mu, cov)
+        drift_kind = "gaussian"
+
+    n_axes = mu.shape[0] // len(FEATURE_NAMES)
+    feature_names = [f"axis_{a}.{name}" for a in range(n_axes) for name in FEATURE_NAMES]
+
+    return {
+        "artifact_version": np.array(ARTIFACT_VERSION),
+        "mu": mu,
+        "whitening": whitening_matrix(cov),
+        "threshold": np.array(threshold),
+        "model_type": np.array(model_type),
+        "training_date": np.array(training_date),
+        "feature_names": np.array(feature_names),
+        "source_mtime_ns": np.array(source.stat().st_mtime_ns, dtype=np.int64),
+        "cdf_table": cdf_table,
+        "cdf_kind": np.array(cdf_kind),
+        "drift_edges": drift_edges,
+        "drift_expected": drift_expected,
+        "drift_kind": np.array(drift_kind),
+        **gate_envelope(mu, cov, drift_edges),
+    }
+
+
+def save_artifact(arrays: Dict[str, np.ndarray], path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    tmp.replace(path)
+
+
+def load_artifact(path: Path) -> Dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def _is_fresh(arrays: Dict[str, np.ndarray], source: Path) -> bool:
+    if int(arrays.get("artifact_version", -1)) != ARTIFACT_VERSION:
+        return False
+    if not source.exists():
+        return True
+    return int(arrays.get("source_mtime_ns", -1)) == source.stat().st_mtime_ns
+
+
+def load_or_compile(source: Path = MODEL_PATH, compiled: Optional[Path] = None) -> Dict[str, np.ndarray]:
+    """Carrega o artefato compilado; recompila se estiver ausente ou desatualizado"""
+    source = Path(source)
+    compiled = Path(compiled) if compiled else compiled_path_for(source)
+
+    if compiled.exists():
+        try:
+            arrays = load_artifact(compiled)
+            if _is_fresh(arrays, source):
+                return arrays
+            logger.info("Artefato compilado desatualizado, recompilando: %s", compiled)
+        except Exception as e:
+            logger.warning("Falha ao ler artefato compilado %s: %s", compiled, e)
+
+    arrays = compile_model(source)
+    try:
+        save_artifact(arrays, compiled)
+        logger.info("Artefato compilado salvo em %s", compiled)
+    except OSError as e:
+        logger.warning("Não foi possível salvar o artefato compilado: %s", e)
+    return arrays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compila o modelo para o servidor")
+    parser.add_argument("--source", type=Path, default=MODEL_PATH)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    output = args.output or compiled_path_for(args.source)
+    t0 = time.perf_counter()
+    arrays = compile_model(args.source)
+    save_artifact(arrays, output)
+    elapsed = (time.perf_counter() - t0) * 1000
+
+    print(f"🔧 Modelo compilado em {elapsed:.1f} ms")
+    print(f"   - Origem: {args.source}")
+    print(f"   - Features: {arrays['mu'].shape[0]}")
+    print(f"   - Threshold: {float(arrays['threshold']):.3f}")
+    print(f"   - CDF da confiança: {arrays['cdf_kind']} ({arrays['cdf_table'].shape[0]} quantis)")
+    print(f"   - Referência da deriva: {arrays['drift_kind']} ({arrays['drift_expected'].shape[1]} baldes)")
+    print(f"   - Envelope ({'/'.join(GATE_FEATURES)} por eixo): "
+          f"{np.round(arrays['gate_low'], 4)} .. {np.round(arrays['gate_high'], 4)}")
+    print(f"💾 Artefato salvo em: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Camada única de validação e serialização das saídas do servidor.
+
+Os valores são garantidos finitos UMA vez, na fronteira:
+  - arrays de entrada/saída do modelo passam por finite() (vetorizado);
+  - escalares soltos passam por finite_float().
+
+Daí em diante tudo é tratado como pré-validado: os payloads são
+serializados uma única vez (Payload.text) e o mesmo texto é entregue a
+todos os assinantes WebSocket/SSE e à resposta HTTP.
+
+O encoder usa orjson quando instalado (NaN/Infinity viram null, arrays
+NumPy são serializados nativamente); sem orjson, usa json da biblioteca
+padrão em modo estrito e, se algum valor não finito escapar, faz uma
+sanitização recursiva como rede de segurança.
+"""
+
+import json
+import math
+from typing import Any, Dict, Optional
+
+import numpy as np
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+# Substitui ±Infinity (mesmo valor usado historicamente pelo servidor)
+MAX_VALUE = 1e10
+
+
+# ============================================================
+# VALIDAÇÃO
+# ============================================================
+def finite(array: np.ndarray, default: float = 0.0, max_value: float = MAX_VALUE) -> np.ndarray:
+    """
+    Garante valores finitos num array, de forma vetorizada.
+    - NaN → default
+    - +Infinity → max_value
+    - -Infinity → -max_value
+    """
+    array = np.asarray(array, dtype=np.float64)
+    return np.nan_to_num(array, nan=default, posinf=max_value, neginf=-max_value)
+
+
+def finite_float(value: Any, default: float = 0.0, max_value: float = MAX_VALUE) -> float:
+    """Versão escalar de finite() para valores soltos (ex.: distância)"""
+    if value is None or isinstance(value, bool) or not isinstance(value, (int, float, np.number)):
+        return default
+    value = float(value)
+    if math.isfinite(value):
+        return value
+    if math.isnan(value):
+        return default
+    return max_value if value > 0 else -max_value
+
+
+def _sanitize_tree(data: Any) -> Any:
+    """Rede de segurança do encoder sem orjson: percorre e corrige não finitos"""
+    if isinstance(data, dict):
+        return {k: _sanitize_tree(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_sanitize_tree(v) for v in data]
+    if isinstance(data, np.ndarray):
+        return finite(data).tolist()
+    if isinstance(data, (float, np.floating)):
+        return finite_float(data)
+    if isinstance(data, np.integer):
+        return int(data)
+    if isinstance(data, np.bool_):
+        return bool(data)
+    return data
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+
+# ============================================================
+# SERIALIZAÇÃO
+# ============================================================
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data: Any) -> str:
+        return orjson.dumps(data, option=_ORJSON_OPTIONS).decode()
+
+    def loads(text):
+        return orjson.loads(text)
+else:
+    def dumps(data: Any) -> str:
+        try:
+            return json.dumps(data, separators=(",", ":"), allow_nan=False, default=_json_default)
+        except ValueError:
+            return json.dumps(_sanitize_tree(data), separators=(",", ":"), default=_json_default)
+
+    def loads(text):
+        return json.loads(text)
+
+
+class Payload:
+    """Mensagem já validada, com o texto JSON calculado uma única vez"""
+
+    __slots__ = ("data", "_text")
+
+    def __init__(self, data: Dict[str, Any], text: Optional[str] = None):
+        self.data = data
+        self._text = text
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = dumps(self.data)
+        return self._text
+
+    def response(self) -> Response:
+        return Response(content=self.text, media_type="application/json")
+
+
+def json_response(data: Any, status_code: int = 200) -> Response:
+    """Resposta HTTP com o encoder rápido (evita o jsonable_encoder do FastAPI)"""
+    return Response(content=dumps(data), status_code=status_code, media_type="application/json")
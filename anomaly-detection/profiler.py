@@ -0,0 +1,259 @@
+"""
+Profiler opcional para requisições lentas e travamentos do event loop.
+
+Quando ligado:
+  - uma thread amostra a pilha da thread do event loop a cada
+    `sample_interval` (sys._current_frames), guardando um anel curto;
+  - uma tarefa asyncio mede continuamente o atraso do event loop;
+  - se uma requisição HTTP ou um travamento do loop passa do threshold,
+    as amostras daquele intervalo viram um relatório (pilhas agregadas)
+    gravado em arquivo rotativo (logs/slow_calls.jsonl) e guardado em
+    memória para consulta via /admin/profiler/reports.
+
+Desligado, o middleware só testa uma flag e repassa a requisição.
+Pode ser ligado na inicialização (PROFILER_ENABLED=1) ou em tempo de
+execução via POST /admin/profiler.
+"""
+
+import asyncio
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REPORTS_PATH = Path(os.environ.get("PROFILER_REPORTS_PATH", "logs/slow_calls.jsonl"))
+MAX_REPORTS_IN_MEMORY = 50
+MAX_SAMPLES = 4000
+MAX_STACK_DEPTH = 40
+TOP_STACKS = 15
+# Rotas SSE: a resposta dura enquanto o cliente estiver conectado, então a
+# duração não diz nada sobre lentidão (toda rota de stream nova entra aqui)
+STREAM_PATHS = ("/realtime/stream", "/alerts/stream")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class SlowCallProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.request_threshold_s = _env_float("PROFILER_REQUEST_THRESHOLD_MS", 200.0) / 1000.0
+        self.stall_threshold_s = _env_float("PROFILER_STALL_THRESHOLD_MS", 100.0) / 1000.0
+        self.sample_interval_s = _env_float("PROFILER_SAMPLE_INTERVAL_MS", 5.0) / 1000.0
+        self.heartbeat_interval_s = 0.02
+
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=MAX_SAMPLES)
+        self._reports: Deque[Dict[str, Any]] = deque(maxlen=MAX_REPORTS_IN_MEMORY)
+        self._report_seq = 0
+        self._generation = 0
+        self._loop_thread_id: Optional[int] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._watchdog: Optional[asyncio.Task] = None
+        self._file_logger: Optional[logging.Logger] = None
+
+        self.last_loop_lag_s = 0.0
+        self.max_loop_lag_s = 0.0
+        self.slow_requests = 0
+        self.loop_stalls = 0
+
+    # ------------------------------------------------------------
+    # Ligar / desligar
+    # ------------------------------------------------------------
+    def enable(self):
+        """Liga o profiler. Deve ser chamado de dentro do event loop."""
+        if self.enabled:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self.enabled = True
+        self._generation += 1
+        self._samples.clear()
+        self._sampler = threading.Thread(
+            target=self._sample_loop, args=(self._generation,), name="profiler-sampler", daemon=True
+        )
+        self._sampler.start()
+        self._watchdog = asyncio.get_running_loop().create_task(self._watch_event_loop())
+        logger.info(
+            "🔬 Profiler ligado (requisição > %.0f ms, loop > %.0f ms, amostragem %.1f ms)",
+            self.request_threshold_s * 1000, self.stall_threshold_s * 1000, self.sample_interval_s * 1000,
+        )
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self._watchdog:
+            self._watchdog.cancel()
+            self._watchdog = None
+        self._sampler = None  # a thread termina sozinha na próxima amostra
+        logger.info("🔬 Profiler desligado")
+
+    def configure(self, enabled: Optional[bool] = None, request_threshold_ms: Optional[float] = None,
+                  stall_threshold_ms: Optional[float] = None, sample_interval_ms: Optional[float] = None):
+        if request_threshold_ms is not None:
+            self.request_threshold_s = max(0.0, request_threshold_ms) / 1000.0
+        if stall_threshold_ms is not None:
+            self.stall_threshold_s = max(0.0, stall_threshold_ms) / 1000.0
+        if sample_interval_ms is not None:
+            self.sample_interval_s = max(0.5, sample_interval_ms) / 1000.0
+        if enabled is True:
+            self.enable()
+        elif enabled is False:
+            self.disable()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "request_threshold_ms": self.request_threshold_s * 1000,
+            "stall_threshold_ms": self.stall_threshold_s * 1000,
+            "sample_interval_ms": self.sample_interval_s * 1000,
+            "last_loop_lag_ms": self.last_loop_lag_s * 1000,
+            "max_loop_lag_ms": self.max_loop_lag_s * 1000,
+            "slow_requests": self.slow_requests,
+            "loop_stalls": self.loop_stalls,
+            "reports_in_memory": len(self._reports),
+            "reports_path": str(REPORTS_PATH),
+        }
+
+    def reports(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Relatórios mais recentes primeiro"""
+        return list(self._reports)[-limit:][::-1]
+
+    # ------------------------------------------------------------
+    # Amostragem
+    # ------------------------------------------------------------
+    def _sample_loop(self, generation: int):
+        target = self._loop_thread_id
+        while self.enabled and generation == self._generation:
+            frame = sys._current_frames().get(target)
+            if frame is not None:
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{Path(code.co_filename).name}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                del frame
+                # Raiz primeiro, folha por último (formato "collapsed stacks")
+                self._samples.append((time.perf_counter(), tuple(reversed(stack))))
+            time.sleep(self.sample_interval_s)
+
+    async def _watch_event_loop(self):
+        """Mede o atraso do event loop; travamentos acima do threshold geram relatório"""
+        while self.enabled:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.heartbeat_interval_s)
+            now = time.perf_counter()
+            lag = max(0.0, now - t0 - self.heartbeat_interval_s)
+            self.last_loop_lag_s = lag
+            if lag > self.max_loop_lag_s:
+                self.max_loop_lag_s = lag
+            if lag > self.stall_threshold_s:
+                self.loop_stalls += 1
+                self._report("loop_stall", t0 + self.heartbeat_interval_s, now, {"lag_ms": lag * 1000})
+
+    # ------------------------------------------------------------
+    # Relatórios
+    # ------------------------------------------------------------
+    def _aggregate(self, start: float, end: float) -> Tuple[int, List[Dict[str, Any]], List[Dict[str, Any]]]:
+        stacks: StackCounter = StackCounter()
+        leaves: StackCounter = StackCounter()
+        n = 0
+        for t, stack in list(self._samples):
+            if start <= t <= end and stack:
+                stacks[stack] += 1
+                leaves[stack[-1]] += 1
+                n += 1
+        top_stacks = [{"stack": ";".join(s), "count": c} for s, c in stacks.most_common(TOP_STACKS)]
+        top_leaves = [{"frame": f, "count": c} for f, c in leaves.most_common(TOP_STACKS)]
+        return n, top_stacks, top_leaves
+
+    def _report(self, kind: str, start: float, end: float, extra: Dict[str, Any]):
+        n, top_stacks, top_leaves = self._aggregate(start, end)
+        self._report_seq += 1
+        report = {
+            "id": self._report_seq,
+            "kind": kind,
+            "timestamp": datetime.now().isoformat(),
+            "duration_ms": (end - start) * 1000,
+            "samples": n,
+            "top_frames": top_leaves,
+            "stacks": top_stacks,
+            **extra,
+        }
+        self._reports.append(report)
+        self._write(report)
+        logger.warning(
+            "🐢 %s: %.1f ms (%d amostras) %s",
+            kind, report["duration_ms"], n, extra.get("path", ""),
+        )
+
+    def _write(self, report: Dict[str, Any]):
+        try:
+            if self._file_logger is None:
+                REPORTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    REPORTS_PATH, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                file_logger = logging.getLogger("profiler.slow_calls")
+                file_logger.propagate = False
+                file_logger.setLevel(logging.INFO)
+                file_logger.addHandler(handler)
+                self._file_logger = file_logger
+            self._file_logger.info(json.dumps(report))
+        except Exception as e:
+            logger.error(f"Erro ao gravar relatório do profiler: {e}")
+
+    def request_finished(self, method: str, path: str, start: float, end: float, status: Optional[int]):
+        if end - start > self.request_threshold_s:
+            self.slow_requests += 1
+            self._report("slow_request", start, end, {"method": method, "path": path, "status": status})
+
+
+profiler = SlowCallProfiler()
+
+
+class ProfilerMiddleware:
+    """Middleware ASGI: mede cada requisição HTTP quando o profiler está ligado"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_holder = [None]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Streams longos (SSE) não são requisições lentas
+            if not scope["path"].startswith(STREAM_PATHS):
+                profiler.request_finished(
+                    scope["method"], scope["path"], start, time.perf_counter(), status_holder[0]
+                )
+
+
+def enabled_from_env() -> bool:
+    return os.environ.get("PROFILER_ENABLED", "").lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,185 @@
+"""
+Qualidade do sinal antes da pontuação.
+
+Entrada ruim passava pelo modelo inteiro e virava distância enganosa:
+
+  - MPU6050 travado: leituras idênticas, std 0 e curtose NaN (que a
+    sanitização troca por 0);
+  - valores presos no limite da faixa do sensor (saturação);
+  - NaN/Infinity trocados por 0/1e10 em finite() (1e10 vira distância
+    absurda: ver repair());
+  - janelas curtas demais para momentos de 4ª ordem.
+
+Cada janela bruta é classificada, numa passada vetorizada sobre o array
+ainda não sanitizado, como:
+
+  ok         segue para o modelo
+  short      menos de min_samples amostras
+  nan_heavy  fração de valores não finitos (ou ≥ MAX_VALUE) em algum eixo
+             acima de nan_ratio
+  flatline   algum eixo com desvio padrão ≤ flatline_std
+  saturated  algum eixo com mais de saturation_ratio das amostras no pico
+             (|valor| ≥ saturation_floor, ~2 g em m/s²: a menor faixa do MPU6050)
+
+Numa janela ok com poucos valores inválidos, repair() troca cada um pela
+média dos valores válidos do eixo antes da extração de features: a janela
+é pontuada pelas amostras boas e o 1e10 de finite() nunca chega ao modelo.
+
+Janelas do modo features (sem amostras brutas) passam por assess_features:
+short pelo n_samples declarado e flatline pelo std de cada eixo; NaN/Infinity
+nem chegam aqui (o vetor é recusado com 422).
+
+Janelas inválidas não são pontuadas nem entram na votação ou nos alertas;
+o estado de qualidade de cada sensor fica em /sensor/quality e no campo
+"quality" do status.
+"""
+
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+
+from payloads import MAX_VALUE
+
+STATUSES = ("ok", "short", "nan_heavy", "flatline", "saturated")
+
+
+@dataclass(frozen=True)
+class QualityConfig:
+    min_samples: int = 10
+    nan_ratio: float = 0.1
+    flatline_std: float = 1e-4       # m/s²; ruído do MPU6050 parado fica em ~1e-2
+    saturation_floor: float = 19.0   # m/s²; abaixo disso o pico não pode ser corte da faixa
+    saturation_tol: float = 0.01     # m/s² em torno do pico contados como "no pico"
+    saturation_ratio: float = 0.05
+
+
+def assess(raw: np.ndarray, config: QualityConfig = QualityConfig()) -> Tuple[str, Dict[str, Any]]:
+    """Classifica uma janela bruta (n, 3), ainda com NaN/Infinity; retorna (status, detalhes)"""
+    n_samples = raw.shape[0] if raw.ndim >= 1 else 0
+    if raw.ndim != 2 or n_samples < config.min_samples:
+        return "short", {"n_samples": n_samples}
+
+    magnitude = np.abs(raw)
+    bad = ~(magnitude < MAX_VALUE)  # NaN compara False: entra junto com ±Inf e 1e10
+    if bad.any():
+        # Fração de valores inválidos no pior eixo
+        nan_ratio = float(np.max(np.count_nonzero(bad, axis=0))) / n_samples
+        if nan_ratio > config.nan_ratio:
+            return "nan_heavy", {"n_samples": n_samples, "nan_ratio": nan_ratio}
+        # Poucos valores inválidos: ficam fora das estatísticas abaixo
+        raw = np.where(bad, np.nan, raw)
+        magnitude = np.where(bad, np.nan, magnitude)
+        std, peak = np.nanstd(raw, axis=0), np.nanmax(magnitude, axis=0)
+    else:
+        # Uma passada: E[x²] − E[x]²
+        mean = raw.sum(axis=0) / n_samples
+        var = np.einsum("ij,ij->j", raw, raw) / n_samples - np.square(mean)
+        std, peak = np.sqrt(np.maximum(var, 0.0)), magnitude.max(axis=0)
+
+    flat = std <= config.flatline_std
+    if flat.any():
+        return "flatline", {"n_samples": n_samples, "flat_axes": np.flatnonzero(flat).tolist()}
+
+    # Só eixos cujo pico chega à faixa do sensor podem estar saturados
+    if (peak >= config.saturation_floor).any():
+        at_peak = (magnitude >= peak - config.saturation_tol) & (peak >= config.saturation_floor)
+        saturated_ratio = float(np.max(np.count_nonzero(at_peak, axis=0))) / n_samples
+        if saturated_ratio > config.saturation_ratio:
+            return "saturated", {"n_samples": n_samples, "saturated_ratio": saturated_ratio}
+    return "ok", {"n_samples": n_samples}
+
+
+def repair(raw: np.ndarray) -> np.ndarray:
+    """
+    Troca NaN/Infinity (e |valor| ≥ MAX_VALUE) pela média dos valores válidos
+    do eixo. Eixo sem nenhum valor válido fica NaN (finite() decide depois).
+    Sem valores inválidos, devolve o próprio array.
+    """
+    if raw.ndim != 2:
+        return raw
+    bad = ~(np.abs(raw) < MAX_VALUE)
+    if not bad.any():
+        return raw
+    good = np.where(bad, 0.0, raw)
+    counts = raw.shape[0] - np.count_nonzero(bad, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = good.sum(axis=0) / counts
+    return np.where(bad, means, raw)
+
+
+def assess_features(std: np.ndarray, n_samples: int,
+                    config: QualityConfig = QualityConfig()) -> Tuple[str, Dict[str, Any]]:
+    """Classifica uma janela do modo features pelo std de cada eixo (já finito)"""
+    if n_samples < config.min_samples:
+        return "short", {"n_samples": n_samples}
+    flat = std <= config.flatline_std
+    if flat.any():
+        return "flatline", {"n_samples": n_samples, "flat_axes": np.flatnonzero(flat).tolist()}
+    return "ok", {"n_samples": n_samples}
+
+
+class SensorQuality:
+    __slots__ = ("status", "details", "since", "counts", "changes")
+
+    def __init__(self, now: float):
+        self.status = "ok"
+        self.details: Dict[str, Any] = {}
+        self.since = now
+        self.counts: Counter = Counter()
+        self.changes = 0
+
+
+class SignalQuality:
+    """Último estado de qualidade de cada sensor"""
+
+    def __init__(self, config: QualityConfig = QualityConfig(), clock: Callable[[], float] = time.time):
+        self.config = config
+        self.clock = clock
+        self.sensors: Dict[str, SensorQuality] = {}
+
+    def observe(self, sensor_id: str, raw: np.ndarray) -> Tuple[str, Dict[str, Any], bool]:
+        """Classifica a janela e atualiza o sensor; retorna (status, detalhes, mudou)"""
+        return self._record(sensor_id, *assess(raw, self.config))
+
+    def observe_features(self, sensor_id: str, std: np.ndarray, n_samples: int) -> Tuple[str, Dict[str, Any], bool]:
+        """Mesmo que observe() para uma janela do modo features"""
+        return self._record(sensor_id, *assess_features(std, n_samples, self.config))
+
+    def _record(self, sensor_id: str, status: str, details: Dict[str, Any]) -> Tuple[str, Dict[str, Any], bool]:
+        now = self.clock()
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            state = self.sensors[sensor_id] = SensorQuality(now)
+        changed = status != state.status
+        if changed:
+            state.status = status
+            state.since = now
+            state.changes += 1
+        state.details = details
+        state.counts[status] += 1
+        return status, details, changed
+
+    def sensor_stats(self, sensor_id: str) -> Dict[str, Any]:
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            return {"sensor_id": sensor_id, "status": None}
+        return {
+            "sensor_id": sensor_id,
+            "status": state.status,
+            "details": state.details,
+            "for_s": self.clock() - state.since,
+            "windows": dict(state.counts),
+            "changes": state.changes,
+        }
+
+    def status_counts(self) -> Dict[str, int]:
+        counts = {status: 0 for status in STATUSES}
+        for state in self.sensors.values():
+            counts[state.status] += 1
+        return counts
+
+    def describe_config(self) -> Dict[str, Any]:
+        return asdict(self.config)
@@ -0,0 +1,189 @@
+"""
+Taxa de envio dirigida pelo servidor.
+
+Todos os sensores enviam janelas na mesma cadência, mas uma máquina parada
+ou estável custa tanto quanto uma com problema. A cada janela o servidor
+devolve uma diretiva de taxa (campo `rate` da resposta e do broadcast):
+
+  full     envia sem pausa (distância perto do threshold ou anomalia)
+  reduced  pausa `reduced_interval_s` entre janelas
+  idle     pausa `idle_interval_s` entre janelas
+
+A decisão usa a distância da janela em relação ao threshold e a
+estabilidade recente do sensor:
+
+  - distância >= burst_ratio · threshold (ou anomalia) → full imediatamente,
+    mantido por `hold_s` segundos depois da última janela alta;
+  - distância < calm_ratio · threshold sem interrupção há `calm_after_s`
+    → reduced; há `idle_after_s` → idle;
+  - qualquer janela entre calm e burst zera a contagem de calma;
+  - janela reprovada na checagem de qualidade (sem distância) → full e
+    zera a calma: um sensor com defeito não pode ser desacelerado pela
+    distância zero de uma janela não pontuada.
+
+O pior caso de atraso para perceber um incidente é a pausa do modo idle
+(a primeira janela alta já devolve full). A taxa de amostragem dentro da
+janela não muda: as features do modelo dependem dela.
+"""
+
+import time
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, Callable, Dict, Optional
+
+MODES = ("full", "reduced", "idle")
+
+
+@dataclass(frozen=True)
+class RateConfig:
+    enabled: bool = True
+    calm_ratio: float = 0.5
+    burst_ratio: float = 0.8
+    calm_after_s: float = 120.0
+    idle_after_s: float = 600.0
+    hold_s: float = 60.0
+    reduced_interval_s: float = 2.0
+    idle_interval_s: float = 10.0
+
+    def interval_s(self, mode: str) -> float:
+        if mode == "reduced":
+            return self.reduced_interval_s
+        if mode == "idle":
+            return self.idle_interval_s
+        return 0.0
+
+
+class SensorRate:
+    """Estado da política para um sensor"""
+
+    __slots__ = ("mode", "calm_since", "burst_until", "changes", "reason")
+
+    def __init__(self):
+        self.mode = "full"
+        self.calm_since: Optional[float] = None
+        self.burst_until = 0.0
+        self.changes = 0
+        self.reason = "start"
+
+
+class RatePolicy:
+    def __init__(self, defaults: RateConfig = RateConfig(),
+                 clock: Callable[[], float] = time.monotonic):
+        self.defaults = defaults
+        self.clock = clock
+        self.overrides: Dict[str, RateConfig] = {}
+        self.sensors: Dict[str, SensorRate] = {}
+
+    # ------------------------------------------------------------
+    # Configuração por sensor
+    # ------------------------------------------------------------
+    def config(self, sensor_id: str) -> RateConfig:
+        return self.overrides.get(sensor_id, self.defaults)
+
+    def configure(self, sensor_id: str, **changes: Any) -> RateConfig:
+        """Altera só os campos informados (None = mantém)"""
+        changes = {k: v for k, v in changes.items() if v is not None}
+        unknown = set(changes) - {f.name for f in fields(RateConfig)}
+        if unknown:
+            raise ValueError(f"Campos desconhecidos: {sorted(unknown)}")
+        config = replace(self.config(sensor_id), **changes)
+        if not 0 < config.calm_ratio <= config.burst_ratio:
+            raise ValueError("É preciso 0 < calm_ratio <= burst_ratio")
+        if config.idle_after_s < config.calm_after_s:
+            raise ValueError("idle_after_s não pode ser menor que calm_after_s")
+        self.overrides[sensor_id] = config
+        return config
+
+    def reset(self, sensor_id: str):
+        self.overrides.pop(sensor_id, None)
+
+    # ------------------------------------------------------------
+    # Decisão
+    # ------------------------------------------------------------
+    def _state(self, sensor_id: str) -> SensorRate:
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            state = self.sensors[sensor_id] = SensorRate()
+        return state
+
+    def observe(self, sensor_id: str, distance: float, threshold: float,
+                is_anomaly: bool = False) -> Dict[str, Any]:
+        """Atualiza o estado com a janela e retorna a diretiva para o dispositivo"""
+        config = self.config(sensor_id)
+        state = self._state(sensor_id)
+        now = self.clock()
+        ratio = distance / threshold if threshold > 0 else 0.0
+
+        if not config.enabled:
+            mode, reason = "full", "disabled"
+            state.calm_since = None
+        elif is_anomaly or ratio >= config.burst_ratio:
+            mode, reason = "full", "anomaly" if is_anomaly else "near_threshold"
+            state.burst_until = now + config.hold_s
+            state.calm_since = None
+        elif now < state.burst_until:
+            mode, reason = "full", "hold"
+            state.calm_since = None
+        elif ratio >= config.calm_ratio:
+            mode, reason = "full", "unsettled"
+            state.calm_since = None
+        else:
+            if state.calm_since is None:
+                state.calm_since = now
+            calm_for = now - state.calm_since
+            if calm_for >= config.idle_after_s:
+                mode, reason = "idle", "calm"
+            elif calm_for >= config.calm_after_s:
+                mode, reason = "reduced", "calm"
+            else:
+                mode, reason = "full", "settling"
+
+        return self._directive(state, config, mode, reason)
+
+    def unscored(self, sensor_id: str) -> Dict[str, Any]:
+        """Janela sem pontuação (qualidade ruim): taxa cheia até o sinal voltar"""
+        config = self.config(sensor_id)
+        state = self._state(sensor_id)
+        state.calm_since = None
+        reason = "quality" if config.enabled else "disabled"
+        return self._directive(state, config, "full", reason)
+
+    def _directive(self, state: SensorRate, config: RateConfig,
+                   mode: str, reason: str) -> Dict[str, Any]:
+        changed = mode != state.mode
+        if changed:
+            state.changes += 1
+        state.mode = mode
+        state.reason = reason
+        return {
+            "mode": mode,
+            "interval_ms": int(config.interval_s(mode) * 1000),
+            "reason": reason,
+            "changed": changed,
+        }
+
+    # ------------------------------------------------------------
+    # Estatísticas
+    # ------------------------------------------------------------
+    def sensor_stats(self, sensor_id: str) -> Dict[str, Any]:
+        state = self.sensors.get(sensor_id)
+        info: Dict[str, Any] = {
+            "sensor_id": sensor_id,
+            "config": asdict(self.config(sensor_id)),
+            "custom": sensor_id in self.overrides,
+        }
+        if state is not None:
+            now = self.clock()
+            info.update({
+                "mode": state.mode,
+                "reason": state.reason,
+                "interval_ms": int(self.config(sensor_id).interval_s(state.mode) * 1000),
+                "calm_for_s": now - state.calm_since if state.calm_since is not None else 0.0,
+                "mode_changes": state.changes,
+            })
+        return info
+
+    def mode_counts(self) -> Dict[str, int]:
+        counts = {mode: 0 for mode in MODES}
+        for state in self.sensors.values():
+            counts[state.mode] += 1
+        return counts
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Gravações Compactas de Amostras Brutas (.vrec)
+==============================================
+As gravações eram CSV em texto ("x,y,z" por linha, ~25 bytes por amostra;
+datasets/ac são milhares de arquivos de 200 linhas) e lidas com np.loadtxt,
+que faz o parsing linha a linha. O formato .vrec guarda as mesmas janelas
+em blocos (chunks) comprimidos:
+
+  - cada chunk é quantizado em inteiros por eixo com escala própria:
+    x = centro + q·escala. A escala parte da resolução do MPU6050 em ±4 g
+    (SENSOR_STEP = g/8192, a faixa que o firmware configura) e vira o maior
+    passo comum das amostras quando elas já estão numa grade (os CSVs do
+    dataset têm passo de 2 LSB): aí a quantização é exata. Fora da grade
+    (dados sintéticos), o erro é ≤ SENSOR_STEP/2, abaixo da resolução do
+    sensor; janelas com amplitude maior que 65534 passos usam
+    escala = amplitude/65534 (q sempre cabe em int16);
+  - q vai em zig-zag (0, −1, 1, −2, ... → 0, 1, 2, 3, ...) direto ou depois
+    da diferença entre amostras consecutivas, o que ficar menor (a diferença
+    ganha em sinais lentos; em ruído de vibração, não);
+  - eixo a eixo, no menor inteiro sem sinal que couber (1, 2 ou 4 bytes),
+    com os bytes separados em planos (todos os bytes baixos, depois os
+    altos: os altos são quase todos zero) e zlib;
+  - um cabeçalho fixo por chunk (nº de amostras, tamanho comprimido, t0 em
+    ms e centro/escala de cada eixo) permite pular chunks sem descomprimir:
+    o índice é montado lendo só os cabeçalhos e qualquer chunk é lido por
+    posição (acesso aleatório);
+  - a decodificação é toda vetorizada: np.frombuffer, planos de bytes com
+    reshape/transpose, zig-zag com operações de bits, np.cumsum (se houver
+    diferença) e a escala, direto num array (n, 3).
+
+Um chunk por janela (uma janela do ESP32 ou um CSV do dataset): o índice
+do chunk é o índice da janela. Só há acréscimos no fim do arquivo, então
+gravar janela a janela é seguro mesmo se o processo cair.
+
+Uso:
+  python recording.py convert datasets/ac/silent_0_baseline -o recordings/silent_0_baseline.vrec
+  python recording.py info recordings/silent_0_baseline.vrec
+  python recording.py export recordings/silent_0_baseline.vrec -o /tmp/csv
+"""
+
+import argparse
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+MAGIC = b"VREC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sB3x")
+# magic, eixos, flags, bytes por valor, amostras, bytes comprimidos, t0_ms, centro[3], escala[3]
+CHUNK_HEADER = struct.Struct("<2sBBB3xIId3d3d")
+CHUNK_MAGIC = b"CK"
+FLAG_DELTA = 0x01
+AXES = 3
+Q_MAX = 32767
+SENSOR_STEP = 9.80665 / 8192  # 1 LSB do MPU6050 em ±4 g, em m/s²
+ZLIB_LEVEL = 6
+_UINT = {1: np.uint8, 2: np.uint16, 4: np.uint32}
+
+
+# ============================================================
+# CODIFICAÇÃO
+# ============================================================
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return ((values << 1) ^ (values >> 31)).astype(np.uint32)
+
+
+def _pack(zigzag: np.ndarray) -> Tuple[int, bytes]:
+    """Menor largura que cabe, bytes em planos e zlib"""
+    top = int(zigzag.max())
+    width = 1 if top <= 0xFF else 2 if top <= 0xFFFF else 4
+    values = np.ascontiguousarray(zigzag, dtype=_UINT[width])
+    planes = values.view(np.uint8).reshape(-1, width).T
+    return width, zlib.compress(planes.tobytes(), ZLIB_LEVEL)
+
+
+def _quantize(samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(q int32 eixo a eixo (3, n), centro, escala) com x ≈ centro + q·escala"""
+    high, low = samples.max(axis=0), samples.min(axis=0)
+    step = np.maximum(SENSOR_STEP, (high - low) / (2 * Q_MAX))
+    grid = np.rint(samples / step).astype(np.int64).T
+    # Amostras numa grade mais grossa (múltiplos de k passos): usa k·passo
+    k = np.gcd.reduce(np.abs(grid - grid[:, :1]), axis=1)
+    k[k == 0] = 1
+    offset = grid[:, 0] % k
+    scale = step * k
+    mid = np.rint(((grid.max(axis=1) + grid.min(axis=1)) / 2 - offset) / k).astype(np.int64)
+    q = (grid - offset[:, None]) // k[:, None] - mid[:, None]
+    center = (mid * k + offset) * step
+    return q.astype(np.int32), center, scale
+
+
+def encode_chunk(samples: np.ndarray, t0_ms: float = float("nan")) -> bytes:
+    """Cabeçalho + payload de uma janela (n, 3); valores não finitos viram 0"""
+    samples = np.nan_to_num(np.asarray(samples, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+    if samples.ndim != 2 or samples.shape[1] != AXES or samples.shape[0] == 0:
+        raise ValueError(f"Janela deve ter formato (n, {AXES}) com n > 0")
+    q, center, scale = _quantize(samples)
+
+    flags, (width, payload) = 0, _pack(_zigzag(q))
+    delta_width, delta_payload = _pack(_zigzag(np.diff(q, axis=1, prepend=0)))
+    if len(delta_payload) < len(payload):
+        flags, width, payload = FLAG_DELTA, delta_width, delta_payload
+    header = CHUNK_HEADER.pack(CHUNK_MAGIC, AXES, flags, width, samples.shape[0], len(payload),
+                               t0_ms, *center, *scale)
+    return header + payload
+
+
+def decode_chunk(header: Tuple, payload: bytes) -> np.ndarray:
+    """Janela (n, 3) em float64 a partir de um cabeçalho desempacotado e do payload"""
+    _, axes, flags, width, n_samples, _, _ = header[:7]
+    center = np.array(header[7:7 + axes])
+    scale = np.array(header[7 + axes:7 + 2 * axes])
+    planes = np.frombuffer(zlib.decompress(payload), dtype=np.uint8).reshape(width, axes * n_samples)
+    zigzag = np.ascontiguousarray(planes.T).view(_UINT[width]).astype(np.int64).reshape(axes, n_samples)
+    q = (zigzag >> 1) ^ -(zigzag & 1)
+    if flags & FLAG_DELTA:
+        q = np.cumsum(q, axis=1)
+    return q.T * scale + center
+
+
+# ============================================================
+# ESCRITA
+# ============================================================
+def append_windows(path: Path, windows: Sequence[np.ndarray],
+                   t0_ms: Optional[Sequence[float]] = None):
+    """Acrescenta janelas (um chunk cada) ao arquivo, criando-o se preciso"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    chunks = [
+        encode_chunk(w, t0_ms[i] if t0_ms is not None else float("nan"))
+        for i, w in enumerate(windows)
+    ]
+    try:
+        # Criação exclusiva: de vários processos gravando no mesmo arquivo, só um escreve o cabeçalho
+        with open(path, "xb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, VERSION))
+    except FileExistsError:
+        pass
+    # Um write em modo append por chamada: chunks de processos diferentes não se misturam
+    with open(path, "ab") as f:
+        f.write(b"".join(chunks))
+
+
+# ============================================================
+# LEITURA
+# ============================================================
+class Recording:
+    """Arquivo .vrec com índice de chunks (só cabeçalhos lidos na abertura)"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.offsets: List[int] = []
+        self.headers: List[Tuple] = []
+        size = self.path.stat().st_size
+        with open(self.path, "rb") as f:
+            raw = f.read(FILE_HEADER.size)
+            if len(raw) < FILE_HEADER.size:
+                return  # arquivo recém-criado, cabeçalho ainda não escrito
+            magic, version = FILE_HEADER.unpack(raw)
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} não é um arquivo .vrec")
+            if version != VERSION:
+                raise ValueError(f"Versão {version} do .vrec não suportada")
+            while True:
+                raw = f.read(CHUNK_HEADER.size)
+                if len(raw) < CHUNK_HEADER.size:
+                    break  # fim (ou último chunk cortado por uma queda: ignorado)
+                header = CHUNK_HEADER.unpack(raw)
+                if header[0] != CHUNK_MAGIC:
+                    raise ValueError(f"Chunk corrompido em {self.path} (byte {f.tell() - len(raw)})")
+                offset = f.tell()
+                f.seek(header[5], 1)
+                if f.tell() > size:
+                    break
+                self.offsets.append(offset)
+                self.headers.append(header)
+
+    def __len__(self) -> int:
+        return len(self.headers)
+
+    @property
+    def n_samples(self) -> int:
+        return sum(h[4] for h in self.headers)
+
+    def t0_ms(self, index: int) -> Optional[float]:
+        t0 = self.headers[index][6]
+        return None if np.isnan(t0) else t0
+
+    def read(self, indices: Optional[Sequence[int]] = None) -> List[np.ndarray]:
+        """Janelas nos índices pedidos (todas se None), em ordem de leitura sequencial"""
+        if indices is None:
+            indices = range(len(self.headers))
+        order = sorted(set(indices))
+        decoded = {}
+        with open(self.path, "rb") as f:
+            for i in order:
+                header = self.headers[i]
+                f.seek(self.offsets[i])
+                decoded[i] = decode_chunk(header, f.read(header[5]))
+        return [decoded[i] for i in indices]
+
+    def chunk(self, index: int) -> np.ndarray:
+        return self.read([index])[0]
+
+    def samples(self) -> np.ndarray:
+        """Todas as amostras concatenadas (N, 3)"""
+        windows = self.read()
+        return np.concatenate(windows) if windows else np.empty((0, AXES))
+
+
+def load_windows(directories: Union[str, Path, Sequence[Union[str, Path]]],
+                 max_windows: Optional[int] = None,
+                 rng: Optional[np.random.Generator] = None) -> List[np.ndarray]:
+    """
+    Janelas de uma ou mais pastas: chunks dos .vrec e arquivos .csv (x,y,z).
+    Com max_windows, sorteia as janelas antes de ler (só as escolhidas são
+    decodificadas ou parseadas).
+    """
+    if isinstance(directories, (str, Path)):
+        directories = [directories]
+    sources: List[Tuple[Path, Optional[int]]] = []
+    recordings = {}
+    for directory in map(Path, directories):
+        for path in sorted(directory.glob("*.vrec")):
+            recordings[path] = Recording(path)
+            sources.extend((path, i) for i in range(len(recordings[path])))
+        sources.extend((path, None) for path in sorted(directory.glob("*.csv")))
+    if max_windows is not None and len(sources) > max_windows:
+        rng = rng or np.random.default_rng()
+        sources = [sources[i] for i in sorted(rng.choice(len(sources), max_windows, replace=False))]
+
+    windows: List[np.ndarray] = []
+    by_recording = {}
+    for path, index in sources:
+        if index is not None:
+            by_recording.setdefault(path, []).append(index)
+    for path, indices in by_recording.items():
+        windows.extend(recordings[path].read(indices))
+    for path, index in sources:
+        if index is None:
+            windows.append(np.loadtxt(path, delimiter=",", ndmin=2))
+    return windows
+
+
+# ============================================================
+# LINHA DE COMANDO
+# ============================================================
+def _csv_files(directory: Path) -> Iterator[Path]:
+    yield from sorted(directory.glob("*.csv"))
+
+
+def convert(directory: Path, output: Path) -> Tuple[int, int, int]:
+    """Converte os CSVs de uma pasta (um chunk por arquivo); retorna (janelas, bytes CSV, bytes .vrec)"""
+    windows, csv_bytes = [], 0
+    for path in _csv_files(directory):
+        data = np.loadtxt(path, delimiter=",", ndmin=2)
+        if data.ndim != 2 or data.shape[1] != AXES or data.shape[0] == 0:
+            continue
+        windows.append(data)
+        csv_bytes += path.stat().st_size
+    if output.exists():
+        output.unlink()
+    append_windows(output, windows)
+    return len(windows), csv_bytes, output.stat().st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gravações compactas de amostras brutas (.vrec)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    conv = commands.add_parser("convert", help="Converte uma pasta de CSVs (x,y,z) em um .vrec")
+    conv.add_argument("directory", type=Path)
+    conv.add_argument("-o", "--output", type=Path, required=True)
+    info = commands.add_parser("info", help="Resumo de um .vrec")
+    info.add_argument("file", type=Path)
+    export = commands.add_parser("export", help="Exporta cada chunk de um .vrec como CSV")
+    export.add_argument("file", type=Path)
+    export.add_argument("-o", "--output", type=Path, required=True)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        n_windows, csv_bytes, vrec_bytes = convert(args.directory, args.output)
+        if not n_windows:
+            print(f"⚠️ Nenhum CSV válido em {args.directory}")
+            return
+        t0 = time.perf_counter()
+        for path in _csv_files(args.directory):
+            np.loadtxt(path, delimiter=",", ndmin=2)
+        csv_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        Recording(args.output).read()
+        vrec_s = time.perf_counter() - t0
+        print(f"💾 {n_windows} janelas → {args.output}")
+        print(f"   Tamanho: {csv_bytes / 1024:.0f} KB (CSV) → {vrec_bytes / 1024:.0f} KB "
+              f"({csv_bytes / vrec_bytes:.1f}x menor)")
+        print(f"   Leitura: {csv_s * 1000:.0f} ms (loadtxt) → {vrec_s * 1000:.0f} ms "
+              f"({csv_s / vrec_s:.1f}x mais rápida)")
+        return
+
+    recording = Recording(args.file)
+    if args.command == "info":
+        size = args.file.stat().st_size
+        print(f"📼 {args.file}: {len(recording)} chunks, {recording.n_samples} amostras, "
+              f"{size / 1024:.0f} KB ({size / max(recording.n_samples, 1):.2f} bytes/amostra)")
+        return
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    for i, window in enumerate(recording.read()):
+        np.savetxt(args.output / f"chunk_{i:06d}.csv", window, delimiter=",", fmt="%.6f")
+    print(f"📁 {len(recording)} chunks exportados para {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Histórico bruto por sensor e políticas de retenção.
+
+Com RECORD_RAW=1 o servidor guarda as amostras brutas de cada sensor em
+gravações .vrec diárias (recording.py; um chunk por janela):
+RECORDINGS_DIR/raw/<sensor>/AAAAMMDD.vrec. A 200 Hz × 3 eixos são ~3–4
+bytes por amostra, ~60 MB por sensor por dia: o disco enche em semanas. A
+retenção é feita em camadas:
+
+  - raw: as gravações brutas ficam RETENTION_RAW_DAYS dias (padrão 7);
+  - rollup: depois disso cada dia vira um resumo por intervalos de
+    RETENTION_ROLLUP_S segundos (padrão 10): mínimo, máximo e RMS por eixo
+    e o nº de amostras (RECORDINGS_DIR/rollup/<sensor>/AAAAMMDD.npz, ~300x
+    menor que o bruto), mantido RETENTION_ROLLUP_DAYS dias (padrão 90);
+  - captures: as capturas em volta dos alertas (capture.py) ficam
+    RETENTION_CAPTURE_DAYS dias (padrão 365). A listagem já ignora capturas
+    cujo arquivo sumiu.
+
+Dias ≤ 0 desligam a remoção da camada. A ingestão não escreve janela a
+janela: o HistoryWriter junta as janelas em memória e as grava a cada
+RECORD_FLUSH_S segundos numa thread, um write por arquivo.
+
+A compactação e as remoções rodam a cada RETENTION_INTERVAL_S segundos
+(padrão 3600) numa thread, em lotes grandes e sequenciais (BATCH_CHUNKS
+chunks lidos em ordem de arquivo, remoções ordenadas por caminho), com duas
+travas para não disputar com a ingestão:
+
+  - no máximo RETENTION_MAX_MB_S MB/s lidos ou removidos (padrão 20);
+  - pausa enquanto o atraso do event loop passar de MAX_LOOP_LAG_S.
+
+Com vários workers, só um faz a passada: o arquivo .retention.lock
+(criação exclusiva) marca quem está rodando; uma trava mais velha que
+LOCK_STALE_S é de um processo que caiu e é retomada.
+
+Uso:
+  python retention.py usage
+  python retention.py run          # uma passada agora, sem travas de taxa
+"""
+
+import argparse
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from capture import CAPTURES_DIR
+from recording import AXES, Recording, append_windows
+
+RECORDINGS_DIR = Path(os.environ.get("RECORDINGS_DIR", "logs/recordings"))
+TIERS = ("raw", "rollup", "captures")
+DAY_FORMAT = "%Y%m%d"
+BATCH_CHUNKS = 2000
+MAX_LOOP_LAG_S = 0.05
+MAX_PAUSE_S = 30.0
+LOCK_NAME = ".retention.lock"
+LOCK_STALE_S = 6 * 3600
+
+DEFAULT_RAW_DAYS = 7.0
+DEFAULT_ROLLUP_DAYS = 90.0
+DEFAULT_CAPTURE_DAYS = 365.0
+DEFAULT_ROLLUP_S = 10.0
+DEFAULT_INTERVAL_S = 3600.0
+DEFAULT_MAX_MB_S = 20.0
+DEFAULT_FLUSH_S = 5.0
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_.-]")
+_DAY_RE = re.compile(r"^(\d{8})\.(vrec|npz)$")
+
+retention_bytes = metrics.counter(
+    "anomaly_retention_bytes_total",
+    "Bytes liberados pela retenção (raw = compactados em rollup)",
+    ["tier"],
+)
+history_windows = metrics.counter(
+    "anomaly_history_windows_total",
+    "Janelas brutas gravadas no histórico",
+)
+
+
+def safe_sensor_id(sensor_id: str) -> str:
+    return _UNSAFE_RE.sub("_", sensor_id)
+
+
+def _file_day(path: Path) -> Optional[date]:
+    match = _DAY_RE.match(path.name)
+    if match is None:
+        return None
+    try:
+        return datetime.strptime(match.group(1), DAY_FORMAT).date()
+    except ValueError:
+        return None
+
+
+# ============================================================
+# HISTÓRICO BRUTO
+# ============================================================
+class HistoryWriter:
+    """Janelas brutas de cada sensor em memória até a próxima gravação"""
+
+    def __init__(self, directory: Path = RECORDINGS_DIR):
+        self.directory = directory / "raw"
+        self.pending: Dict[str, List[Tuple[float, np.ndarray]]] = {}
+        self.windows = 0
+        self.bytes = 0
+
+    def add(self, sensor_id: str, t_ms: np.ndarray, xyz: np.ndarray):
+        if t_ms.size:
+            self.pending.setdefault(sensor_id, []).append((float(t_ms[0]), xyz))
+
+    def take(self) -> Dict[str, List[Tuple[float, np.ndarray]]]:
+        """Troca o buffer (no event loop); o retornado vai para write()"""
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def write(self, pending: Dict[str, List[Tuple[float, np.ndarray]]]) -> int:
+        """Acrescenta as janelas aos arquivos do dia (chamado fora do event loop)"""
+        written = 0
+        for sensor_id, windows in pending.items():
+            by_day: Dict[str, List[Tuple[float, np.ndarray]]] = {}
+            for t0_ms, xyz in windows:
+                day = datetime.fromtimestamp(t0_ms / 1000).strftime(DAY_FORMAT)
+                by_day.setdefault(day, []).append((t0_ms, xyz))
+            for day, day_windows in by_day.items():
+                path = self.directory / safe_sensor_id(sensor_id) / f"{day}.vrec"
+                size = path.stat().st_size if path.exists() else 0
+                append_windows(path, [xyz for _, xyz in day_windows], [t0 for t0, _ in day_windows])
+                self.bytes += path.stat().st_size - size
+                written += len(day_windows)
+        self.windows += written
+        history_windows.root.inc(written)
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "pending_windows": sum(len(w) for w in self.pending.values()),
+            "windows": self.windows,
+            "bytes": self.bytes,
+        }
+
+
+# ============================================================
+# ROLLUP
+# ============================================================
+def rollup_recording(path: Path, period_s: float = DEFAULT_ROLLUP_S,
+                     pause: Callable[[int], None] = lambda nbytes: None) -> Dict[str, np.ndarray]:
+    """
+    Mínimo, máximo e RMS por eixo de cada intervalo de period_s segundos.
+    Lê a gravação em lotes de BATCH_CHUNKS chunks, na ordem do arquivo;
+    pause(bytes) é chamado depois de cada lote (trava de taxa).
+    """
+    recording = Recording(path)
+    t0 = np.array([h[6] for h in recording.headers])
+    counts, lows, highs, squares = [], [], [], []
+    for start in range(0, len(recording), BATCH_CHUNKS):
+        indices = range(start, min(start + BATCH_CHUNKS, len(recording)))
+        windows = recording.read(indices)
+        samples = np.concatenate(windows)
+        bounds = np.cumsum([0] + [len(w) for w in windows[:-1]])
+        counts.append(np.diff(np.append(bounds, len(samples))))
+        lows.append(np.minimum.reduceat(samples, bounds))
+        highs.append(np.maximum.reduceat(samples, bounds))
+        squares.append(np.add.reduceat(samples ** 2, bounds))
+        pause(sum(recording.headers[i][5] for i in indices))
+    if not counts:
+        return empty_rollup(period_s)
+
+    # Chunks sem t0 ficam no começo do dia do arquivo
+    day = _file_day(path)
+    day_ms = datetime.combine(day, datetime.min.time()).timestamp() * 1000 if day else 0.0
+    t0 = np.where(np.isfinite(t0), t0, day_ms)
+    period_ms = period_s * 1000
+    buckets = np.floor(t0 / period_ms)
+    order = np.argsort(buckets, kind="stable")
+    starts = np.flatnonzero(np.diff(buckets[order], prepend=np.nan) != 0)
+    n = np.add.reduceat(np.concatenate(counts)[order], starts)
+    return {
+        "t0_ms": buckets[order][starts] * period_ms,
+        "samples": n.astype(np.int32),
+        "min": np.minimum.reduceat(np.concatenate(lows)[order], starts).astype(np.float32),
+        "max": np.maximum.reduceat(np.concatenate(highs)[order], starts).astype(np.float32),
+        "rms": np.sqrt(np.add.reduceat(np.concatenate(squares)[order], starts) / n[:, None]).astype(np.float32),
+        "period_s": np.array(period_s),
+    }
+
+
+def empty_rollup(period_s: float) -> Dict[str, np.ndarray]:
+    return {
+        "t0_ms": np.empty(0),
+        "samples": np.empty(0, dtype=np.int32),
+        "min": np.empty((0, AXES), dtype=np.float32),
+        "max": np.empty((0, AXES), dtype=np.float32),
+        "rms": np.empty((0, AXES), dtype=np.float32),
+        "period_s": np.array(period_s),
+    }
+
+
+def load_rollup(path: Path) -> Dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def write_rollup(rollup: Dict[str, np.ndarray], path: Path):
+    """Grava o rollup (somando ao que já existir do mesmo dia) com troca atômica"""
+    if path.exists():
+        previous = load_rollup(path)
+        merged = {
+            key: np.concatenate([previous[key], rollup[key]])
+            for key in ("t0_ms", "samples", "min", "max", "rms")
+        }
+        order = np.argsort(merged["t0_ms"], kind="stable")
+        rollup = {key: value[order] for key, value in merged.items()}
+        rollup["period_s"] = previous["period_s"]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **rollup)
+    tmp.replace(path)
+
+
+# ============================================================
+# POLÍTICAS E PASSADA DE RETENÇÃO
+# ============================================================
+class Throttle:
+    """Limita os bytes por segundo e espera o event loop folgar"""
+
+    def __init__(self, max_bytes_s: float, max_lag_s: float = MAX_LOOP_LAG_S,
+                 lag: Callable[[], float] = lambda: metrics.EVENT_LOOP_LAG_LAST.value):
+        self.max_bytes_s = max_bytes_s
+        self.max_lag_s = max_lag_s
+        self.lag = lag
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.paused_s = 0.0
+
+    def __call__(self, nbytes: int):
+        self.bytes += nbytes
+        if self.max_bytes_s > 0:
+            ahead = self.bytes / self.max_bytes_s - (time.monotonic() - self.started)
+            if ahead > 0:
+                time.sleep(ahead)
+                self.paused_s += ahead
+        waited = 0.0
+        while self.lag() > self.max_lag_s and waited < MAX_PAUSE_S:
+            time.sleep(1.0)
+            waited += 1.0
+        self.paused_s += waited
+
+
+class RetentionManager:
+    def __init__(self, directory: Path = RECORDINGS_DIR, captures_dir: Path = CAPTURES_DIR,
+                 raw_days: float = DEFAULT_RAW_DAYS, rollup_days: float = DEFAULT_ROLLUP_DAYS,
+                 capture_days: float = DEFAULT_CAPTURE_DAYS, rollup_s: float = DEFAULT_ROLLUP_S,
+                 interval_s: float = DEFAULT_INTERVAL_S, max_mb_s: float = DEFAULT_MAX_MB_S):
+        self.directory = directory
+        self.captures_dir = captures_dir
+        self.days = {"raw": raw_days, "rollup": rollup_days, "captures": capture_days}
+        self.rollup_s = rollup_s
+        self.interval_s = interval_s
+        self.max_mb_s = max_mb_s
+        self.last_pass: Optional[Dict[str, Any]] = None
+        self.usage_snapshot: Optional[Dict[str, Any]] = None
+
+    def _tier_files(self, tier: str) -> List[Tuple[str, Path]]:
+        """(sensor, arquivo) da camada, em ordem de caminho"""
+        if tier == "captures":
+            if not self.captures_dir.is_dir():
+                return []
+            return [
+                (path.stem.rsplit("_", 2)[0], path)
+                for path in sorted(self.captures_dir.glob("*.npz"))
+            ]
+        root = self.directory / tier
+        if not root.is_dir():
+            return []
+        suffix = "vrec" if tier == "raw" else "npz"
+        return [(path.parent.name, path) for path in sorted(root.glob(f"*/*.{suffix}"))]
+
+    def _expired(self, tier: str, today: date) -> List[Path]:
+        days = self.days[tier]
+        if days <= 0:
+            return []
+        if tier == "captures":
+            cutoff = time.time() - days * 86400
+            return [path for _, path in self._tier_files(tier) if path.stat().st_mtime < cutoff]
+        cutoff_day = today - timedelta(days=days)
+        return [path for _, path in self._tier_files(tier)
+                if (_file_day(path) or today) < cutoff_day]
+
+    def _acquire(self) -> bool:
+        """Trava entre workers: criação exclusiva do arquivo; trava velha é retomada"""
+        lock = self.directory / LOCK_NAME
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - lock.stat().st_mtime < LOCK_STALE_S:
+                    return False
+                lock.unlink()
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError:
+                return False
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return True
+
+    def _release(self):
+        try:
+            (self.directory / LOCK_NAME).unlink()
+        except FileNotFoundError:
+            pass
+
+    def run(self, throttle: Optional[Throttle] = None, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        """
+        Uma passada: compacta os dias brutos vencidos e remove o que passou do
+        prazo em cada camada. None se outro worker está fazendo a passada.
+        """
+        if not self._acquire():
+            return None
+        throttle = throttle or Throttle(0, max_lag_s=float("inf"))
+        today = today or date.today()
+        started = time.time()
+        result = {"compacted": 0, "deleted": {tier: 0 for tier in TIERS},
+                  "freed_bytes": {tier: 0 for tier in TIERS}, "errors": 0}
+        try:
+            # Bruto vencido vira rollup (se o rollup ainda estiver no prazo) antes de sair
+            rollup_cutoff = today - timedelta(days=self.days["rollup"])
+            for path in self._expired("raw", today):
+                size = path.stat().st_size
+                try:
+                    day = _file_day(path)
+                    if self.days["rollup"] <= 0 or day is None or day >= rollup_cutoff:
+                        rollup = rollup_recording(path, self.rollup_s, throttle)
+                        target = self.directory / "rollup" / path.parent.name / f"{path.stem}.npz"
+                        write_rollup(rollup, target)
+                        result["compacted"] += 1
+                    path.unlink()
+                except (OSError, ValueError) as e:
+                    result["errors"] += 1
+                    result.setdefault("last_error", f"{path}: {e}")
+                    continue
+                result["deleted"]["raw"] += 1
+                result["freed_bytes"]["raw"] += size
+                retention_bytes.labels("raw").inc(size)
+
+            for tier in ("rollup", "captures"):
+                for path in self._expired(tier, today):
+                    try:
+                        size = path.stat().st_size
+                        path.unlink()
+                    except OSError:
+                        result["errors"] += 1
+                        continue
+                    result["deleted"][tier] += 1
+                    result["freed_bytes"][tier] += size
+                    retention_bytes.labels(tier).inc(size)
+                    throttle(size)
+
+            # Pastas de sensores que ficaram vazias
+            for tier in ("raw", "rollup"):
+                root = self.directory / tier
+                if root.is_dir():
+                    for sensor_dir in root.iterdir():
+                        if sensor_dir.is_dir() and not any(sensor_dir.iterdir()):
+                            sensor_dir.rmdir()
+        finally:
+            self._release()
+        result["elapsed_s"] = time.time() - started
+        result["throttled_s"] = throttle.paused_s
+        result["finished_at"] = datetime.now().isoformat()
+        self.last_pass = result
+        self.usage()
+        return result
+
+    def usage(self, sensor_id: Optional[str] = None) -> Dict[str, Any]:
+        """Bytes e arquivos por sensor e camada (com o dia mais antigo e o mais novo)"""
+        sensors: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        tiers = {tier: {"bytes": 0, "files": 0} for tier in TIERS}
+        wanted = safe_sensor_id(sensor_id) if sensor_id is not None else None
+        for tier in TIERS:
+            for sensor, path in self._tier_files(tier):
+                if wanted is not None and sensor != wanted:
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if tier == "captures":
+                    day = datetime.fromtimestamp(stat.st_mtime).date()
+                else:
+                    day = _file_day(path)
+                entry = sensors.setdefault(sensor, {}).setdefault(
+                    tier, {"bytes": 0, "files": 0, "oldest": None, "newest": None})
+                entry["bytes"] += stat.st_size
+                entry["files"] += 1
+                if day is not None:
+                    day_s = day.isoformat()
+                    entry["oldest"] = min(entry["oldest"] or day_s, day_s)
+                    entry["newest"] = max(entry["newest"] or day_s, day_s)
+                tiers[tier]["bytes"] += stat.st_size
+                tiers[tier]["files"] += 1
+        usage = {
+            "tiers": tiers,
+            "total_bytes": sum(t["bytes"] for t in tiers.values()),
+            "sensors": sensors,
+            "measured_at": datetime.now().isoformat(),
+        }
+        if sensor_id is None:
+            self.usage_snapshot = usage
+        return usage
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "captures_directory": str(self.captures_dir),
+            "days": self.days,
+            "rollup_s": self.rollup_s,
+            "interval_s": self.interval_s,
+            "max_mb_s": self.max_mb_s,
+            "last_pass": self.last_pass,
+        }
+
+
+# ============================================================
+# CONFIGURAÇÃO
+# ============================================================
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def record_raw_from_env() -> bool:
+    return os.environ.get("RECORD_RAW", "0").lower() in ("1", "true", "yes")
+
+
+def flush_interval_from_env() -> float:
+    return max(0.5, _env_number("RECORD_FLUSH_S", DEFAULT_FLUSH_S))
+
+
+def retention_options_from_env() -> Dict[str, Any]:
+    return {
+        "raw_days": _env_number("RETENTION_RAW_DAYS", DEFAULT_RAW_DAYS),
+        "rollup_days": _env_number("RETENTION_ROLLUP_DAYS", DEFAULT_ROLLUP_DAYS),
+        "capture_days": _env_number("RETENTION_CAPTURE_DAYS", DEFAULT_CAPTURE_DAYS),
+        "rollup_s": max(1.0, _env_number("RETENTION_ROLLUP_S", DEFAULT_ROLLUP_S)),
+        "interval_s": max(60.0, _env_number("RETENTION_INTERVAL_S", DEFAULT_INTERVAL_S)),
+        "max_mb_s": max(0.0, _env_number("RETENTION_MAX_MB_S", DEFAULT_MAX_MB_S)),
+    }
+
+
+# ============================================================
+# LINHA DE COMANDO
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Retenção do histórico bruto, rollups e capturas")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("usage", help="Espaço usado por sensor e camada")
+    commands.add_parser("run", help="Uma passada de retenção agora (sem trava de taxa)")
+    args = parser.parse_args()
+
+    manager = RetentionManager(**retention_options_from_env())
+    if args.command == "run":
+        result = manager.run()
+        if result is None:
+            print(f"⏳ Outra passada em andamento ({manager.directory / LOCK_NAME})")
+            return
+        print(f"🧹 {result['compacted']} dias compactados em rollup; removidos {result['deleted']} "
+              f"({sum(result['freed_bytes'].values()) / 1e6:.1f} MB) em {result['elapsed_s']:.1f} s")
+
+    usage = manager.usage()
+    for sensor, tiers in sorted(usage["sensors"].items()):
+        parts = [f"{tier} {t['bytes'] / 1e6:.1f} MB ({t['files']} arquivos, {t['oldest']}…{t['newest']})"
+                 for tier, t in sorted(tiers.items())]
+        print(f"💾 {sensor}: " + "; ".join(parts))
+    print(f"💾 Total: {usage['total_bytes'] / 1e6:.1f} MB " +
+          " ".join(f"{tier}={t['bytes'] / 1e6:.1f} MB" for tier, t in usage["tiers"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Deduplicação de janelas por número de sequência.
+
+Quando o ESP32 reenvia um POST depois de uma falha de Wi-Fi, a mesma janela
+chega duas vezes. Com `seq` (índice da primeira amostra no contador do
+dispositivo) cada janela cobre o intervalo [seq, seq + n) de amostras, e um
+bitmap deslizante marca as amostras já recebidas nos últimos SPAN_SAMPLES.
+
+  - janela inteiramente marcada → duplicata: confirmada, não reprocessada;
+  - janela nova ou parcialmente nova → processada e marcada;
+  - buracos no bitmap → amostras ainda faltando (relatadas em stats());
+  - janela mais antiga que o bitmap → o dispositivo reiniciou o contador.
+
+O bitmap é um int do Python (bit i = amostra base + i): marcar e testar uma
+janela são duas operações com máscara, e deslizar é um shift.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# Amostras cobertas pelo bitmap (~82 s a 200 Hz, 2 KB de estado por sensor)
+SPAN_SAMPLES = 1 << 14
+MAX_REPORTED_RANGES = 20
+
+
+class SequenceTracker:
+    def __init__(self, span: int = SPAN_SAMPLES):
+        self.span = span
+        self.base: Optional[int] = None  # seq correspondente ao bit 0
+        self.end: Optional[int] = None   # maior seq + n já visto (exclusivo)
+        self.bits = 0
+
+        self.unique = 0
+        self.duplicates = 0
+        self.partial = 0
+        self.resets = 0
+
+    def restart(self):
+        """Dispositivo reiniciado (detectado por fora, ex.: relógio voltou)"""
+        if self.base is not None:
+            self.resets += 1
+        self.base = None
+
+    def _reset(self, seq: int):
+        self.base = seq
+        self.end = seq
+        self.bits = 0
+
+    def observe(self, seq: int, n: int) -> Tuple[str, int]:
+        """
+        Registra a janela [seq, seq + n).
+        Retorna (situação, amostras que faltavam antes dela), com situação em
+        "new", "partial", "duplicate" ou "reset".
+        """
+        status = "new"
+        if self.base is None:
+            self._reset(seq)
+        elif seq < self.base or seq + n > self.end + self.span:
+            # Fora do alcance do bitmap: contador reiniciado (ou salto enorme)
+            self.resets += 1
+            self._reset(seq)
+            status = "reset"
+
+        offset = seq - self.base
+        mask = ((1 << n) - 1) << offset
+        seen = self.bits & mask
+        if seen == mask:
+            self.duplicates += 1
+            return "duplicate", 0
+        if seen:
+            self.partial += 1
+            status = "partial"
+
+        missing_before = max(0, seq - self.end)
+        self.unique += 1
+        self.bits |= mask
+        self.end = max(self.end, seq + n)
+
+        # Desliza: mantém só as últimas `span` amostras
+        excess = self.end - self.base - self.span
+        if excess > 0:
+            self.bits >>= excess
+            self.base += excess
+        return status, missing_before
+
+    def missing(self) -> int:
+        """Amostras ainda não recebidas dentro do alcance do bitmap"""
+        if self.base is None:
+            return 0
+        return (self.end - self.base) - bin(self.bits).count("1")
+
+    def missing_ranges(self, limit: int = MAX_REPORTED_RANGES) -> List[List[int]]:
+        """Intervalos [início, fim) de seq ainda faltando, mais recentes primeiro"""
+        if self.base is None:
+            return []
+        width = self.end - self.base
+        # bin() vem do bit mais alto para o mais baixo: posição j ↔ bit width-1-j
+        digits = bin(self.bits)[2:].zfill(width)
+        ranges: List[List[int]] = []
+        j = 0
+        while j < width and len(ranges) < limit:
+            if digits[j] == "0":
+                k = j
+                while k < width and digits[k] == "0":
+                    k += 1
+                # Bits [width-k, width-j) estão zerados
+                ranges.append([self.base + width - k, self.base + width - j])
+                j = k
+            else:
+                j += 1
+        return ranges
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "unique_windows": self.unique,
+            "duplicates": self.duplicates,
+            "partial_overlaps": self.partial,
+            "resets": self.resets,
+            "next_seq": self.end,
+            "missing_samples": self.missing(),
+            "missing_ranges": self.missing_ranges(),
+        }
@@ -4,6 +4,10 @@ from pathlib import Path
 from datetime import datetime
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
+import numpy as np
+
+from recording import append_windows
+
 # ADICIONE ESTA VARIÁVEL GLOBAL
 sensor_readings = []  # Armazena últimas leituras
 MAX_READINGS = 100
@@ -11,8 +15,9 @@ MAX_READINGS = 100
 class SensorDataHandler(BaseHTTPRequestHandler):
     """Handler for sensor data requests"""
 
-    def __init__(self, output_dir, *args, **kwargs):
+    def __init__(self, output_dir, output_format, *args, **kwargs):
         self.output_dir = output_dir
+        self.output_format = output_format
         super().__init__(*args, **kwargs)
 
     def do_GET(self):
@@ -53,10 +58,16 @@ class SensorDataHandler(BaseHTTPRequestHandler):
             if len(sensor_readings) > MAX_READINGS:
                 sensor_readings = sensor_readings[-MAX_READINGS:]
 
-            # Salva em CSV (mantém funcionalidade original)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filepath = Path(self.output_dir) / f"sensor_data_{timestamp}.csv"
-            self._save_data_to_csv(sensor_data, filepath)
+            if self.output_format == "vrec":
+                # Um chunk por POST no arquivo do dia (ver recording.py)
+                now = datetime.now()
+                filepath = Path(self.output_dir) / f"sensor_data_{now:%Y%m%d}.vrec"
+                self._save_data_to_vrec(sensor_data, filepath, now.timestamp() * 1000)
+            else:
+                # Salva em CSV (mantém funcionalidade original)
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                filepath = Path(self.output_dir) / f"sensor_data_{timestamp}.csv"
+                self._save_data_to_csv(sensor_data, filepath)
 
             print(f"Data saved to {filepath}")
             self.send_response(200)
@@ -75,22 +86,29 @@ class SensorDataHandler(BaseHTTPRequestHandler):
             for sample in data["data"]:
                 f.write(f"{sample[0]},{sample[1]},{sample[2]}\n")
 
+    def _save_data_to_vrec(self, data, filepath, t0_ms):
+        """Append the window as a compressed chunk of the day's recording"""
+        window = np.asarray(data["data"], dtype=np.float64).reshape(-1, 3)
+        append_windows(filepath, [window], [t0_ms])
+
 # Resto do código permanece igual...
-def create_server(output_dir, port):
+def create_server(output_dir, port, output_format="vrec"):
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     def handler(*args, **kwargs):
-        return SensorDataHandler(output_dir, *args, **kwargs)
+        return SensorDataHandler(output_dir, output_format, *args, **kwargs)
     return HTTPServer(("", port), handler)
 
 def main():
     parser = argparse.ArgumentParser(description="Sensor Data Collection Server")
     parser.add_argument("-d", "--dir", type=str, default="sensor_data")
     parser.add_argument("-p", "--port", type=int, default=4242)
+    parser.add_argument("-f", "--format", choices=["vrec", "csv"], default="vrec",
+                        help="vrec: compressed daily recording (recording.py); csv: one file per POST")
     args = parser.parse_args()
     
-    server = create_server(args.dir, args.port)
+    server = create_server(args.dir, args.port, args.format)
     print("\nSensor Data Collection Server")
-    print(f"Saving data to: {args.dir}")
+    print(f"Saving data to: {args.dir} ({args.format})")
     print(f"Server running on port {args.port}")
     print("Press Ctrl+C to stop\n")
     
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Estado compartilhado entre workers do servidor.
+
+Com um único processo, o estado em tempo real (último status, amostras
+recentes, hora do último dado do sensor) vive em globais de api.py e os
+broadcasts só alcançam os clientes conectados àquele processo. Com vários
+workers uvicorn, cada janela processada precisa chegar aos demais.
+
+Cada janela processada vira um *evento* publicado num barramento:
+
+  - LocalBus: modo de um processo. Aplica o evento localmente, sem
+    serialização extra (é o comportamento histórico do servidor).
+  - BrokerBus: modo multi-worker. Aplica localmente e envia o evento a um
+    processo broker, que repassa aos demais workers. Cada worker mantém
+    um espelho do estado e faz o fan-out para os SEUS clientes WS/SSE.
+
+O broker também guarda um snapshot (último status + amostras recentes),
+entregue a cada worker que conecta ou reconecta.
+
+Protocolo: TCP local, quadros com 4 bytes de tamanho (big-endian) + JSON.
+
+Uso do broker (normalmente iniciado pelo start_server.py --workers N):
+  python shared_state.py --host 127.0.0.1 --port 8799
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from pathlib import Path
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+import metrics
+from payloads import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+BROKER_URL_ENV = "STATE_BROKER_URL"
+DEFAULT_BROKER_HOST = "127.0.0.1"
+DEFAULT_BROKER_PORT = 8799
+
+# Mesmo tamanho do buffer de amostras de api.py
+SNAPSHOT_SAMPLES = 1000
+# Worker lento: acima disso no buffer de escrita, eventos são descartados
+MAX_WRITE_BUFFER = 4 * 1024 * 1024
+MAX_FRAME = 64 * 1024 * 1024
+RECONNECT_DELAY_S = (0.5, 5.0)
+
+_HEADER = struct.Struct(">I")
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+bus_events = metrics.counter(
+    "anomaly_bus_events_total",
+    "Eventos de estado publicados/recebidos pelo barramento entre workers",
+    ["direction"],
+)
+BUS_PUBLISHED = bus_events.labels("published")
+BUS_RECEIVED = bus_events.labels("received")
+bus_dropped = metrics.counter(
+    "anomaly_bus_dropped_total",
+    "Eventos não enviados ao broker (desconectado ou buffer cheio)",
+)
+BUS_DROPPED = bus_dropped.root
+
+
+# ============================================================
+# QUADROS
+# ============================================================
+def encode_frame(event: Dict[str, Any]) -> bytes:
+    body = dumps(event).encode()
+    return _HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    header = await reader.readexactly(_HEADER.size)
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Quadro grande demais: {size} bytes")
+    return loads(await reader.readexactly(size))
+
+
+def _write(writer: asyncio.StreamWriter, frame: bytes) -> bool:
+    """Escreve sem bloquear; recusa se o destino está atrasado"""
+    if writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+        return False
+    writer.write(frame)
+    return True
+
+
+# ============================================================
+# BARRAMENTOS (lado do worker)
+# ============================================================
+class LocalBus:
+    """Um único processo: o evento é aplicado localmente e pronto"""
+
+    mode = "local"
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: Dict[str, Any]):
+        BUS_PUBLISHED.inc()
+        await self.handler(event)
+
+    def status(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "worker_pid": os.getpid()}
+
+
+class BrokerBus(LocalBus):
+    """
+    Vários workers: aplica localmente (a resposta HTTP e os clientes deste
+    worker não esperam o broker) e envia ao broker, que repassa aos demais.
+    """
+
+    mode = "broker"
+
+    def __init__(self, handler: Handler, host: str, port: int):
+        super().__init__(handler)
+        self.host = host
+        self.port = port
+        self.connected = False
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self._writer:
+            self._writer.close()
+
+    async def publish(self, event: Dict[str, Any]):
+        BUS_PUBLISHED.inc()
+        await self.handler(event)
+        if not (self.connected and _write(self._writer, encode_frame(event))):
+            BUS_DROPPED.inc()
+
+    async def _run(self):
+        delay = RECONNECT_DELAY_S[0]
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                self.connected = True
+                delay = RECONNECT_DELAY_S[0]
+                logger.info("🔗 Conectado ao broker de estado %s:%d (pid %d)", self.host, self.port, os.getpid())
+                while True:
+                    event = await read_frame(reader)
+                    BUS_RECEIVED.inc()
+                    try:
+                        await self.handler(event)
+                    except Exception as e:
+                        logger.error(f"Erro ao aplicar evento do broker: {e}")
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                if self.connected:
+                    logger.warning(f"🔗 Conexão com o broker perdida: {e}")
+            finally:
+                self.connected = False
+                if self._writer:
+                    self._writer.close()
+                    self._writer = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_S[1])
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **super().status(),
+            "broker": f"{self.host}:{self.port}",
+            "connected": self.connected,
+        }
+
+
+def parse_broker_url(url: str) -> tuple:
+    """'tcp://host:port' ou 'host:port' → (host, port)"""
+    url = url.split("://", 1)[-1]
+    host, _, port = url.rpartition(":")
+    return host or DEFAULT_BROKER_HOST, int(port or DEFAULT_BROKER_PORT)
+
+
+def bus_from_env(handler: Handler) -> LocalBus:
+    """BrokerBus se STATE_BROKER_URL estiver definido, senão LocalBus"""
+    url = os.environ.get(BROKER_URL_ENV)
+    if not url:
+        return LocalBus(handler)
+    return BrokerBus(handler, *parse_broker_url(url))
+
+
+# ============================================================
+# BROKER
+# ============================================================
+class StateBroker:
+    """Repassa eventos entre workers e guarda o snapshot para quem chega"""
+
+    def __init__(self):
+        self.workers: Set[asyncio.StreamWriter] = set()
+        self.status: Optional[Dict[str, Any]] = None
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=SNAPSHOT_SAMPLES)
+        self.last_data_time: Optional[str] = None
+        self.relayed = 0
+        self.dropped = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "kind": "snapshot",
+            "status": self.status,
+            "samples": list(self.samples),
+            "last_data_time": self.last_data_time,
+        }
+
+    def apply(self, event: Dict[str, Any]):
+        if event.get("kind") != "window":
+            return
+        self.status = event["status"]
+        self.samples.extend(event["samples"])
+        self.last_data_time = event["received_at"]
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        writer.write(encode_frame(self.snapshot()))
+        self.workers.add(writer)
+        logger.info("Worker conectado: %s (total %d)", peer, len(self.workers))
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                (size,) = _HEADER.unpack(header)
+                body = await reader.readexactly(size)
+                event = loads(body)
+                self.apply(event)
+                # Repassa os bytes recebidos, sem re-serializar
+                frame = header + body
+                for other in list(self.workers):
+                    if other is writer:
+                        continue
+                    if _write(other, frame):
+                        self.relayed += 1
+                    else:
+                        self.dropped += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Erro no worker {peer}: {e}")
+        finally:
+            self.workers.discard(writer)
+            writer.close()
+            logger.info("Worker desconectado: %s (total %d)", peer, len(self.workers))
+
+
+async def run_broker(host: str = DEFAULT_BROKER_HOST, port: int = DEFAULT_BROKER_PORT):
+    broker = StateBroker()
+    server = await asyncio.start_server(broker.handle_worker, host, port)
+    logger.info("📮 Broker de estado ouvindo em %s:%d", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def spawn_broker(host: str = DEFAULT_BROKER_HOST, port: int = DEFAULT_BROKER_PORT,
+                 timeout: float = 5.0) -> subprocess.Popen:
+    """
+    Inicia o broker num subprocesso, espera aceitar conexões e exporta
+    STATE_BROKER_URL para que os workers (processos filhos) o encontrem.
+    """
+    proc = subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), "--host", host, "--port", str(port)]
+    )
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=0.2).close()
+            break
+        except OSError:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                raise RuntimeError(f"Broker de estado não iniciou em {host}:{port}")
+            time.sleep(0.05)
+    os.environ[BROKER_URL_ENV] = f"tcp://{host}:{port}"
+    return proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broker de estado entre workers do servidor")
+    parser.add_argument("--host", default=DEFAULT_BROKER_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_BROKER_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(run_broker(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
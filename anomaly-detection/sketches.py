@@ -0,0 +1,568 @@
+#!/usr/bin/env python3
+"""
+Sketches de quantis das distâncias e features ao vivo.
+
+Os percentis de distância só existiam no treinamento e na calibração
+(np.percentile sobre todas as distâncias em memória, em training_robust.py
+e calibrate_sensor.py); em produção não havia como saber onde estava o p99
+de cada sensor agora nem se o threshold ainda fazia sentido. Cada janela
+pontuada passa a alimentar sketches de quantis no estilo DDSketch:
+
+  - baldes logarítmicos (chave = ⌈log_γ |v|⌉, γ = (1 + α)/(1 − α)): inserir
+    é um log e um incremento de dicionário, O(1) e sem ordenar nada;
+  - qualquer quantil sai com erro relativo ≤ α (padrão 1%) no valor;
+  - dois sketches com o mesmo α se fundem somando os contadores dos baldes:
+    o resultado é idêntico ao de um sketch que visse as duas sequências
+    (funde janelas de tempo, sensores e workers);
+  - o tamanho depende da faixa de valores, não do número de janelas
+    (distâncias de 1 a 100 cabem em ~230 baldes; MAX_BINS limita o pior caso).
+
+Por sensor ficam:
+
+  - distância: um sketch por minuto (última hora), um por hora (últimas 24 h)
+    e um total; uma consulta de janela funde os sketches dos intervalos
+    cobertos (1m, 5m, 15m, 1h, 6h, 24h ou all);
+  - features: um sketch total por feature ("axis_0.std", ...).
+
+Janelas dispensadas pela cascata não entram no sketch de distância: a
+distância delas é a marginal do envelope (limite inferior da completa, ~1/5
+dela numa janela normal) e puxaria p50/p99 e a proposta de threshold para
+baixo. Em troca, as janelas auditadas (amostra aleatória das de dentro do
+envelope, com distância completa) entram com peso 1/audit_rate: sem isso o
+sketch só teria as janelas fora do envelope e puxaria para cima. As features
+das janelas dispensadas (std, rms e pico a pico) são exatas e entram
+normalmente.
+
+O estado é gravado em JSON (SKETCHES_PATH, padrão logs/sketches.json; com
+SHARD_INDEX, um arquivo por shard) a cada SKETCHES_SAVE_S segundos e no
+desligamento, e recarregado na inicialização. Arquivos de vários workers
+se fundem pela linha de comando:
+
+  python sketches.py merge logs/sketches.shard*.json -o logs/sketches.json
+  python sketches.py summary logs/sketches.json
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_ALPHA = 0.01
+MAX_BINS = 2048
+MIN_MAGNITUDE = 1e-9  # |v| abaixo disso conta no balde do zero
+
+MINUTE_S = 60
+MINUTE_SLOTS = 60
+HOUR_S = 3600
+HOUR_SLOTS = 24
+WINDOWS = {
+    "1m": 60, "5m": 300, "15m": 900, "1h": 3600,
+    "6h": 6 * 3600, "24h": 24 * 3600, "all": None,
+}
+QUANTILES = (0.5, 0.95, 0.99)
+
+DEFAULT_SAVE_S = 60.0
+SKETCHES_PATH = Path(os.environ.get("SKETCHES_PATH", "logs/sketches.json"))
+
+
+# ============================================================
+# SKETCH
+# ============================================================
+class QuantileSketch:
+    """Sketch de quantis com erro relativo α (DDSketch), fundível e serializável"""
+
+    __slots__ = ("alpha", "gamma", "log_gamma", "positive", "negative", "zero",
+                 "count", "min", "max", "sum")
+
+    def __init__(self, alpha: float = DEFAULT_ALPHA):
+        if not 0.0 < alpha < 1.0:
+            raise ValueError("alpha deve estar entre 0 e 1")
+        self.alpha = alpha
+        self.gamma = (1.0 + alpha) / (1.0 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+
+    def add(self, value: float, count: int = 1):
+        if value > MIN_MAGNITUDE:
+            bins = self.positive
+            key = math.ceil(math.log(value) / self.log_gamma)
+        elif value < -MIN_MAGNITUDE:
+            bins = self.negative
+            key = math.ceil(math.log(-value) / self.log_gamma)
+        elif value == value:
+            bins = None
+            self.zero += count
+        else:
+            return  # NaN não entra
+        if bins is not None:
+            bins[key] = bins.get(key, 0) + count
+            if len(bins) > MAX_BINS:
+                self._collapse(bins)
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @staticmethod
+    def _collapse(bins: Dict[int, int]):
+        """Junta os baldes de menor magnitude no primeiro que sobra (raro: faixa enorme)"""
+        keys = sorted(bins)
+        excess = keys[:len(keys) - MAX_BINS]
+        target = keys[len(excess)]
+        for key in excess:
+            bins[target] += bins.pop(key)
+
+    def _value(self, key: int) -> float:
+        # Ponto do balde (γ^(k−1), γ^k] com erro relativo ≤ α
+        return 2.0 * self.gamma ** key / (self.gamma + 1.0)
+
+    def _ordered(self) -> Iterable[tuple]:
+        """(valor representativo, contagem) do menor para o maior"""
+        for key in sorted(self.negative, reverse=True):
+            yield -self._value(key), self.negative[key]
+        if self.zero:
+            yield 0.0, self.zero
+        for key in sorted(self.positive):
+            yield self._value(key), self.positive[key]
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self._ordered():
+            seen += count
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """Vários quantis numa só passada pelos baldes (qs em ordem crescente)"""
+        if self.count == 0:
+            return [None] * len(qs)
+        ranks = [q * (self.count - 1) for q in qs]
+        out: List[Optional[float]] = []
+        seen = 0
+        for value, count in self._ordered():
+            seen += count
+            while len(out) < len(ranks) and seen > ranks[len(out)]:
+                out.append(min(max(value, self.min), self.max))
+            if len(out) == len(ranks):
+                break
+        out.extend([self.max] * (len(ranks) - len(out)))
+        return out
+
+    def fraction_above(self, value: float) -> float:
+        """Fração aproximada dos valores acima de value"""
+        if self.count == 0:
+            return 0.0
+        above = sum(count for v, count in self._ordered() if v > value)
+        return above / self.count
+
+    def merge(self, other: "QuantileSketch"):
+        if other.alpha != self.alpha:
+            raise ValueError(f"Sketches com alphas diferentes: {self.alpha} e {other.alpha}")
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+            if len(mine) > MAX_BINS:
+                self._collapse(mine)
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> "QuantileSketch":
+        clone = QuantileSketch(self.alpha)
+        clone.merge(self)
+        return clone
+
+    def bins(self) -> int:
+        return len(self.positive) + len(self.negative) + (1 if self.zero else 0)
+
+    def summary(self, qs: Sequence[float] = QUANTILES) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"count": self.count}
+        if self.count:
+            out.update(min=self.min, max=self.max, mean=self.sum / self.count)
+        else:
+            out.update(min=None, max=None, mean=None)
+        for q, value in zip(qs, self.quantiles(qs)):
+            out[f"p{q * 100:g}"] = value
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "alpha": self.alpha,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "zero": self.zero,
+            "positive": [[k, c] for k, c in self.positive.items()],
+            "negative": [[k, c] for k, c in self.negative.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(float(data["alpha"]))
+        sketch.positive = {int(k): int(c) for k, c in data["positive"]}
+        sketch.negative = {int(k): int(c) for k, c in data["negative"]}
+        sketch.zero = int(data["zero"])
+        sketch.count = int(data["count"])
+        sketch.sum = float(data["sum"])
+        if sketch.count:
+            sketch.min = float(data["min"])
+            sketch.max = float(data["max"])
+        return sketch
+
+
+# ============================================================
+# JANELAS DE TEMPO
+# ============================================================
+class WindowedSketch:
+    """Sketches por minuto (última hora), por hora (últimas 24 h) e total"""
+
+    __slots__ = ("alpha", "minutes", "hours", "total", "_minute_key", "_minute", "_hour_key", "_hour")
+
+    def __init__(self, alpha: float = DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.minutes: Dict[int, QuantileSketch] = {}
+        self.hours: Dict[int, QuantileSketch] = {}
+        self.total = QuantileSketch(alpha)
+        self._minute_key = self._hour_key = None
+        self._minute = self._hour = None
+
+    def add(self, value: float, now: float, count: int = 1):
+        minute = int(now // MINUTE_S)
+        if minute != self._minute_key:
+            self._minute_key = minute
+            self._minute = self._slot(self.minutes, minute, MINUTE_SLOTS)
+        hour = int(now // HOUR_S)
+        if hour != self._hour_key:
+            self._hour_key = hour
+            self._hour = self._slot(self.hours, hour, HOUR_SLOTS)
+        self._minute.add(value, count)
+        self._hour.add(value, count)
+        self.total.add(value, count)
+
+    def _slot(self, slots: Dict[int, QuantileSketch], key: int, keep: int) -> QuantileSketch:
+        """Sketch do intervalo atual; descarta os que saíram do horizonte"""
+        for old in [k for k in slots if k <= key - keep]:
+            del slots[old]
+        sketch = slots.get(key)
+        if sketch is None:
+            sketch = slots[key] = QuantileSketch(self.alpha)
+        return sketch
+
+    def window(self, seconds: Optional[float], now: float) -> QuantileSketch:
+        """Fusão dos intervalos que cobrem os últimos `seconds` (None = total)"""
+        if seconds is None:
+            return self.total
+        if seconds <= MINUTE_S * MINUTE_SLOTS:
+            slots, size = self.minutes, MINUTE_S
+        else:
+            slots, size = self.hours, HOUR_S
+        first = int(now // size) - math.ceil(seconds / size) + 1
+        merged = QuantileSketch(self.alpha)
+        for key, sketch in slots.items():
+            if key >= first:
+                merged.merge(sketch)
+        return merged
+
+    def merge(self, other: "WindowedSketch"):
+        for mine, theirs in ((self.minutes, other.minutes), (self.hours, other.hours)):
+            for key, sketch in theirs.items():
+                if key in mine:
+                    mine[key].merge(sketch)
+                else:
+                    mine[key] = sketch.copy()
+        self.total.merge(other.total)
+
+    def bins(self) -> int:
+        return self.total.bins() + sum(s.bins() for s in self.minutes.values()) + sum(
+            s.bins() for s in self.hours.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "minutes": {str(k): s.to_dict() for k, s in self.minutes.items()},
+            "hours": {str(k): s.to_dict() for k, s in self.hours.items()},
+            "total": self.total.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], now: float) -> "WindowedSketch":
+        total = QuantileSketch.from_dict(data["total"])
+        windowed = cls(total.alpha)
+        windowed.total = total
+        # Intervalos que já saíram do horizonte não voltam
+        minute, hour = int(now // MINUTE_S), int(now // HOUR_S)
+        windowed.minutes = {int(k): QuantileSketch.from_dict(s) for k, s in data["minutes"].items()
+                            if int(k) > minute - MINUTE_SLOTS}
+        windowed.hours = {int(k): QuantileSketch.from_dict(s) for k, s in data["hours"].items()
+                          if int(k) > hour - HOUR_SLOTS}
+        return windowed
+
+
+def window_seconds(window: str) -> Optional[float]:
+    """'5m' → 300; levanta ValueError para janelas desconhecidas"""
+    if window not in WINDOWS:
+        raise ValueError(f"Janela desconhecida: {window} (válidas: {list(WINDOWS)})")
+    return WINDOWS[window]
+
+
+# ============================================================
+# SKETCHES POR SENSOR
+# ============================================================
+class SensorSketches:
+    __slots__ = ("distance", "features")
+
+    def __init__(self, alpha: float):
+        self.distance = WindowedSketch(alpha)
+        self.features: Dict[str, QuantileSketch] = {}
+
+
+class SketchStore:
+    """Sketches de distância e de features de cada sensor"""
+
+    def __init__(self, alpha: float = DEFAULT_ALPHA, clock: Callable[[], float] = time.time):
+        self.alpha = alpha
+        self.clock = clock
+        self.sensors: Dict[str, SensorSketches] = {}
+        self.saved_at: Optional[float] = None
+
+    def observe(self, sensor_id: str, distance: Optional[float],
+                feature_values: Dict[str, Dict[str, float]], weight: int = 1):
+        """
+        Uma janela pontuada: distância e features (como em result["feature_values"]).
+        distance=None (janela dispensada pela cascata) só atualiza as features;
+        weight > 1 conta a distância por várias janelas (auditoria da cascata).
+        """
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            state = self.sensors[sensor_id] = SensorSketches(self.alpha)
+        if distance is not None:
+            state.distance.add(distance, self.clock(), weight)
+        features = state.features
+        for axis, stats in feature_values.items():
+            for name, value in stats.items():
+                key = f"{axis}.{name}"
+                sketch = features.get(key)
+                if sketch is None:
+                    sketch = features[key] = QuantileSketch(self.alpha)
+                sketch.add(value)
+
+    def distances(self, sensor_id: Optional[str], window: str = "all") -> Optional[QuantileSketch]:
+        """Sketch das distâncias de um sensor (ou de todos, se None) na janela de tempo"""
+        seconds, now = window_seconds(window), self.clock()
+        if sensor_id is not None:
+            state = self.sensors.get(sensor_id)
+            return state.distance.window(seconds, now) if state is not None else None
+        merged = QuantileSketch(self.alpha)
+        for state in self.sensors.values():
+            merged.merge(state.distance.window(seconds, now))
+        return merged
+
+    def sensor_summary(self, sensor_id: str, window: str = "all",
+                       qs: Sequence[float] = QUANTILES) -> Optional[Dict[str, Any]]:
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            return None
+        return {
+            "sensor_id": sensor_id,
+            "window": window,
+            "distance": self.distances(sensor_id, window).summary(qs),
+            "features": {name: sketch.summary(qs) for name, sketch in sorted(state.features.items())},
+        }
+
+    def quantiles_report(self, window: str = "1h") -> Dict[str, Any]:
+        """Quantis da frota e de cada sensor (resposta de /sensor/quantiles)"""
+        return {
+            "window": window,
+            "fleet": self.distances(None, window).summary(),
+            "sensors": {
+                sensor_id: self.distances(sensor_id, window).summary()
+                for sensor_id in self.sensors
+            },
+            "sketches": self.stats(),
+        }
+
+    def bins(self) -> int:
+        return sum(state.distance.bins() + sum(s.bins() for s in state.features.values())
+                   for state in self.sensors.values())
+
+    # --------------------------------------------------------
+    # Proposta de threshold
+    # --------------------------------------------------------
+    def propose_threshold(self, sensor_id: Optional[str], current: float, window: str = "24h",
+                          quantile: float = 0.999, margin: float = 3.0,
+                          min_count: int = 1000) -> Dict[str, Any]:
+        """
+        Threshold sugerido = quantil das distâncias × margem (a mesma regra de
+        calibrate_sensor.py: p99,9 × 3). Só uma sugestão: nada é alterado.
+        """
+        if not 0.0 < quantile < 1.0:
+            raise ValueError("quantile deve estar entre 0 e 1")
+        if margin <= 0:
+            raise ValueError("margin deve ser positiva")
+        sketch = self.distances(sensor_id, window)
+        proposal: Dict[str, Any] = {
+            "sensor_id": sensor_id,
+            "window": window,
+            "quantile": quantile,
+            "margin": margin,
+            "current_threshold": current,
+            "count": sketch.count if sketch is not None else 0,
+        }
+        if sketch is None or sketch.count < min_count:
+            proposal.update(proposed_threshold=None,
+                            reason=f"Janelas insuficientes (mínimo {min_count})")
+            return proposal
+        value = sketch.quantile(quantile)
+        proposed = value * margin
+        above = sketch.fraction_above(current)
+        proposal.update(
+            quantile_value=value,
+            proposed_threshold=proposed,
+            change_ratio=proposed / current if current else None,
+            # Fração das janelas da janela de tempo acima do threshold atual;
+            # bem acima de 1 − quantile sugere falha real, não threshold baixo
+            above_current_ratio=above,
+            contaminated=above > 1.0 - quantile,
+        )
+        return proposal
+
+    # --------------------------------------------------------
+    # Serialização e fusão
+    # --------------------------------------------------------
+    def to_dict(self, sensor_id: Optional[str] = None) -> Dict[str, Any]:
+        sensors = self.sensors if sensor_id is None else {
+            k: v for k, v in self.sensors.items() if k == sensor_id}
+        return {
+            "alpha": self.alpha,
+            "saved_at": self.clock(),
+            "sensors": {
+                sid: {
+                    "distance": state.distance.to_dict(),
+                    "features": {name: s.to_dict() for name, s in state.features.items()},
+                }
+                for sid, state in sensors.items()
+            },
+        }
+
+    def merge_dict(self, data: Dict[str, Any]):
+        """Funde um estado serializado (de um arquivo antigo ou de outro worker)"""
+        if float(data["alpha"]) != self.alpha:
+            raise ValueError(f"Sketches com alpha {data['alpha']}, esperado {self.alpha}")
+        now = self.clock()
+        for sid, payload in data["sensors"].items():
+            state = self.sensors.get(sid)
+            if state is None:
+                state = self.sensors[sid] = SensorSketches(self.alpha)
+            state.distance.merge(WindowedSketch.from_dict(payload["distance"], now))
+            for name, raw in payload["features"].items():
+                sketch = QuantileSketch.from_dict(raw)
+                if name in state.features:
+                    state.features[name].merge(sketch)
+                else:
+                    state.features[name] = sketch
+
+    def save(self, path: Path):
+        write_snapshot(self.to_dict(), path)
+        self.saved_at = self.clock()
+
+    def load(self, path: Path) -> bool:
+        """Recupera os sketches gravados (reinício do servidor); False se não há arquivo"""
+        if not path.exists():
+            return False
+        with open(path, encoding="utf-8") as f:
+            self.merge_dict(json.load(f))
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "alpha": self.alpha,
+            "sensors": len(self.sensors),
+            "bins": self.bins(),
+            "saved_at": self.saved_at,
+        }
+
+
+def write_snapshot(data: Dict[str, Any], path: Path):
+    """Grava um estado de to_dict() (troca atômica: leitor nunca vê arquivo pela metade)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    tmp.replace(path)
+
+
+# ============================================================
+# CONFIGURAÇÃO
+# ============================================================
+def sketches_path_from_env() -> Path:
+    """Um arquivo por shard: processos diferentes não sobrescrevem o estado um do outro"""
+    shard = os.environ.get("SHARD_INDEX")
+    if shard is None:
+        return SKETCHES_PATH
+    return SKETCHES_PATH.with_name(f"{SKETCHES_PATH.stem}.shard{shard}{SKETCHES_PATH.suffix}")
+
+
+def save_interval_from_env() -> float:
+    try:
+        return max(0.0, float(os.environ.get("SKETCHES_SAVE_S", DEFAULT_SAVE_S)))
+    except ValueError:
+        return DEFAULT_SAVE_S
+
+
+# ============================================================
+# LINHA DE COMANDO
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Funde e resume arquivos de sketches de quantis")
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help="Funde arquivos de vários workers num só")
+    merge.add_argument("files", type=Path, nargs="+")
+    merge.add_argument("-o", "--output", type=Path, required=True)
+    summary = commands.add_parser("summary", help="Quantis das distâncias de cada sensor")
+    summary.add_argument("file", type=Path)
+    summary.add_argument("--window", default="all", choices=list(WINDOWS))
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        with open(args.files[0], encoding="utf-8") as f:
+            first = json.load(f)
+        store = SketchStore(float(first["alpha"]))
+        store.merge_dict(first)
+        for path in args.files[1:]:
+            store.load(path)
+        store.save(args.output)
+        print(f"💾 {len(args.files)} arquivos, {len(store.sensors)} sensores → {args.output}")
+        return
+
+    with open(args.file, encoding="utf-8") as f:
+        data = json.load(f)
+    store = SketchStore(float(data["alpha"]))
+    store.merge_dict(data)
+    for sensor_id in sorted(store.sensors):
+        s = store.distances(sensor_id, args.window).summary()
+        if s["count"]:
+            print(f"📏 {sensor_id}: {s['count']} janelas  p50 {s['p50']:.3f}  "
+                  f"p95 {s['p95']:.3f}  p99 {s['p99']:.3f}")
+        else:
+            print(f"📏 {sensor_id}: sem janelas em {args.window}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,14 @@ Modo: PRODUÇÃO (recebe dados via Wi-Fi do ESP32)
 
 Uso:
     python start_production.py
+    python start_production.py --workers 4
 
 O servidor escuta na porta 8000 e recebe dados do ESP32 via HTTP POST.
 Não depende de porta serial nem do PlatformIO.
 """
 
 import uvicorn
+import argparse
 import json
 from pathlib import Path
 
@@ -20,6 +22,11 @@ with open(CONFIG_PATH) as f:
     CONFIG = json.load(f)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processos uvicorn (>1 inicia o broker de estado compartilhado)")
+    args = parser.parse_args()
+    
     host = CONFIG["server"]["host"]
     port = CONFIG["server"]["port"]
     
@@ -42,10 +49,21 @@ if __name__ == "__main__":
     print("\n⏳ Aguardando conexão do ESP32...")
     print("=" * 50 + "\n")
     
-    uvicorn.run(
-        "api:app",
-        host="0.0.0.0",
-        port=port,
-        log_level="info",
-        reload=False
-    )
+    broker = None
+    if args.workers > 1:
+        from shared_state import spawn_broker
+        broker = spawn_broker()
+        print(f"⚙️  {args.workers} workers, estado compartilhado via broker local\n")
+    
+    try:
+        uvicorn.run(
+            "api:app",
+            host="0.0.0.0",
+            port=port,
+            log_level="info",
+            reload=False,
+            workers=args.workers,
+        )
+    finally:
+        if broker:
+            broker.terminate()
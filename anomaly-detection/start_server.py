@@ -14,6 +14,8 @@ Fluxo de dados:
 
 Uso:
   python start_server.py
+  python start_server.py --workers 4   # vários processos (estado via broker)
+  python start_server.py --shards 4    # idem, com afinidade de sensor por shard
 
 Para rodar em background (Linux):
   nohup python start_server.py > server.log 2>&1 &
@@ -27,6 +29,7 @@ Para Windows (PowerShell):
 import sys
 import os
 import json
+import argparse
 import signal
 import logging
 from pathlib import Path
@@ -61,7 +64,7 @@ def signal_handler(signum, frame):
     sys.exit(0)
 
 
-def print_banner(host, port):
+def print_banner(host, port, workers=1):
     """Imprime banner de inicialização"""
     print("\n" + "=" * 60)
     print("  🚀 SERVIDOR DE DETECÇÃO DE ANOMALIAS IoT")
@@ -69,6 +72,8 @@ def print_banner(host, port):
     print(f"\n  📡 Aguardando dados do ESP32 via Wi-Fi...")
     print(f"\n  🌐 Servidor: http://{host}:{port}")
     print(f"  📊 Dashboard: http://{host}:{port}/")
+    if workers > 1:
+        print(f"  ⚙️  Workers: {workers} (estado compartilhado via broker local)")
     print("\n  📌 Endpoints:")
     print(f"     POST /predict         → ESP32 envia dados aqui")
     print(f"     GET  /realtime/state  → Estado atual")
@@ -76,12 +81,22 @@ def print_banner(host, port):
     print(f"     WS   /ws              → WebSocket (frontend)")
     print(f"     GET  /health          → Health check")
     print(f"     GET  /status          → Status detalhado")
+    print(f"     GET  /metrics         → Métricas (Prometheus)")
     print("\n" + "=" * 60)
     print("  Pressione Ctrl+C para parar")
     print("=" * 60 + "\n")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Servidor de detecção de anomalias IoT")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processos uvicorn (>1 inicia o broker de estado compartilhado)")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="Modo shard: dispatcher encaminha cada sensor sempre ao mesmo processo")
+    parser.add_argument("--broker-port", type=int, default=8799,
+                        help="Porta local do broker de estado (modo multi-worker)")
+    args = parser.parse_args()
+    
     # Registra handlers de sinal
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -91,19 +106,36 @@ def main():
     host = config["server"]["host"]
     port = config["server"]["port"]
     
-    print_banner(host, port)
+    print_banner(host, port, max(args.workers, args.shards))
+    
+    if args.shards > 0:
+        from dispatcher import serve
+        serve(args.shards, port, broker_port=args.broker_port)
+        return
+    
+    # Vários workers: o estado em tempo real passa pelo broker
+    broker = None
+    if args.workers > 1:
+        from shared_state import spawn_broker
+        broker = spawn_broker(port=args.broker_port)
+        logger.info("Broker de estado iniciado (pid %d)", broker.pid)
     
     # Importa e inicia uvicorn
     import uvicorn
     
-    uvicorn.run(
-        "api:app",
-        host="0.0.0.0",  # Aceita conexões de qualquer IP
-        port=port,
-        log_level="info",
-        reload=False,
-        access_log=True
-    )
+    try:
+        uvicorn.run(
+            "api:app",
+            host="0.0.0.0",  # Aceita conexões de qualquer IP
+            port=port,
+            log_level="info",
+            reload=False,
+            access_log=True,
+            workers=args.workers,
+        )
+    finally:
+        if broker:
+            broker.terminate()
 
 
 if __name__ == "__main__":
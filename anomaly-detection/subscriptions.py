@@ -0,0 +1,190 @@
+"""
+Assinaturas dos clientes do /ws.
+
+Cada cliente escolhe o que quer receber:
+
+  {"type": "subscribe", "sensors": ["linha1_m3", ...], "topics": ["status", "alerts"], "max_hz": 2}
+
+  - sensors: lista de sensor_id (null = todos);
+  - topics: status, samples, features, alerts, connection;
+  - max_hz: teto de atualizações de status/features por sensor para este
+    cliente (null = o ritmo do broadcaster). Como esse cliente pula deltas,
+    ele recebe o status completo (todos os campos) em vez do delta, e o
+    último status pulado é reenviado quando o intervalo termina.
+
+Campos omitidos mantêm o valor atual; {"type": "unsubscribe", ...} remove
+sensores ou tópicos. Sem mensagem de assinatura, o cliente recebe status,
+alertas e eventos de conexão de todos os sensores (comportamento antigo).
+
+O registro guarda um conjunto de clientes por tópico: uma mensagem só é
+serializada se algum cliente do tópico quer aquele sensor.
+"""
+
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+TOPICS = ("status", "samples", "features", "alerts", "connection")
+DEFAULT_TOPICS = ("status", "alerts", "connection")
+# Tópicos limitados por max_hz (os demais são fluxos que não podem perder mensagens)
+RATE_LIMITED_TOPICS = ("status", "features")
+
+
+class SubscriptionError(ValueError):
+    """Mensagem de assinatura inválida"""
+
+
+class Subscription:
+    __slots__ = ("sensors", "topics", "max_hz", "last_sent", "stale")
+
+    def __init__(self):
+        self.sensors: Optional[Set[str]] = None
+        self.topics: Set[str] = set(DEFAULT_TOPICS)
+        self.max_hz: Optional[float] = None
+        # (tópico, sensor) → instante do último envio (só com max_hz)
+        self.last_sent: Dict[Tuple[str, str], float] = {}
+        # Sensores com status pulado pelo max_hz: recebem o estado completo depois
+        self.stale: Set[str] = set()
+
+    def wants(self, sensor_id: Optional[str]) -> bool:
+        return sensor_id is None or self.sensors is None or sensor_id in self.sensors
+
+    def due(self, topic: str, sensor_id: str, now: float) -> bool:
+        if self.max_hz is None or topic not in RATE_LIMITED_TOPICS:
+            return True
+        return now - self.last_sent.get((topic, sensor_id), float("-inf")) >= 1.0 / self.max_hz
+
+    def mark_sent(self, topic: str, sensor_id: str, now: float):
+        if self.max_hz is not None and topic in RATE_LIMITED_TOPICS:
+            self.last_sent[(topic, sensor_id)] = now
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "sensors": sorted(self.sensors) if self.sensors is not None else None,
+            "topics": sorted(self.topics),
+            "max_hz": self.max_hz,
+        }
+
+
+def _topics(values: Any) -> Set[str]:
+    if not isinstance(values, list):
+        raise SubscriptionError("topics deve ser uma lista")
+    unknown = set(values) - set(TOPICS)
+    if unknown:
+        raise SubscriptionError(f"Tópicos desconhecidos: {sorted(unknown)} (válidos: {list(TOPICS)})")
+    return set(values)
+
+
+def _sensors(values: Any) -> Set[str]:
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise SubscriptionError("sensors deve ser uma lista de sensor_id")
+    return set(values)
+
+
+class SubscriptionRegistry:
+    """Assinaturas por cliente e índice de clientes por tópico"""
+
+    def __init__(self):
+        self.clients: Dict[Hashable, Subscription] = {}
+        self.by_topic: Dict[str, Set[Hashable]] = {topic: set() for topic in TOPICS}
+
+    def add(self, client: Hashable) -> Subscription:
+        subscription = self.clients[client] = Subscription()
+        self._index(client, subscription)
+        return subscription
+
+    def remove(self, client: Hashable):
+        self.clients.pop(client, None)
+        for members in self.by_topic.values():
+            members.discard(client)
+
+    def _index(self, client: Hashable, subscription: Subscription):
+        for topic, members in self.by_topic.items():
+            if topic in subscription.topics:
+                members.add(client)
+            else:
+                members.discard(client)
+
+    def subscribe(self, client: Hashable, message: Dict[str, Any]) -> Subscription:
+        """Aplica {"type": "subscribe", ...}; levanta SubscriptionError"""
+        subscription = self.clients.get(client) or self.add(client)
+        topics = _topics(message["topics"]) if "topics" in message else subscription.topics
+        sensors = subscription.sensors
+        if "sensors" in message:
+            sensors = None if message["sensors"] is None else _sensors(message["sensors"])
+        max_hz = subscription.max_hz
+        if "max_hz" in message:
+            max_hz = message["max_hz"]
+            if max_hz is not None and (not isinstance(max_hz, (int, float)) or max_hz <= 0):
+                raise SubscriptionError("max_hz deve ser um número positivo ou null")
+
+        subscription.topics = topics
+        subscription.sensors = sensors
+        if max_hz != subscription.max_hz:
+            subscription.max_hz = float(max_hz) if max_hz is not None else None
+            subscription.last_sent.clear()
+            subscription.stale.clear()
+        self._index(client, subscription)
+        return subscription
+
+    def unsubscribe(self, client: Hashable, message: Dict[str, Any]) -> Subscription:
+        """Aplica {"type": "unsubscribe", "topics": [...], "sensors": [...]}"""
+        subscription = self.clients.get(client) or self.add(client)
+        if "topics" in message:
+            subscription.topics -= _topics(message["topics"])
+        if "sensors" in message:
+            removed = _sensors(message["sensors"])
+            if subscription.sensors is None:
+                raise SubscriptionError("Assinatura de todos os sensores: use subscribe com a lista desejada")
+            subscription.sensors -= removed
+            subscription.stale -= removed
+        self._index(client, subscription)
+        return subscription
+
+    def set_topic(self, client: Hashable, topic: str, enabled: bool):
+        subscription = self.clients.get(client) or self.add(client)
+        if enabled:
+            subscription.topics.add(topic)
+        else:
+            subscription.topics.discard(topic)
+        self._index(client, subscription)
+
+    def recipients(self, topic: str, sensor_id: Optional[str],
+                   now: float) -> Tuple[List[Hashable], List[Hashable]]:
+        """
+        Clientes que devem receber a mensagem agora: (mensagem normal,
+        status completo). Com max_hz, um status pulado marca o sensor como
+        pendente para o reenvio do estado completo.
+        """
+        members = self.by_topic[topic]
+        if not members:
+            return [], []
+        selected, full = [], []
+        for client in members:
+            subscription = self.clients[client]
+            if not subscription.wants(sensor_id):
+                continue
+            if sensor_id is not None and not subscription.due(topic, sensor_id, now):
+                if topic == "status":
+                    subscription.stale.add(sensor_id)
+                continue
+            if sensor_id is not None:
+                subscription.mark_sent(topic, sensor_id, now)
+                if topic == "status":
+                    subscription.stale.discard(sensor_id)
+                    if subscription.max_hz is not None:
+                        full.append(client)
+                        continue
+            selected.append(client)
+        return selected, full
+
+    def stale_due(self, now: float) -> Iterable[Tuple[Hashable, str]]:
+        """(cliente, sensor) com status pendente cujo intervalo de max_hz terminou"""
+        for client in list(self.by_topic["status"]):
+            subscription = self.clients[client]
+            for sensor_id in list(subscription.stale):
+                if subscription.due("status", sensor_id, now):
+                    subscription.stale.discard(sensor_id)
+                    subscription.mark_sent("status", sensor_id, now)
+                    yield client, sensor_id
+
+    def topic_counts(self) -> Dict[str, int]:
+        return {topic: len(members) for topic, members in self.by_topic.items()}
@@ -0,0 +1,207 @@
+"""
+Linha do tempo das amostras por sensor.
+
+O ESP32 pode informar, junto com a janela:
+  - sample_rate: taxa de amostragem em Hz;
+  - t0_ms: instante da primeira amostra no relógio do dispositivo (millis());
+  - seq: índice da primeira amostra no contador de amostras do dispositivo.
+
+Com isso os timestamps são construídos de forma vetorizada no tempo do
+dispositivo e convertidos para o relógio do servidor por um offset estimado
+com filtro de mínimo (o menor atraso recente é o mais próximo do atraso de
+rede real; atrasos maiores são jitter). Cada janela é classificada em
+relação à anterior:
+
+  ok            continua exatamente de onde a anterior parou
+  gap           faltam amostras (seq) ou há um intervalo sem amostras (t0_ms)
+  duplicate     mesma janela recebida de novo
+  out_of_order  janela anterior à última já recebida
+  reset         o dispositivo reiniciou (contador/relógio voltou muito)
+  first         primeira janela do sensor
+  estimated     sem informação do dispositivo: timestamps ancorados na chegada
+
+Sem informação do dispositivo, os timestamps terminam no instante de chegada
+e são espaçados pelo período real (1/sample_rate, padrão 200 Hz) em vez de
+1 ms.
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from sequence import SPAN_SAMPLES, SequenceTracker
+
+DEFAULT_SAMPLE_RATE_HZ = 200.0
+
+# Janelas usadas no filtro de mínimo do offset e na estimativa de deriva
+OFFSET_WINDOW = 32
+DRIFT_HISTORY = 256
+# Relógio que volta mais que esse número de janelas é reinício do
+# dispositivo, não uma janela atrasada (para seq vale o alcance do bitmap)
+RESET_WINDOWS = 10
+
+
+class SensorTimeline:
+    """Estado da linha do tempo de um sensor"""
+
+    def __init__(self, sensor_id: str):
+        self.sensor_id = sensor_id
+        self.sample_rate = DEFAULT_SAMPLE_RATE_HZ
+        self.source = "arrival"
+        # Bitmap de seq já recebidos (deduplicação de reenvios)
+        self.sequence = SequenceTracker()
+
+        # Fim (exclusivo) da última janela aceita, em seq e em ms do dispositivo
+        self.next_seq: Optional[int] = None
+        self.next_device_ms: Optional[float] = None
+        self.last_start: Optional[Tuple[Optional[int], Optional[float]]] = None
+
+        # Offset servidor - dispositivo (ms)
+        self._offsets: Deque[float] = deque(maxlen=OFFSET_WINDOW)
+        self._drift: Deque[Tuple[float, float]] = deque(maxlen=DRIFT_HISTORY)
+
+        self.counts: Dict[str, int] = {
+            "windows": 0, "ok": 0, "gap": 0, "duplicate": 0,
+            "out_of_order": 0, "reset": 0, "first": 0, "estimated": 0,
+        }
+        self.missing_samples = 0
+        self.gap_ms_total = 0.0
+
+    # ------------------------------------------------------------
+    # Classificação
+    # ------------------------------------------------------------
+    def _clock_rewound(self, n: int, t0_ms: Optional[float]) -> bool:
+        """Relógio do dispositivo voltou mais de RESET_WINDOWS janelas: reinício"""
+        if t0_ms is None or self.next_device_ms is None or self.source != "device":
+            return False
+        period_ms = 1000.0 / self.sample_rate
+        return t0_ms - self.next_device_ms < -RESET_WINDOWS * n * period_ms
+
+    def is_duplicate(self, n: int, seq: int, t0_ms: Optional[float] = None) -> bool:
+        """
+        Consulta/marca o bitmap de seq. Um dispositivo que reinicia volta a
+        contar do zero; se o relógio também voltou, não é reenvio.
+        """
+        if self._clock_rewound(n, t0_ms):
+            self.sequence.restart()
+        status, _ = self.sequence.observe(seq, n)
+        return status == "duplicate"
+
+    def _classify(self, n: int, seq: Optional[int], t0_ms: Optional[float],
+                  device_ms: Optional[float], period_ms: float) -> Dict[str, Any]:
+        if self.last_start is None:
+            return {"status": "first"}
+        if (seq, device_ms) == self.last_start:
+            return {"status": "duplicate"}
+        if self._clock_rewound(n, t0_ms):
+            return {"status": "reset"}
+
+        if seq is not None and self.next_seq is not None:
+            delta = seq - self.next_seq
+            if delta < -SPAN_SAMPLES:
+                return {"status": "reset"}
+            if delta < 0:
+                return {"status": "out_of_order"}
+            info = {"status": "gap" if delta > 0 else "ok", "missing_samples": delta}
+            if device_ms is not None and self.next_device_ms is not None:
+                # Contador contínuo mas relógio com intervalo: coleta intermitente
+                gap_ms = device_ms - self.next_device_ms
+                if gap_ms > period_ms / 2:
+                    info["gap_ms"] = gap_ms
+            return info
+
+        if device_ms is not None and self.next_device_ms is not None:
+            delta_ms = device_ms - self.next_device_ms
+            if delta_ms < -RESET_WINDOWS * n * period_ms:
+                return {"status": "reset"}
+            if delta_ms < -period_ms / 2:
+                return {"status": "out_of_order"}
+            if delta_ms > period_ms / 2:
+                return {"status": "gap", "gap_ms": delta_ms}
+            return {"status": "ok"}
+
+        return {"status": "ok"}
+
+    # ------------------------------------------------------------
+    # Construção dos timestamps
+    # ------------------------------------------------------------
+    def place(self, n: int, received_ms: float, sample_rate: Optional[float] = None,
+              t0_ms: Optional[float] = None, seq: Optional[int] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Retorna (timestamps em ms no relógio do servidor, info da janela).
+        Não altera o estado para janelas duplicadas ou fora de ordem.
+        """
+        if sample_rate:
+            self.sample_rate = float(sample_rate)
+        period_ms = 1000.0 / self.sample_rate
+        offsets = np.arange(n) * period_ms
+        self.counts["windows"] += 1
+
+        # Tempo do dispositivo: relógio próprio ou derivado do contador de amostras
+        device_ms = float(t0_ms) if t0_ms is not None else (seq * period_ms if seq is not None else None)
+
+        if device_ms is None:
+            # Sem informação do dispositivo: última amostra = chegada
+            self.source = "arrival"
+            self.counts["estimated"] += 1
+            return received_ms - offsets[::-1], {"status": "estimated"}
+
+        info = self._classify(n, seq, t0_ms, device_ms, period_ms)
+        self.source = "device" if t0_ms is not None else "sequence"
+        status = info["status"]
+        self.counts[status] += 1
+
+        if status == "reset":
+            self._offsets.clear()
+            self._drift.clear()
+        if status in ("duplicate", "out_of_order"):
+            # Posiciona com o offset atual, sem mexer no estado
+            offset = min(self._offsets) if self._offsets else received_ms - device_ms
+            return device_ms + offset + offsets, info
+
+        # Offset desta janela: chegada - instante da última amostra no dispositivo
+        device_end_ms = device_ms + (n - 1) * period_ms
+        window_offset = received_ms - device_end_ms
+        self._offsets.append(window_offset)
+        self._drift.append((device_end_ms, window_offset))
+        offset = min(self._offsets)
+
+        self.missing_samples += info.get("missing_samples", 0)
+        self.gap_ms_total += info.get("gap_ms", 0.0)
+        self.last_start = (seq, device_ms)
+        self.next_seq = seq + n if seq is not None else None
+        self.next_device_ms = device_ms + n * period_ms
+        return device_ms + offset + offsets, info
+
+    # ------------------------------------------------------------
+    # Estatísticas
+    # ------------------------------------------------------------
+    def drift_ppm(self) -> Optional[float]:
+        """Inclinação do offset em função do tempo do dispositivo (ppm)"""
+        if len(self._drift) < 8:
+            return None
+        points = np.asarray(self._drift)
+        span = points[-1, 0] - points[0, 0]
+        if span <= 0:
+            return None
+        slope = np.polyfit(points[:, 0] - points[0, 0], points[:, 1], 1)[0]
+        return float(slope * 1e6)
+
+    def clock_offset_ms(self) -> Optional[float]:
+        return min(self._offsets) if self._offsets else None
+
+    def stats(self) -> Dict[str, Any]:
+        offsets = list(self._offsets)
+        return {
+            "source": self.source,
+            "sample_rate": self.sample_rate,
+            **self.counts,
+            "missing_samples": self.missing_samples,
+            "gap_ms_total": self.gap_ms_total,
+            "clock_offset_ms": self.clock_offset_ms(),
+            # Dispersão do atraso acima do mínimo (jitter de rede)
+            "jitter_ms": float(np.std(offsets)) if len(offsets) > 1 else None,
+            "drift_ppm": self.drift_ppm(),
+            "sequence": self.sequence.stats(),
+        }
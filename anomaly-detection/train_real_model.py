@@ -16,6 +16,9 @@ from datetime import datetime
 import time
 import requests
 
+from calibration import empirical_table
+from drift import reference_histogram
+
 SERVER_URL = "http://172.20.10.2:8000"
 MODEL_PATH = Path("models/mahalanobis_model.npz")
 
@@ -156,6 +159,9 @@ def train_model(normal_features, anomaly_features):
         threshold = np.percentile(normal_distances, 95) * 1.5
         print(f"\n🎯 Threshold (sem dados anomalia): {threshold:.3f}")
     
+    # Histograma de referência das features (monitor de deriva no servidor)
+    drift_edges, drift_expected = reference_histogram(X_normal)
+
     # Salva modelo
     np.savez(
         MODEL_PATH,
@@ -165,7 +171,11 @@ def train_model(normal_features, anomaly_features):
         model_type='trained_real_data',
         training_date=datetime.now().isoformat(),
         normal_samples=len(normal_features),
-        anomaly_samples=len(anomaly_features) if anomaly_features else 0
+        anomaly_samples=len(anomaly_features) if anomaly_features else 0,
+        # Quantis das distâncias normais: confiança calibrada no servidor
+        cdf_distances=empirical_table(normal_distances),
+        drift_edges=drift_edges,
+        drift_expected=drift_expected,
     )
     
     print(f"\n💾 Modelo salvo em: {MODEL_PATH}")
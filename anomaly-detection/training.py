@@ -17,6 +17,9 @@ from sklearn.metrics import (
     roc_curve,
 )
 
+from calibration import empirical_table
+from recording import load_windows
+
 # Configuration
 DATASET_PATH = Path("datasets/ac")
 NORMAL_OPS = ["silent_0_baseline"]
@@ -38,17 +41,14 @@ MAX_NORMAL_SAMPLES = 100
 MODEL_PATH = Path("models/mahalanobis_model.npz")
 
 
-def get_data_files(operations):
-    files = []
-    for op in operations:
-        files.extend(list((DATASET_PATH / op).glob("*.csv")))
-    return files
+def get_windows(operations, max_windows=None):
+    # Gravações .vrec e CSVs legados das pastas de cada operação
+    return load_windows([DATASET_PATH / op for op in operations], max_windows)
 
 
-def load_and_extract_features(file_path):
-    # Load and preprocess
-    data = np.genfromtxt(file_path, delimiter=",")
-    data = data - np.mean(data, axis=0)  # Remove DC
+def load_and_extract_features(window):
+    # Preprocess
+    data = window - np.mean(window, axis=0)  # Remove DC
 
     # Add noise for robustness
     noise = np.random.normal(0, 0.3, data.shape)
@@ -70,12 +70,13 @@ def load_and_extract_features(file_path):
     return np.array(features)
 
 
-def create_dataset(files, max_samples=50):
-    # Randomly sample files if we have more than max_samples
-    if len(files) > max_samples:
-        files = np.random.choice(files, max_samples, replace=False)
+def create_dataset(windows, max_samples=50):
+    # Randomly sample windows if we have more than max_samples
+    if len(windows) > max_samples:
+        chosen = np.random.choice(len(windows), max_samples, replace=False)
+        windows = [windows[i] for i in chosen]
 
-    features = [load_and_extract_features(f) for f in files]
+    features = [load_and_extract_features(w) for w in windows]
     return np.array(features)
 
 
@@ -228,21 +229,21 @@ def plot_confusion_matrix(y_true, y_pred):
 
 def train_model():
     # Load and prepare data
-    normal_files = get_data_files(NORMAL_OPS)
-    anomaly_files = get_data_files(ANOMALY_OPS)
+    normal_windows = get_windows(NORMAL_OPS)
+    anomaly_windows = get_windows(ANOMALY_OPS, MAX_ANOMALY_SAMPLES)
     print(
-        f"Found {len(normal_files)} normal files and {len(anomaly_files)} anomaly files"
+        f"Found {len(normal_windows)} normal windows and {len(anomaly_windows)} anomaly windows"
     )
 
     # Split normal data
-    train_files, test_files = train_test_split(
-        normal_files, test_size=0.4, random_state=42
+    train_windows, test_windows = train_test_split(
+        normal_windows, test_size=0.4, random_state=42
     )
 
     # Create datasets
-    X_train = create_dataset(train_files)
-    X_test = create_dataset(test_files)
-    X_anomaly = create_dataset(anomaly_files)
+    X_train = create_dataset(train_windows)
+    X_test = create_dataset(test_windows)
+    X_anomaly = create_dataset(anomaly_windows)
 
     # Scale features
     scaler = StandardScaler()
@@ -277,7 +278,10 @@ def train_model():
     plot_confusion_matrix(y_true, y_pred)
 
     # Save model
-    np.savez(MODEL_PATH, mu=mu, cov=cov, threshold=threshold, scaler=scaler)
+    np.savez(
+        MODEL_PATH, mu=mu, cov=cov, threshold=threshold, scaler=scaler,
+        cdf_distances=empirical_table(normal_dist),
+    )
     print(f"\nModel saved to {MODEL_PATH}")
 
 
@@ -6,13 +6,11 @@ Ajusta o modelo ML para ser menos reativo a ruído e vibrações normais.
 from pathlib import Path
 import numpy as np
 from scipy import stats as scipy_stats
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import RobustScaler
-from sklearn.model_selection import train_test_split
-from sklearn.covariance import EmpiricalCovariance
 import warnings
 warnings.filterwarnings('ignore')
 
+from recording import load_windows
+
 # Configuração
 DATASET_PATH = Path("datasets/ac")
 NORMAL_OPS = ["silent_0_baseline"]
@@ -21,15 +19,14 @@ ANOMALY_OPS = [
 ]
 MODEL_PATH = Path("models/mahalanobis_model.npz")
 
-def load_and_extract_features(file_path, add_noise=False):
+def load_and_extract_features(window, add_noise=False):
     """Extrai features mais robustas com menos sensibilidade a ruído"""
     try:
-        data = np.genfromtxt(file_path, delimiter=",")
-        if data.size == 0:
+        if window.size == 0:
             return None
             
         # Remove DC offset
-        data = data - np.mean(data, axis=0)
+        data = window - np.mean(window, axis=0)
         
         # Adiciona ruído apenas se solicitado (para dados de treino)
         if add_noise:
@@ -63,26 +60,22 @@ def load_and_extract_features(file_path, add_noise=False):
         
         return np.array(features)
     except Exception as e:
-        print(f"Erro ao processar {file_path}: {e}")
+        print(f"Erro ao processar janela: {e}")
         return None
 
-def get_data_files(operations):
-    """Coleta arquivos de dados"""
-    files = []
-    for op in operations:
-        op_path = DATASET_PATH / op
-        if op_path.exists():
-            files.extend(list(op_path.glob("*.csv")))
-    return files
+def get_windows(operations):
+    """Coleta janelas de dados (gravações .vrec e CSVs legados)"""
+    return load_windows([DATASET_PATH / op for op in operations])
 
-def create_robust_dataset(files, max_samples=200, add_noise=False):
+def create_robust_dataset(windows, max_samples=200, add_noise=False):
     """Cria dataset com features mais robustas"""
-    if len(files) > max_samples:
-        files = np.random.choice(files, max_samples, replace=False)
+    if len(windows) > max_samples:
+        chosen = np.random.choice(len(windows), max_samples, replace=False)
+        windows = [windows[i] for i in chosen]
     
     features_list = []
-    for file in files:
-        features = load_and_extract_features(file, add_noise=add_noise)
+    for window in windows:
+        features = load_and_extract_features(window, add_noise=add_noise)
         if features is not None and not np.any(np.isnan(features)):
             features_list.append(features)
     
@@ -169,30 +162,34 @@ def find_conservative_threshold(normal_distances, anomaly_distances):
 
 def train_robust_model():
     """Treina modelo robusto menos sensível"""
+    # Importações pesadas só quando o treinamento roda de fato
+    from sklearn.covariance import EmpiricalCovariance
+    from sklearn.model_selection import train_test_split
+
     print("🔧 Treinando modelo robusto menos sensível...")
     
-    # Carrega arquivos
-    normal_files = get_data_files(NORMAL_OPS)
-    anomaly_files = get_data_files(ANOMALY_OPS)
+    # Carrega janelas
+    normal_windows = get_windows(NORMAL_OPS)
+    anomaly_windows = get_windows(ANOMALY_OPS)
     
-    print(f"📁 Normal: {len(normal_files)} arquivos")
-    print(f"📁 Anomaly: {len(anomaly_files)} arquivos")
+    print(f"📁 Normal: {len(normal_windows)} janelas")
+    print(f"📁 Anomaly: {len(anomaly_windows)} janelas")
     
-    if len(normal_files) == 0:
-        raise ValueError("Nenhum arquivo normal encontrado!")
+    if len(normal_windows) == 0:
+        raise ValueError("Nenhuma janela normal encontrada!")
     
     # Divide dados normais
-    train_files, test_files = train_test_split(
-        normal_files, test_size=0.3, random_state=42
+    train_windows, test_windows = train_test_split(
+        normal_windows, test_size=0.3, random_state=42
     )
     
     # Cria datasets com mais amostras para robustez
     print("📊 Extraindo features...")
-    X_train = create_robust_dataset(train_files, max_samples=300, add_noise=True)
-    X_test = create_robust_dataset(test_files, max_samples=100, add_noise=False)
+    X_train = create_robust_dataset(train_windows, max_samples=300, add_noise=True)
+    X_test = create_robust_dataset(test_windows, max_samples=100, add_noise=False)
     
-    if len(anomaly_files) > 0:
-        X_anomaly = create_robust_dataset(anomaly_files, max_samples=100, add_noise=False)
+    if len(anomaly_windows) > 0:
+        X_anomaly = create_robust_dataset(anomaly_windows, max_samples=100, add_noise=False)
     else:
         # Cria anomalias sintéticas se não houver dados
         print("⚠️ Criando anomalias sintéticas...")
@@ -254,6 +251,7 @@ def train_robust_model():
     
     # Plota distribuições
     try:
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(12, 6))
         plt.hist(normal_distances, bins=50, alpha=0.7, label='Normal', color='green', density=True)
         plt.hist(anomaly_distances, bins=50, alpha=0.7, label='Anomaly', color='red', density=True)
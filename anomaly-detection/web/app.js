@@ -167,7 +167,18 @@
       red: { text: 'ANOMALIA', icon: icons.alert, footer: 'Anomalia detectada!' }
     };
     
-    const { text, icon, footer } = labels[color] || labels.green;
+    let { text, icon, footer } = labels[color] || labels.green;
+    // Janela não pontuada (sensor travado, saturado...): não mostrar "Normal"
+    if (state?.quality && state.quality !== 'ok') {
+      text = 'Sinal inválido';
+      icon = icons.warning;
+      footer = `Qualidade do sinal: ${state.quality}`;
+    }
+    // Alerta aberto neste sensor (canal de alertas): severidade e desde quando
+    const openAlert = state?.sensor_id && activeAlerts[state.sensor_id];
+    if (openAlert) {
+      footer += ` · Alerta ${openAlert.severity} desde ${new Date(openAlert.opened_at).toLocaleTimeString('pt-BR')}`;
+    }
     statusText.textContent = text;
     situationEl.textContent = text;
     mainIcon.innerHTML = icon;
@@ -205,23 +216,16 @@
   function saveEventToHistory(color, state) {
     if (color === 'green') return;
     
-    const events = JSON.parse(localStorage.getItem('vibration_events') || '[]');
     const counts = JSON.parse(localStorage.getItem('vibration_counts') || '{"normal":0,"alerts":0,"anomalies":0}');
     
-    const event = {
+    appendHistoryEvent({
       type: color === 'red' ? 'anomaly' : 'alert',
+      sensor_id: state?.sensor_id,
       timestamp: Date.now(),
       confidence: state?.confidence || 0,
       distance: state?.distance || 0,
       threshold: state?.threshold || 0
-    };
-    
-    events.push(event);
-    
-    // Mantém últimos 500 eventos
-    if (events.length > 500) {
-      events.splice(0, events.length - 500);
-    }
+    });
     
     // Atualiza contadores
     if (color === 'red') {
@@ -230,10 +234,49 @@
       counts.alerts++;
     }
     
-    localStorage.setItem('vibration_events', JSON.stringify(events));
     localStorage.setItem('vibration_counts', JSON.stringify(counts));
   }
 
+  function appendHistoryEvent(event) {
+    const events = JSON.parse(localStorage.getItem('vibration_events') || '[]');
+    events.push(event);
+    
+    // Mantém últimos 500 eventos
+    if (events.length > 500) {
+      events.splice(0, events.length - 500);
+    }
+    localStorage.setItem('vibration_events', JSON.stringify(events));
+  }
+
+  // Transição do canal de alertas (opened, escalated, cleared): rodapé do status e histórico
+  function applyAlertEvent(alert) {
+    if (!alert.sensor_id) return;
+    if (alert.event === 'cleared') {
+      delete activeAlerts[alert.sensor_id];
+    } else {
+      activeAlerts[alert.sensor_id] = {
+        severity: alert.severity,
+        opened_at: activeAlerts[alert.sensor_id]?.opened_at || alert.timestamp
+      };
+    }
+    
+    appendHistoryEvent({
+      type: 'alert_event',
+      event: alert.event,
+      sensor_id: alert.sensor_id,
+      severity: alert.severity,
+      timestamp: Date.parse(alert.timestamp) || Date.now(),
+      distance: alert.distance || 0,
+      peak_distance: alert.peak_distance || 0,
+      duration_s: alert.duration_s
+    });
+    
+    const state = statusBySensor[alert.sensor_id];
+    if (alert.sensor_id === selectedSensor && state) {
+      applyStatus(state.status_color || 'green', state);
+    }
+  }
+
   // Atualiza gráfico
   function updateChart(samples) {
     if (!samples || samples.length === 0) return;
@@ -251,6 +294,21 @@
 
   // WebSocket
   let ws = null;
+  // Estado de cada sensor montado a partir dos deltas "status" (os deltas são por sensor)
+  const statusBySensor = {};
+  // Alertas abertos por sensor (eventos do canal de alertas)
+  const activeAlerts = {};
+  // Sensor exibido: ?sensor=<id> na URL ou o primeiro que enviar status
+  let selectedSensor = new URLSearchParams(window.location.search).get('sensor');
+
+  // Funde o delta no estado do sensor; retorna o estado só se for o sensor exibido
+  function mergeSensorStatus(sensorId, fields) {
+    if (!sensorId) return null;
+    const state = statusBySensor[sensorId] || (statusBySensor[sensorId] = {});
+    Object.assign(state, fields, { sensor_id: sensorId });
+    if (!selectedSensor) selectedSensor = sensorId;
+    return sensorId === selectedSensor ? state : null;
+  }
   let reconnectTimer = null;
 
   function connectWebSocket() {
@@ -276,11 +334,25 @@
           const data = JSON.parse(event.data);
           
           switch (data.type) {
-            case 'prediction':
+            case 'status': {
+              // Delta coalescido: só os campos que mudaram, deste sensor
+              const state = mergeSensorStatus(data.sensor_id, data);
+              if (state) {
+                applyStatus(state.status_color || 'green', state);
+                sensorConnected = true;
+                lastSensorDataTime = Date.now();
+                updateSensorStatus('connected', 'Recebendo dados');
+              }
+              break;
+            }
+              
             case 'state':
             case 'connected':
-              if (data.status) {
-                applyStatus(data.status.status_color || 'green', data.status);
+              // Base dos deltas: último estado de cada sensor
+              Object.entries(data.sensors || {}).forEach(([id, fields]) => mergeSensorStatus(id, fields));
+              if (selectedSensor && statusBySensor[selectedSensor]) {
+                const state = statusBySensor[selectedSensor];
+                applyStatus(state.status_color || 'green', state);
               }
               sensorConnected = true;
               lastSensorDataTime = Date.now();
@@ -297,13 +369,18 @@
               lastSensorDataTime = Date.now();
               updateSensorStatus('connected', 'Sensor reconectado');
               break;
+              
+            case 'alert':
+              applyAlertEvent(data);
+              break;
           }
           
-          if (data.samples) {
+          // Amostras de outro sensor não entram no gráfico
+          if (data.samples && (!data.sensor_id || data.sensor_id === selectedSensor)) {
             updateChart(data.samples);
           }
           
-          if (data.type === 'prediction') {
+          if (data.type === 'status' && data.sensor_id === selectedSensor) {
             fetchSamples();
           }
         } catch (e) {
@@ -349,7 +426,8 @@
 
   async function fetchState() {
     try {
-      const res = await fetch('/realtime/state');
+      const query = selectedSensor ? `?sensor_id=${encodeURIComponent(selectedSensor)}` : '';
+      const res = await fetch(`/realtime/state${query}`);
       if (res.ok) {
         const state = await res.json();
         applyStatus(state.status_color || 'green', state);
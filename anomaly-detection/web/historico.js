@@ -18,7 +18,9 @@
   let events = JSON.parse(localStorage.getItem('vibration_events') || '[]');
   let counts = JSON.parse(localStorage.getItem('vibration_counts') || '{"normal":0,"alerts":0,"anomalies":0}');
   let sessionStart = parseInt(localStorage.getItem('session_start') || Date.now());
-  let lastStatus = 'green';
+  // Estado e última cor de cada sensor, montados a partir dos deltas "status" (por sensor)
+  const statusBySensor = {};
+  const lastStatusBySensor = {};
 
   // Salva início da sessão se não existir
   if (!localStorage.getItem('session_start')) {
@@ -67,6 +69,7 @@
       const date = new Date(event.timestamp).toLocaleDateString('pt-BR');
       
       let icon, className, label;
+      let details = `Confiança: ${(event.confidence * 100).toFixed(1)}% | Distância: ${event.distance?.toFixed(2) || '—'}`;
       if (event.type === 'anomaly') {
         icon = `<svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
           <circle cx="12" cy="12" r="10"/><line x1="12" y1="8" x2="12" y2="12"/>
@@ -81,6 +84,17 @@
         </svg>`;
         className = 'event-alert';
         label = 'ALERTA';
+      } else if (event.type === 'alert_event') {
+        // Transição do canal de alertas (aberto, escalado, encerrado)
+        icon = `<svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+          <path d="M18 8A6 6 0 0 0 6 8c0 7-3 9-3 9h18s-3-2-3-9"/><path d="M13.73 21a2 2 0 0 1-3.46 0"/>
+        </svg>`;
+        className = event.severity === 'critical' ? 'event-anomaly' : 'event-alert';
+        const kinds = { opened: 'ABERTO', escalated: 'ESCALADO', cleared: 'ENCERRADO' };
+        label = `ALERTA ${kinds[event.event] || escapeHtml(event.event)}`;
+        details = event.event === 'cleared'
+          ? `Duração: ${Math.round(event.duration_s || 0)} s | Pico: ${event.peak_distance?.toFixed(2) || '—'}`
+          : `Severidade: ${escapeHtml(event.severity)} | Distância: ${event.distance?.toFixed(2) || '—'}`;
       } else {
         return '';
       }
@@ -89,8 +103,8 @@
         <div class="history-item ${className}">
           <div class="event-icon">${icon}</div>
           <div class="event-info">
-            <span class="event-label">${label}</span>
-            <span class="event-details">Confiança: ${(event.confidence * 100).toFixed(1)}% | Distância: ${event.distance?.toFixed(2) || '—'}</span>
+            <span class="event-label">${label}${event.sensor_id ? ` · ${escapeHtml(event.sensor_id)}` : ''}</span>
+            <span class="event-details">${details}</span>
           </div>
           <div class="event-time">
             <span class="event-date">${date}</span>
@@ -111,9 +125,16 @@
   }
 
   // Adiciona evento
+  function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, c => ({
+      '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[c]);
+  }
+
   function addEvent(type, data) {
     const event = {
       type,
+      sensor_id: data.sensor_id,
       timestamp: Date.now(),
       confidence: data.confidence || 0,
       distance: data.distance || 0,
@@ -173,22 +194,32 @@
         try {
           const data = JSON.parse(event.data);
           
-          if (data.type === 'prediction' && data.status) {
-            const color = data.status.status_color || 'green';
+          if (data.type === 'connected') {
+            // Base dos deltas: último estado de cada sensor (sem registrar eventos)
+            Object.entries(data.sensors || {}).forEach(([id, fields]) => {
+              statusBySensor[id] = { ...fields, sensor_id: id };
+              lastStatusBySensor[id] = fields.status_color || 'green';
+            });
+          } else if (data.type === 'status' && data.sensor_id) {
+            // Delta coalescido: só os campos que mudaram desde o último envio deste sensor
+            const state = statusBySensor[data.sensor_id] || (statusBySensor[data.sensor_id] = {});
+            Object.assign(state, data);
+            const color = state.status_color || 'green';
+            const lastStatus = lastStatusBySensor[data.sensor_id] || 'green';
             
-            // Registra evento quando muda de estado
+            // Registra evento quando o sensor muda de estado
             if (color !== lastStatus) {
               if (color === 'red') {
-                addEvent('anomaly', data.status);
+                addEvent('anomaly', state);
               } else if (color === 'yellow') {
-                addEvent('alert', data.status);
+                addEvent('alert', state);
               } else if (lastStatus !== 'green') {
                 // Voltou ao normal
                 counts.normal++;
                 localStorage.setItem('vibration_counts', JSON.stringify(counts));
                 updateDisplay();
               }
-              lastStatus = color;
+              lastStatusBySensor[data.sensor_id] = color;
             }
           }
         } catch (e) {